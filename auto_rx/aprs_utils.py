@@ -1,10 +1,14 @@
 # APRS push utils for Sonde auto RX.
 
+import logging
+import select
+import threading
+import time
 from socket import *
 
 
-# Push a Radiosonde data packet to APRS as an object.
-def push_balloon_to_aprs(sonde_data, object_name="<id>", aprs_comment="BOM Balloon", aprsUser="N0CALL", aprsPass="00000", serverHost = 'rotate.aprs2.net', serverPort = 14580):
+# Produce an APRS object string from Radiosonde data.
+def telemetry_to_aprs_object(sonde_data, object_name="<id>", aprs_comment="BOM Balloon"):
 	if object_name == "<id>":
 		object_name = sonde_data["id"].strip()
 	
@@ -49,6 +53,20 @@ def push_balloon_to_aprs(sonde_data, object_name="<id>", aprs_comment="BOM Ballo
 		course_speed = "000/000"
 
 	out_str = ";%s*111111z%s/%sO%s/A=%06d %s" % (object_name,lat_str,lon_str,course_speed,alt,aprs_comment)
+
+	return out_str
+
+
+# Push a Radiosonde data packet to APRS as an object.
+# If an APRSISClient is supplied, the packet is sent via its persistent connection, otherwise a new
+# connection is made to serverHost for this packet only.
+def push_balloon_to_aprs(sonde_data, object_name="<id>", aprs_comment="BOM Balloon", aprsUser="N0CALL", aprsPass="00000", serverHost = 'rotate.aprs2.net', serverPort = 14580, aprs_client=None):
+	out_str = telemetry_to_aprs_object(sonde_data, object_name=object_name, aprs_comment=aprs_comment)
+
+	if aprs_client != None:
+		if not aprs_client.send('%s>APRS:%s' % (aprsUser, out_str)):
+			raise IOError("Not connected to APRS-IS.")
+		return out_str
 	
 	# Connect to an APRS-IS server, login, then push our object position in.
 	
@@ -64,4 +82,148 @@ def push_balloon_to_aprs(sonde_data, object_name="<id>", aprs_comment="BOM Ballo
 	sSock.shutdown(0)
 	sSock.close()
 
-	return out_str
\ No newline at end of file
+	return out_str
+
+
+class APRSISClient(object):
+	"""
+	A persistent APRS-IS connection.
+
+	The client logs in once, and re-uses the connection for every packet. A background thread
+	reads (and discards) data from the server, sends keepalives when we have been idle, and
+	re-connects with an exponential backoff if the connection is lost. The backoff is only reset
+	once a connection has stayed up for a keepalive interval, so a server which accepts the login
+	and then drops us is not hammered with reconnects.
+	"""
+
+	def __init__(self, aprsUser="N0CALL", aprsPass="00000", serverHost='rotate.aprs2.net', serverPort=14580,
+		keepalive_interval=120, min_backoff=5, max_backoff=300, timeout=10):
+		self.aprsUser = aprsUser
+		self.aprsPass = aprsPass
+		self.serverHost = serverHost
+		self.serverPort = serverPort
+		self.keepalive_interval = keepalive_interval
+		self.min_backoff = min_backoff
+		self.max_backoff = max_backoff
+		self.timeout = timeout
+
+		self.sock = None
+		self.verified = False
+		self.last_tx = 0
+		self.backoff = min_backoff
+		# Time of the last successful login, None if we haven't connected since the connection was lost.
+		self.connect_time = None
+		self.lock = threading.Lock()
+
+		self.running = True
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def _readline(self, sock):
+		""" Read a single line from the server during login. """
+		line = ''
+		while not line.endswith('\n'):
+			c = sock.recv(1)
+			if c == '':
+				raise IOError("Connection closed by server.")
+			line += c
+		return line.strip()
+
+	def connect(self):
+		""" Connect to the APRS-IS server, read its banner, and log in. """
+		sock = socket(AF_INET, SOCK_STREAM)
+		sock.settimeout(self.timeout)
+		try:
+			sock.connect((self.serverHost, self.serverPort))
+
+			banner = self._readline(sock)
+			logging.debug("APRS-IS - Server banner: %s" % banner)
+
+			sock.sendall('user %s pass %s vers VK5QI-Python 0.01\r\n' % (self.aprsUser, self.aprsPass))
+
+			# Wait for the login response, skipping any other server comments.
+			while True:
+				line = self._readline(sock)
+				if line.startswith('# logresp'):
+					break
+
+			self.verified = (' verified' in line)
+			logging.info("APRS-IS - Logged in to %s:%d (%s)" % (self.serverHost, self.serverPort, line[2:]))
+		except:
+			sock.close()
+			raise
+
+		with self.lock:
+			self.sock = sock
+			self.last_tx = time.time()
+
+	def disconnect(self):
+		with self.lock:
+			if self.sock != None:
+				try:
+					self.sock.close()
+				except:
+					pass
+				self.sock = None
+
+	def connected(self):
+		return self.sock != None
+
+	def send(self, line):
+		""" Send a line to the server. Returns False if we are not currently connected. """
+		with self.lock:
+			if self.sock == None:
+				return False
+			try:
+				self.sock.sendall(line + '\r\n')
+				self.last_tx = time.time()
+				return True
+			except error as e:
+				logging.error("APRS-IS - Send failed: %s" % str(e))
+
+		self.disconnect()
+		return False
+
+	def run(self):
+		""" Connection maintenance thread. """
+		while self.running:
+			if self.sock == None:
+				if self.connect_time != None:
+					# The connection was lost. Only start again from the minimum backoff if it had been up for a while.
+					if time.time() - self.connect_time >= self.keepalive_interval:
+						self.backoff = self.min_backoff
+					self.connect_time = None
+					logging.info("APRS-IS - Reconnecting in %d seconds." % self.backoff)
+					time.sleep(self.backoff)
+					self.backoff = min(self.backoff*2, self.max_backoff)
+					if not self.running:
+						break
+
+				try:
+					self.connect()
+					self.connect_time = time.time()
+				except Exception as e:
+					logging.error("APRS-IS - Could not connect to %s:%d (%s), retrying in %d seconds." % (self.serverHost, self.serverPort, str(e), self.backoff))
+					time.sleep(self.backoff)
+					self.backoff = min(self.backoff*2, self.max_backoff)
+				continue
+
+			# Wait for data from the server, or until we need to send a keepalive.
+			sock = self.sock
+			try:
+				(readable, _, _) = select.select([sock], [], [], max(0, self.last_tx + self.keepalive_interval - time.time()))
+				if readable:
+					# We don't use anything the server sends, but need to notice if the connection has been closed.
+					if sock.recv(4096) == '':
+						logging.error("APRS-IS - Connection closed by server.")
+						self.disconnect()
+				elif time.time() >= self.last_tx + self.keepalive_interval:
+					self.send('#keepalive')
+			except Exception as e:
+				logging.error("APRS-IS - Connection error: %s" % str(e))
+				self.disconnect()
+
+	def close(self):
+		self.running = False
+		self.disconnect()
@@ -17,42 +17,79 @@ import time
 import os
 import platform
 import signal
-import Queue
 import subprocess
 import traceback
 from aprs_utils import *
 from habitat_utils import *
 from ozi_utils import *
 from rotator_utils import *
-from threading import Thread
-from StringIO import StringIO
-from findpeaks import *
+from sink_utils import *
+from telemetry_store import TelemetryStore
+from freq_history import FrequencyHistory
+from scan_scheduler import *
+from flight_stats import FlightStats
+from telemetry_frame import *
+from metrics_utils import *
+from replay_utils import *
+from peak_utils import *
+from rtl_power_utils import *
+from iq_utils import *
+from scan_utils import *
+from detect_utils import *
+from multi_rx import *
 from config_reader import *
 from gps_grabber import *
-from async_file_reader import AsynchronousFileReader
+from pipe_utils import PipeLineReader
 
 # Logging level
 logging_level = logging.INFO
 
-# Internet Push Globals
-APRS_OUTPUT_ENABLED = False
-HABITAT_OUTPUT_ENABLED = False
+# Telemetry output dispatcher. Each frame of telemetry is passed to every enabled output
+# (APRS-IS, Habitat, rotator, OziPlotter, payload summary), each of which runs in its own thread at its own rate.
+telemetry_dispatcher = None
 
-INTERNET_PUSH_RUNNING = True
-internet_push_queue = Queue.Queue()
+# Persistent store of every telemetry frame received, if enabled.
+telemetry_store = None
 
-# Second Queue for OziPlotter outputs, since we want this to run at a faster rate.
-OZI_PUSH_RUNNING = True
-ozi_push_queue = Queue.Queue()
+# Record of the frequencies sondes have been found on, used to prioritise scanning.
+frequency_history = None
 
+# Launch schedule aware scan scheduler, if enabled.
+scan_scheduler = None
 
-# Flight Statistics data
-# stores copies of the telemetry dictionary returned by process_rs_line.
-flight_stats = {
-    'first': None,
-    'apogee': None,
-    'last': None
-}
+# Cache of GPS ephemeris and almanac data, used for RS92 decoding. This is refreshed in the background,
+# so we can start decoding a RS92 straight away.
+gps_cache = None
+
+
+# Flight Statistics data, for each sonde received, keyed by sonde ID.
+# Each entry is a FlightStats object, which is updated with every frame received.
+flight_stats = {}
+
+# In-process spectrum scanner, used when scan_method is not rtl_power.
+# This is kept open between scans, so we don't need to re-open the IQ source every time.
+spectrum_scanner = None
+
+# Per-stage frame handling timer, used when replaying recorded data.
+stage_timer = None
+
+# Metrics HTTP endpoint and periodic log summary, if enabled.
+metrics_server = None
+metrics_logger = None
+
+# Scan, detection and decoding metrics. The telemetry output metrics are in sink_utils.
+SCANS = METRICS.counter('auto_rx_scans_total', 'Frequency scans, by result (peaks, no_peaks or failed).', ['result'])
+SCAN_DURATION = METRICS.histogram('auto_rx_scan_duration_seconds', 'Time taken to scan the search range.', buckets=(1, 2, 5, 10, 20, 30, 60, 120))
+SCAN_PEAKS = METRICS.counter('auto_rx_scan_peaks_total', 'Peaks found in frequency scans.')
+DETECTIONS = METRICS.counter('auto_rx_detections_total', 'Frequencies tested for a sonde, by result (sonde type, or none).', ['result'])
+DETECT_CONFIDENCE = METRICS.histogram('auto_rx_detect_confidence', 'Timing confidence (0-1) of sonde detections.', buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9))
+DETECT_DURATION = METRICS.histogram('auto_rx_detect_duration_seconds', 'Time taken to test a set of frequencies for a sonde.', buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300))
+SONDES = METRICS.counter('auto_rx_sondes_total', 'Sondes received.', ['type'])
+FRAMES = METRICS.counter('auto_rx_frames_total', 'Telemetry frames decoded.', ['type'])
+FRAMES_MISSED = METRICS.counter('auto_rx_frames_missed_total', 'Gaps in the sonde frame counters, from frames lost to CRC failures or fades.', ['type'])
+PARSE_ERRORS = METRICS.counter('auto_rx_parse_errors_total', 'Decoder output lines which could not be parsed.')
+FRAME_DURATION = METRICS.histogram('auto_rx_frame_duration_seconds', 'Time taken to process a telemetry frame and queue it for output.', buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0))
+DECODER_TIMEOUTS = METRICS.counter('auto_rx_decoder_timeouts_total', 'Decoders stopped after producing no telemetry for rx_timeout seconds.', ['type'])
 
 
 def run_rtl_power(start, stop, step, filename="log_power.csv", dwell = 20, ppm = 0, gain = -1, bias = False):
@@ -86,62 +123,48 @@ def run_rtl_power(start, stop, step, filename="log_power.csv", dwell = 20, ppm =
     else:
         return True
 
-def read_rtl_power(filename):
-    """ Read in frequency samples from a single-shot log file produced by rtl_power """
-
-    # Output buffers.
-    freq = np.array([])
-    power = np.array([])
-
-    freq_step = 0
-
-
-    # Open file.
-    f = open(filename,'r')
-
-    # rtl_power log files are csv's, with the first 6 fields in each line describing the time and frequency scan parameters
-    # for the remaining fields, which contain the power samples. 
+def get_spectrum_scanner(config):
+    """ Get the in-process spectrum scanner, creating it (and its IQ source) if required. """
+    global spectrum_scanner
 
-    for line in f:
-        # Split line into fields.
-        fields = line.split(',')
-
-        if len(fields) < 6:
-            logging.error("Invalid number of samples in input file - corrupt?")
-            raise Exception("Invalid number of samples in input file - corrupt?")
-
-        start_date = fields[0]
-        start_time = fields[1]
-        start_freq = float(fields[2])
-        stop_freq = float(fields[3])
-        freq_step = float(fields[4])
-        n_samples = int(fields[5])
-
-        #freq_range = np.arange(start_freq,stop_freq,freq_step)
-        samples = np.loadtxt(StringIO(",".join(fields[6:])),delimiter=',')
-        freq_range = np.linspace(start_freq,stop_freq,len(samples))
-
-        # Add frequency range and samples to output buffers.
-        freq = np.append(freq, freq_range)
-        power = np.append(power, samples)
+    if spectrum_scanner == None:
+        if config['scan_method'] == 'rtl_tcp':
+            source = RTLTCPSource(port=config['rtl_tcp_port'], 
+                sample_rate=config['scan_sample_rate'], 
+                ppm=config['rtlsdr_ppm'], 
+                gain=config['rtlsdr_gain'], 
+                bias=config['rtlsdr_bias'])
+        elif config['scan_method'] == 'iq_file':
+            source = IQFileSource(config['scan_iq_file'], sample_rate=config['scan_sample_rate'])
+        else:
+            raise ValueError("Unknown scan method: %s" % config['scan_method'])
 
-    f.close()
+        spectrum_scanner = SpectrumScanner(source, config['min_freq']*1e6, config['max_freq']*1e6, 
+            step=config['search_step'], 
+            dwell=config['scan_dwell'])
 
-    # Sanitize power values, to remove the nan's that rtl_power puts in there occasionally.
-    power = np.nan_to_num(power)
+    return spectrum_scanner
 
-    return (freq, power, freq_step)
+def release_spectrum_scanner():
+    """ Close the in-process spectrum scanner, releasing the RTLSDR for use by other utilities. """
+    global spectrum_scanner
 
+    if spectrum_scanner != None:
+        spectrum_scanner.close()
+        spectrum_scanner = None
 
 def quantize_freq(freq_list, quantize=5000):
     """ Quantise a list of frequencies to steps of <quantize> Hz """
     return np.round(freq_list/quantize)*quantize
 
 def detect_sonde(frequency, ppm=0, gain=-1, bias=False, dwell_time=10):
-    """ Receive some FM and attempt to detect the presence of a radiosonde. """
+    """
+    Receive some FM and attempt to detect the presence of a radiosonde.
+    Returns as soon as rs_detect locks on to a sonde, with a (sonde type, confidence) tuple, or (None, 0.0).
+    """
 
     # Example command (for command-line testing):
-    # rtl_fm -T -p 0 -M fm -s 15k -f 401500000 | sox -t raw -r 15k -e s -b 16 -c 1 - -r 48000 -t wav - highpass 20 | ./rs_detect -z -t 8
+    # rtl_fm -T -p 0 -M fm -s 15k -f 401500000 | ./rs_detect -z -t 8 --s16 15000
 
     # Add a -T option if bias is enabled
     bias_option = "-T " if bias else ""
@@ -152,34 +175,24 @@ def detect_sonde(frequency, ppm=0, gain=-1, bias=False, dwell_time=10):
     else:
         gain_param = ''
 
-    rx_test_command = "timeout %ds rtl_fm %s-p %d %s-M fm -s 15k -f %d 2>/dev/null |" % (dwell_time, bias_option, int(ppm), gain_param, frequency) 
-    rx_test_command += "sox -t raw -r 15k -e s -b 16 -c 1 - -r 48000 -t wav - highpass 20 2>/dev/null |"
-    rx_test_command += "./rs_detect -z -t 8 2>/dev/null"
+    rx_test_command = "rtl_fm %s-p %d %s-M fm -s 15k -f %d 2>/dev/null |" % (bias_option, int(ppm), gain_param, frequency) 
+    # rs_detect reads the raw rtl_fm output, and does its own highpass filtering.
+    rx_test_command += "./rs_detect -z -t 8 --s16 15000 2>/dev/null"
 
     logging.info("Attempting sonde detection on %.3f MHz" % (frequency/1e6))
-    logging.debug("Running command: %s" % rx_test_command)
-
-    ret_code = os.system(rx_test_command)
-
-    ret_code = ret_code >> 8
-
-    if ret_code == 3:
-        logging.info("Detected a RS41!")
-        return "RS41"
-    elif ret_code == 4:
-        logging.info("Detected a RS92!")
-        return "RS92"
-    elif ret_code == 2:
-        logging.info("Detected a DFM Sonde! (Unsupported)")
-        return "DFM"
-    elif ret_code == 5:
-        logging.info("Detected a M10 Sonde! (Unsupported)")
-        return "M10"
-    elif ret_code == 6:
-        logging.info("Detected a iMet Sonde! (Unsupported)")
-        return "iMet"
+
+    start = time.time()
+    (sonde_type, confidence) = rs_detect_stream(rx_test_command, timeout=dwell_time)
+
+    if sonde_type == None:
+        return (None, 0.0)
+
+    DETECT_CONFIDENCE.observe(confidence)
+    if sonde_type in ['RS41', 'RS92']:
+        logging.info("Detected a %s after %.1f seconds! (Confidence %.2f)" % (sonde_type, time.time() - start, confidence))
     else:
-        return None
+        logging.info("Detected a %s Sonde after %.1f seconds! (Unsupported) (Confidence %.2f)" % (sonde_type, time.time() - start, confidence))
+    return (sonde_type, confidence)
 
 def reset_rtlsdr():
     """ Attempt to perform a USB Reset on all attached RTLSDRs. This uses the usb_reset binary from ../scan"""
@@ -206,6 +219,72 @@ def reset_rtlsdr():
         logging.error("Errors occured while attempting to reset USB device.")
 
 
+def test_frequencies(config, frequencies):
+    """ Test a list of frequencies (Hz) for a radiosonde, in order. Returns a (frequency, sonde type) tuple, or (None, None). """
+    sonde_freq = None
+    sonde_type = None
+    start = time.time()
+
+    if config['parallel_detect']:
+        # Test all frequencies at once, from a single wideband capture.
+        # If we are using the in-process scanner, capture from its IQ source, otherwise use rtl_sdr.
+        if config['scan_method'] == 'rtl_power':
+            source = RTLSDRSource(sample_rate=config['scan_sample_rate'], ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'])
+        else:
+            source = get_spectrum_scanner(config).source
+
+        try:
+            results = detect_sondes_parallel(source, list(frequencies), dwell_time=config['dwell_time'])
+        except Exception as e:
+            traceback.print_exc()
+            logging.error("Parallel sonde detection failed.")
+            results = []
+        finally:
+            if config['scan_method'] == 'rtl_power':
+                source.close()
+
+        # Results are in the order provided, so pick the most confident detection, then the first.
+        for (freq, detected, confidence) in results:
+            DETECTIONS.labels(str(detected).lower()).inc()
+            if detected != None:
+                DETECT_CONFIDENCE.observe(confidence)
+        best_confidence = -1.0
+        for (freq, detected, confidence) in results:
+            if detected != None and confidence > best_confidence:
+                (sonde_freq, sonde_type, best_confidence) = (freq, detected, confidence)
+
+        # rtl_fm needs exclusive access to the RTLSDR for decoding.
+        if config['scan_method'] == 'rtl_tcp' and sonde_type != None:
+            release_spectrum_scanner()
+
+    else:
+        # rtl_fm needs exclusive access to the RTLSDR, so stop streaming from it while we test the peaks.
+        if config['scan_method'] == 'rtl_tcp':
+            release_spectrum_scanner()
+
+        # Run rs_detect on each frequency, to determine if there is a sonde there.
+        # Stop at the first detection that is confident enough, otherwise use the most confident detection.
+        best_confidence = -1.0
+        for freq in frequencies:
+            (detected, confidence) = detect_sonde(freq, 
+                ppm=config['rtlsdr_ppm'], 
+                gain=config['rtlsdr_gain'], 
+                bias=config['rtlsdr_bias'], 
+                dwell_time=config['dwell_time'])
+            DETECTIONS.labels(str(detected).lower()).inc()
+            if detected != None and confidence > best_confidence:
+                (sonde_freq, sonde_type, best_confidence) = (freq, detected, confidence)
+                if confidence >= config['detect_confidence']:
+                    break
+
+    DETECT_DURATION.observe(time.time() - start)
+
+    if sonde_type != None and frequency_history != None:
+        frequency_history.record_detection(sonde_freq, sonde_type)
+
+    return (sonde_freq, sonde_type)
+
+
 def sonde_search(config, attempts = 5):
     """ Perform a frequency scan across the defined range, and test each frequency for a radiosonde's presence. """
     search_attempts = attempts
@@ -213,62 +292,79 @@ def sonde_search(config, attempts = 5):
     sonde_freq = None
     sonde_type = None
 
+    # Before scanning, check the frequencies sondes are most often found on.
+    if frequency_history != None and config['freq_history_precheck'] > 0:
+        known_frequencies = frequency_history.likely_frequencies(config['min_freq']*1e6, config['max_freq']*1e6, count=config['freq_history_precheck'])
+        if len(known_frequencies) > 0:
+            logging.info("Checking known frequencies (MHz): %s" % str([f/1e6 for (f, score) in known_frequencies]))
+            (sonde_freq, sonde_type) = test_frequencies(config, [f for (f, score) in known_frequencies])
+            if sonde_type != None:
+                return (sonde_freq, sonde_type)
+
     while search_attempts > 0:
 
         # Scan Band
-        run_rtl_power(config['min_freq']*1e6, config['max_freq']*1e6, config['search_step'], ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'])
+        scan_start = time.time()
+        if config['scan_method'] == 'rtl_power':
+            run_rtl_power(config['min_freq']*1e6, config['max_freq']*1e6, config['search_step'], dwell=config['scan_dwell'], ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'])
 
         # Read in result
         try:
-            (freq, power, step) = read_rtl_power('log_power.csv')
+            if config['scan_method'] == 'rtl_power':
+                (freq, power, step) = read_rtl_power('log_power.csv')
+            else:
+                logging.info("Running frequency scan.")
+                scanner = get_spectrum_scanner(config)
+                scanner.set_dwell(config['scan_dwell'])
+                (freq, power, step) = scanner.scan()
+
             # Sanity check results.
             if step == 0 or len(freq)==0 or len(power)==0:
                 raise Exception("Invalid file.")
 
+            SCAN_DURATION.observe(time.time() - scan_start)
+
         except Exception as e:
+            SCANS.labels('failed').inc()
             traceback.print_exc()
-            logging.error("Failed to read log_power.csv. Resetting RTLSDRs and attempting to run rtl_power again.")
+            logging.error("Failed to obtain scan results. Resetting RTLSDRs and attempting to scan again.")
             # no log_power.csv usually means that rtl_power has locked up and had to be SIGKILL'd. 
             # This occurs when it can't get samples from the RTLSDR, because it's locked up for some reason.
             # Issuing a USB Reset to the rtlsdr can sometimes solve this. 
+            release_spectrum_scanner()
             reset_rtlsdr()
             search_attempts -= 1
             time.sleep(10)
             continue
 
 
-        # Rough approximation of the noise floor of the received power spectrum.
-        power_nf = np.mean(power)
-
-        # Detect peaks.
-        peak_indices = detect_peaks(power, mph=(power_nf+config['min_snr']), mpd=(config['min_distance']/step), show = False)
+        # Detect peaks standing out from the local noise floor of the received power spectrum.
+        (peak_indices, peak_snrs) = detect_peaks_cfar(power, min_snr=config['min_snr'], min_distance=config['min_distance']/step, noise_window=config['noise_floor_window']/step)
 
         if len(peak_indices) == 0:
+            SCANS.labels('no_peaks').inc()
             logging.info("No peaks found on this pass.")
             search_attempts -= 1
             time.sleep(10)
             continue
 
-        # Sort peaks by power.
-        peak_powers = power[peak_indices]
+        SCANS.labels('peaks').inc()
+        SCAN_PEAKS.inc(len(peak_indices))
+
+        # Sort peaks by SNR.
+        peak_order = np.argsort(peak_snrs)[::-1]
         peak_freqs = freq[peak_indices]
-        peak_frequencies = peak_freqs[np.argsort(peak_powers)][::-1]
+        peak_frequencies = peak_freqs[peak_order]
 
         # Quantize to nearest x kHz
         peak_frequencies = quantize_freq(peak_frequencies, config['quantization'])
-        logging.info("Peaks found at (MHz): %s" % str(peak_frequencies/1e6))
+        logging.info("Peaks found at (MHz): %s" % ', '.join(["%.3f (%.1f dB)" % (f/1e6, s) for (f, s) in zip(peak_frequencies, peak_snrs[peak_order])]))
 
-        # Run rs_detect on each peak frequency, to determine if there is a sonde there.
-        for freq in peak_frequencies:
-            detected = detect_sonde(freq, 
-                ppm=config['rtlsdr_ppm'], 
-                gain=config['rtlsdr_gain'], 
-                bias=config['rtlsdr_bias'], 
-                dwell_time=config['dwell_time'])
-            if detected != None:
-                sonde_freq = freq
-                sonde_type = detected
-                break
+        # Test peaks near frequencies we have seen sondes on before first.
+        if frequency_history != None:
+            peak_frequencies = frequency_history.prioritise(list(peak_frequencies), tolerance=config['quantization'])
+
+        (sonde_freq, sonde_type) = test_frequencies(config, peak_frequencies)
 
         if sonde_type != None:
             # Found a sonde! Break out of the while loop and attempt to decode it.
@@ -283,98 +379,148 @@ def sonde_search(config, attempts = 5):
     logging.error("No sondes detected.")
     return (None, None)
 
+def process_rs_frame(rs_frame):
+    """ Log a decoded TelemetryFrame, from the decoder output or the rs_module library. """
+    logging.info("TELEMETRY: %s,%d,%s,%.5f,%.5f,%.1f,%s" % (rs_frame['id'], rs_frame['frame'],rs_frame['datetime'], rs_frame['lat'], rs_frame['lon'], rs_frame['alt'], rs_frame['crc']))
+    return rs_frame
+
 def process_rs_line(line):
-    """ Process a line of output from the rs92gps decoder, converting it to a dict """
+    """ Process a line of output from the rs92ecc/rs41ecc decoders, converting it to a TelemetryFrame """
     # Sample output:
-    #   0      1        2        3            4         5         6      7   8     9  10
-    # 106,M3553150,2017-04-30,05:44:40.460,-34.72471,138.69178,-263.83, 0.1,265.0,0.3,OK
+    # { "frame": 3172, "id": "L1830070", "datetime": "2015-08-02T11:59:26.000Z", "lat": 46.01891, "lon": 16.34725, "alt": 14035.75168, "vel_h": 12.34544, "heading": 63.32761, "vel_v": 7.14554 }
     try:
 
         if line[0] != "{":
             return None
 
-        rs_frame = json.loads(line)
-        rs_frame['crc'] = True # the rs92ecc only reports frames that match crc so we can lie here
-        rs_frame['temp'] = 0.0 #we don't have this yet
-        rs_frame['humidity'] = 0.0
-        rs_frame['datetime_str'] = rs_frame['datetime'].replace("Z","") #python datetime sucks
-        rs_frame['short_time'] = rs_frame['datetime'].split(".")[0].split("T")[1]
-
-        logging.info("TELEMETRY: %s,%d,%s,%.5f,%.5f,%.1f,%s" % (rs_frame['id'], rs_frame['frame'],rs_frame['datetime'], rs_frame['lat'], rs_frame['lon'], rs_frame['alt'], rs_frame['crc']))
-
-        return rs_frame
+        # The decoders only report frames that match their CRC, so the crc field is always True.
+        # The datetime_str and short_time fields are derived from the frame's datetime when used.
+        return process_rs_frame(parse_decoder_line(line))
 
     except:
+        PARSE_ERRORS.inc()
         logging.error("Could not parse string: %s" % line)
         traceback.print_exc()
         return None
 
 def update_flight_stats(data):
-    """ Maintain a record of flight statistics. """
+    """ Maintain a record of flight statistics, for each sonde, and add the live statistics to the telemetry data. """
     global flight_stats
 
-    # Save the current frame into the 'last' frame storage
-    flight_stats['last'] = data
-
-    # Is this our first telemetry frame?
-    # If so, populate all fields in the flight stats dict with the current telemetry frame.
-    if flight_stats['first'] == None:
-        flight_stats['first'] = data
-        flight_stats['apogee'] = data
-
-    # Is the current altitude higher than the current peak altitude?
-    if data['alt'] > flight_stats['apogee']['alt']:
-        flight_stats['apogee'] = data
-
-
-
-def calculate_flight_statistics():
-    """ Produce a flight summary, for inclusion in the log file. """
-    global flight_stats
+    # Is this our first telemetry frame from this sonde?
+    if data['id'] not in flight_stats:
+        # Landing predictions assume the sonde lands at our altitude.
+        flight_stats[data['id']] = FlightStats(ground_alt=config['station_alt'])
+        SONDES.labels(data['type']).inc()
+
+    stats = flight_stats[data['id']]
+
+    # Count frames missing from the sonde's frame counter since the last frame. Large jumps are counter resets.
+    if stats.last != None:
+        missed = data['frame'] - stats.last['frame'] - 1
+        if 0 < missed < 1000:
+            FRAMES_MISSED.labels(data['type']).inc(missed)
+
+    stats.update(data)
+    data.update(stats.live())
+
+
+def calculate_flight_statistics(flight_stats):
+    """ Produce a flight summary for a single sonde, for inclusion in the log file. """
+    return flight_stats.summary()
+
+def handle_decoder_line(line, frequency, sonde_type, push=True):
+    """ Process a line of decoder output, and pass it on to the telemetry outputs. """
+    start = time.time()
+    if stage_timer != None:
+        stage_timer.start()
+
+    handle_frame(process_rs_line(line), frequency, sonde_type, push=push, start=start)
+
+def handle_frame(data, frequency, sonde_type, push=True, start=None):
+    """ Pass a decoded TelemetryFrame (or None, if decoding failed) on to the telemetry outputs. """
+    if start == None:
+        start = time.time()
+        if stage_timer != None:
+            stage_timer.start()
+
+    if data != None:
+        # Add in a few fields that don't come from the sonde telemetry.
+        data['freq'] = "%.3f MHz" % (frequency/1e6)
+        data['type'] = sonde_type
+        FRAMES.labels(sonde_type).inc()
+        if stage_timer != None:
+            stage_timer.mark('parse')
+
+        update_flight_stats(data)
+        if stage_timer != None:
+            stage_timer.mark('flight_stats')
+
+        if frequency_history != None:
+            frequency_history.record_decode(frequency, sonde_type)
+
+        if telemetry_store != None:
+            try:
+                telemetry_store.add(data)
+            except:
+                logging.error("Could not write to telemetry store: %s" % traceback.format_exc())
+            if stage_timer != None:
+                stage_timer.mark('store')
+
+        if push and telemetry_dispatcher != None:
+            telemetry_dispatcher.add(data)
+            if stage_timer != None:
+                stage_timer.mark('dispatch')
+
+        FRAME_DURATION.observe(time.time() - start)
+
+def run_decoder(decode_cmd, frequency, sonde_type, push=True, timeout=120):
+    """ Run a decoder pipeline, handling each line of output as soon as it arrives, until the decoder exits or times out. """
+    logging.debug("Running command: %s" % decode_cmd)
 
-    # Grab peak altitude.
-    peak_altitude = flight_stats['apogee']['alt']
+    rx_last_line = time.time()
 
-    # Grab last known descent rate
-    descent_rate = flight_stats['last']['vel_v']
+    # Receiver subprocess. Discard stderr, and wait on stdout with select(), so we only wake up when there is output.
+    rx = subprocess.Popen(decode_cmd, shell=True, stdin=None, stdout=subprocess.PIPE, preexec_fn=os.setsid) 
+    rx_stdout = PipeLineReader(rx.stdout)
 
-    # Calculate average ascent rate, based on data we have.
-    # Wrap this in a try, in case we have time string parsing issues.
-    try:
-        if flight_stats['first'] == flight_stats['apogee']:
-            # We have only caught a flight during descent. Don't calculate ascent rate.
-            ascent_rate = -1.0
-        else:
-            ascent_height = flight_stats['apogee']['alt'] - flight_stats['first']['alt']
-            start_time = datetime.datetime.strptime(flight_stats['first']['datetime_str'],"%Y-%m-%dT%H:%M:%S.%f")
-            apogee_time = datetime.datetime.strptime(flight_stats['apogee']['datetime_str'],"%Y-%m-%dT%H:%M:%S.%f")
-            ascent_time = (apogee_time - start_time).seconds
-            ascent_rate = ascent_height/float(ascent_time)
-    except:
-        ascent_rate = -1.0
+    while not rx_stdout.eof:
+        # Block until we get output, or until we would time out.
+        for line in rx_stdout.readlines(timeout=max(0, rx_last_line + timeout - time.time())):
+            if (line != None) and (line != ""):
+                try:
+                    handle_decoder_line(line, frequency, sonde_type, push=push)
+                    # Reset timeout counter.
+                    rx_last_line = time.time()
+                except:
+                    traceback.print_exc()
+                    logging.error("Error parsing line: %s" % line)
 
-    stats_str = "Acquired %s at %s on %s, at %d m altitude.\n" % (flight_stats['first']['type'], flight_stats['first']['datetime_str'], flight_stats['first']['freq'], int(flight_stats['first']['alt']))
-    stats_str += "Ascent Rate: %.1f m/s, Peak Altitude: %d, Descent Rate: %.1f m/s\n" % (ascent_rate, int(peak_altitude), descent_rate)
-    stats_str += "Last Position: %.5f, %.5f, %d m alt, at %s\n" % (flight_stats['last']['lat'], flight_stats['last']['lon'], int(flight_stats['last']['alt']), flight_stats['last']['datetime_str'])
-    stats_str += "Flight Path: https://aprs.fi/#!call=%s&timerange=10800&tail=10800\n" % flight_stats['last']['id']
+        # Check timeout counter.
+        if time.time() > (rx_last_line+timeout):
+            DECODER_TIMEOUTS.labels(sonde_type).inc()
+            logging.error("RX Timed out.")
+            break
 
-    return stats_str
+    logging.error("Closing RX Thread.")
+    os.killpg(os.getpgid(rx.pid), signal.SIGTERM)
+    rx.stdout.close()
+    return
 
-def decode_rs92(frequency, ppm=0, gain=-1, bias=False, rx_queue=None, almanac=None, ephemeris=None, timeout=120):
+def decode_rs92(frequency, ppm=0, gain=-1, bias=False, push=True, almanac=None, ephemeris=None, timeout=120):
     """ Decode a RS92 sonde """
-    global latest_sonde_data, internet_push_queue, ozi_push_queue
 
     # Before we get started, do we need to download GPS data?
     if ephemeris == None:
-        # If no ephemeris data defined, attempt to download it.
-        # get_ephemeris will either return the saved file name, or None.
-        ephemeris = get_ephemeris(destination="ephemeris.dat")
+        # If no ephemeris data defined, get it from the cache (downloading it if the cache is stale).
+        # get_ephemeris will either return the cached file name, or None.
+        ephemeris = gps_cache.get_ephemeris()
 
     # If ephemeris is still None, then we failed to download the ephemeris data.
     # Try and grab the almanac data instead
     if ephemeris == None:
         logging.error("Could not obtain ephemeris data, trying to download an almanac.")
-        almanac = get_almanac(destination="almanac.txt")
+        almanac = gps_cache.get_almanac()
         if almanac == None:
             # We probably don't have an internet connection. Bomb out, since we can't do much with the sonde telemetry without an almanac!
             logging.critical("Could not obtain GPS ephemeris or almanac data.")
@@ -390,7 +536,6 @@ def decode_rs92(frequency, ppm=0, gain=-1, bias=False, rx_queue=None, almanac=No
         gain_param = ''
 
     decode_cmd = "rtl_fm %s-p %d %s-M fm -s 12k -f %d 2>/dev/null |" % (bias_option, int(ppm), gain_param, frequency)
-    decode_cmd += "sox -t raw -r 12k -e s -b 16 -c 1 - -r 48000 -b 8 -t wav - lowpass 2500 highpass 20 2>/dev/null |"
 
     # Note: I've got the check-CRC option hardcoded in here as always on. 
     # I figure this is prudent if we're going to proceed to push this telemetry data onto a map.
@@ -400,56 +545,14 @@ def decode_rs92(frequency, ppm=0, gain=-1, bias=False, rx_queue=None, almanac=No
     elif almanac != None:
         decode_cmd += "./rs92ecc -v --crc --ecc --vel -a %s" % almanac
 
-    logging.debug("Running command: %s" % decode_cmd)
+    # The decoder reads the raw 12 kHz rtl_fm output, and does its own lowpass/highpass filtering.
+    decode_cmd += " --s16 12000"
 
-    rx_last_line = time.time()
-
-    # Receiver subprocess. Discard stderr, and feed stdout into an asynchronous read class.
-    rx = subprocess.Popen(decode_cmd, shell=True, stdin=None, stdout=subprocess.PIPE, preexec_fn=os.setsid) 
-    rx_stdout = AsynchronousFileReader(rx.stdout, autostart=True)
-
-    while not rx_stdout.eof():
-        for line in rx_stdout.readlines():
-            if (line != None) and (line != ""):
-                try:
-                    data = process_rs_line(line)
-                    # Reset timeout counter.
-                    rx_last_line = time.time()
-
-                    if data != None:
-                        # Add in a few fields that don't come from the sonde telemetry.
-                        data['freq'] = "%.3f MHz" % (frequency/1e6)
-                        data['type'] = "RS92"
-
-                        update_flight_stats(data)
-
-                        if rx_queue != None:
-                            try:
-                                internet_push_queue.put_nowait(data)
-                                ozi_push_queue.put_nowait(data)
-                            except:
-                                pass
-                except:
-                    traceback.print_exc()
-                    logging.error("Error parsing line: %s" % line)
-
-        # Check timeout counter.
-        if time.time() > (rx_last_line+timeout):
-            logging.error("RX Timed out.")
-            break
-        # Sleep for a short time.
-        time.sleep(0.1)
-
-    logging.error("Closing RX Thread.")
-    os.killpg(os.getpgid(rx.pid), signal.SIGTERM)
-    rx_stdout.stop()
-    rx_stdout.join()
-    return
+    run_decoder(decode_cmd, frequency, "RS92", push=push, timeout=timeout)
 
 
-def decode_rs41(frequency, ppm=0, gain=-1, bias=False, rx_queue=None, timeout=120):
+def decode_rs41(frequency, ppm=0, gain=-1, bias=False, push=True, timeout=120):
     """ Decode a RS41 sonde """
-    global latest_sonde_data, internet_push_queue, ozi_push_queue
     # Add a -T option if bias is enabled
     bias_option = "-T " if bias else ""
 
@@ -460,168 +563,95 @@ def decode_rs41(frequency, ppm=0, gain=-1, bias=False, rx_queue=None, timeout=12
         gain_param = ''
 
     decode_cmd = "rtl_fm %s-p %d %s-M fm -s 15k -f %d 2>/dev/null |" % (bias_option, int(ppm), gain_param, frequency)
-    decode_cmd += "sox -t raw -r 15k -e s -b 16 -c 1 - -r 48000 -b 8 -t wav - highpass 20 2>/dev/null |"
 
     # Note: I've got the check-CRC option hardcoded in here as always on. 
     # I figure this is prudent if we're going to proceed to push this telemetry data onto a map.
 
-    decode_cmd += "./rs41ecc --crc --ecc " # if this doesn't work try -i at the end
-
-    logging.debug("Running command: %s" % decode_cmd)
-
-    rx_last_line = time.time()
-
-    # Receiver subprocess. Discard stderr, and feed stdout into an asynchronous read class.
-    rx = subprocess.Popen(decode_cmd, shell=True, stdin=None, stdout=subprocess.PIPE, preexec_fn=os.setsid) 
-    rx_stdout = AsynchronousFileReader(rx.stdout, autostart=True)
-
-    while not rx_stdout.eof():
-        for line in rx_stdout.readlines():
-            if (line != None) and (line != ""):
-                try:
-                    data = process_rs_line(line)
-                    # Reset timeout counter.
-                    rx_last_line = time.time()
-
-                    if data != None:
-                        # Add in a few fields that don't come from the sonde telemetry.
-                        data['freq'] = "%.3f MHz" % (frequency/1e6)
-                        data['type'] = "RS41"
-
-                        update_flight_stats(data)
-
-                        latest_sonde_data = data
-
-                        if rx_queue != None:
-                            try:
-                                internet_push_queue.put_nowait(data)
-                                ozi_push_queue.put_nowait(data)
-                            except:
-                                pass
-                except:
-                    traceback.print_exc()
-                    logging.error("Error parsing line: %s" % line)
-
-        # Check timeout counter.
-        if time.time() > (rx_last_line+timeout):
-            logging.error("RX Timed out.")
-            break
-        # Sleep for a short time.
-        time.sleep(0.1)
+    # The decoder reads the raw 15 kHz rtl_fm output, and does its own highpass filtering.
+    decode_cmd += "./rs41ecc --crc --ecc --s16 15000 " # if this doesn't work try -i at the end
+
+    run_decoder(decode_cmd, frequency, "RS41", push=push, timeout=timeout)
+
+def get_gps_data():
+    """ Get GPS ephemeris data for RS92 decoding, falling back to an almanac. Returns a (ephemeris, almanac) tuple. """
+    return gps_cache.get_gps_data()
+
+def replay(config, filename, sonde_type="RS41", frequency=0, realtime=False, decoder_args="", library=False):
+    """
+    Replay recorded decoder output (JSON lines), or a WAV capture, through the telemetry pipeline,
+    and report the frame rate and the latency of each stage of handling a frame.
+    WAV captures are decoded with the rs41ecc/rs92ecc decoders, or in-process with the rs_module library.
+    """
+    global stage_timer
+    stage_timer = StageTimer()
+    frames = FRAMES.labels(sonde_type)
+    start_frames = frames.value
+    line_callback = lambda line: handle_decoder_line(line, frequency, sonde_type)
+
+    logging.info("Replay - Replaying %s (%s) %s." % (filename, sonde_type, "in real time" if realtime else "as fast as possible"))
+    start = time.time()
+
+    if filename.lower().endswith('.wav') and library:
+        (ephemeris, almanac) = get_gps_data() if sonde_type == 'RS92' else (None, None)
+        invert = ('-i' in decoder_args.split()) or ('--invert' in decoder_args.split())
+        frame_callback = lambda frame: handle_frame(process_rs_frame(frame), frequency, sonde_type)
+        duration = replay_wav_library(filename, sonde_type, frame_callback, invert=invert, ephemeris=ephemeris, almanac=almanac,
+            bandwidth=CHANNEL_BANDWIDTHS[sonde_type], realtime=realtime)
+    elif filename.lower().endswith('.wav'):
+        if sonde_type == 'RS92':
+            (ephemeris, almanac) = get_gps_data()
+            decoder_cmd = decoder_command(sonde_type, ephemeris=ephemeris, almanac=almanac)
+        else:
+            decoder_cmd = decoder_command(sonde_type)
 
-    logging.error("Closing RX Thread.")
-    os.killpg(os.getpgid(rx.pid), signal.SIGTERM)
-    rx_stdout.stop()
-    rx_stdout.join()
-    return
+        if decoder_cmd == None:
+            logging.critical("Replay - Could not obtain GPS data for RS92 decoding.")
+            return
 
-def internet_push_thread(station_config):
-    """ Push a frame of sonde data into various internet services (APRS-IS, Habitat), and also to a rotator (if configured) """
-    global internet_push_queue, INTERNET_PUSH_RUNNING
-    logging.info("Started Internet Push thread.")
-    while INTERNET_PUSH_RUNNING:
-        data = None
-        try:
-            # Wait until there is somethign in the queue before trying to process.
-            if internet_push_queue.empty():
-                time.sleep(1)
-                continue
-            else:
-                # Read in entire contents of queue, and keep the most recent entry.
-                while not internet_push_queue.empty():
-                    data = internet_push_queue.get()
-        except:
-            traceback.print_exc()
-            continue
+        duration = replay_wav(filename, decoder_cmd + " " + decoder_args, line_callback, bandwidth=CHANNEL_BANDWIDTHS[sonde_type], realtime=realtime)
+    else:
+        replay_lines(filename, line_callback, realtime=realtime)
+        duration = None
 
-        try:
-            # Wrap this entire section in a try/except, to catch any data parsing errors.
-            # APRS Upload
-            if station_config['enable_aprs']:
-                # Produce aprs comment, based on user config.
-                aprs_comment = station_config['aprs_custom_comment']
-                aprs_comment = aprs_comment.replace("<freq>", data['freq'])
-                aprs_comment = aprs_comment.replace("<id>", data['id'])
-                aprs_comment = aprs_comment.replace("<vel_v>", "%.1fm/s" % data['vel_v'])
-                aprs_comment = aprs_comment.replace("<type>", data['type'])
-
-                # Push data to APRS.
-                aprs_data = push_balloon_to_aprs(data,
-                                                object_name=station_config['aprs_object_id'],
-                                                aprs_comment=aprs_comment,
-                                                aprsUser=station_config['aprs_user'],
-                                                aprsPass=station_config['aprs_pass'])
-                logging.info("Data pushed to APRS-IS: %s" % aprs_data)
-
-            # Habitat Upload
-            if station_config['enable_habitat']:
-                habitat_upload_payload_telemetry(data, payload_callsign=config['payload_callsign'], callsign=config['uploader_callsign'])
-                logging.debug("Data pushed to Habitat.")
-
-            # Update Rotator positon, if configured.
-            if config['enable_rotator'] and (config['station_lat'] != 0.0) and (config['station_lon'] != 0.0):
-                # Calculate Azimuth & Elevation to Radiosonde.
-                rel_position = position_info((config['station_lat'], config['station_lon'], config['station_alt']),
-                    (data['lat'], data['lon'], data['alt']))
-
-                # Update the rotator with the current sonde position.
-                update_rotctld(hostname=config['rotator_hostname'], 
-                            port=config['rotator_port'],
-                            azimuth=rel_position['bearing'],
-                            elevation=rel_position['elevation'])
+    elapsed = time.time() - start
+    num_frames = frames.value - start_frames
 
-        except:
-            logging.error("Error while uploading data: %s" % traceback.format_exc())
-
-        if station_config['synchronous_upload']:
-            # Sleep for a second to ensure we don't double upload in the same slot (shouldn't' happen, but anyway...)
-            time.sleep(1)
-
-            # Wait until the next valid uplink timeslot.
-            # This is determined by waiting until the time since epoch modulus the upload rate is equal to zero.
-            # Note that this will result in some odd upload times, due to leap seconds and otherwise, but should
-            # result in multiple stations (assuming local timezones are the same, and the stations are synced to NTP)
-            # uploading at roughly the same time.
-            while int(time.time())%station_config['upload_rate'] != 0:
-                time.sleep(0.1)
-        else:
-            # Otherwise, just sleep.
-            time.sleep(station_config['upload_rate'])
+    logging.info("Replay - %d frames in %.2f seconds (%.1f frames/s)." % (num_frames, elapsed, num_frames/max(elapsed, 1e-6)))
+    if duration != None:
+        logging.info("Replay - Decoded %.1f seconds of audio at %.1fx real time." % (duration, duration/max(elapsed, 1e-6)))
+    if num_frames > 0:
+        logging.info("Replay - Frame handling latency (us):\n%s" % stage_timer.report())
 
-    logging.debug("Closing internet push thread.")
+    if telemetry_dispatcher != None:
+        for (name, stats) in telemetry_dispatcher.stats().items():
+            logging.info("Replay - %s output: %d frames received, %d sent, %d replaced, %d errors, last output took %.1f ms." % (name,
+                stats['received'], stats['sent'], stats['replaced'], stats['errors'], stats['last_duration']*1000.0))
 
-def ozi_push_thread(station_config):
-    """ Push a frame of sonde data into various internet services (APRS-IS, Habitat) """
-    global ozi_push_queue, OZI_PUSH_RUNNING
-    logging.info("Started OziPlotter Push thread.")
-    while OZI_PUSH_RUNNING:
-        data = None
-        try:
-            # Wait until there is somethign in the queue before trying to process.
-            if ozi_push_queue.empty():
-                time.sleep(1)
-                continue
-            else:
-                # Read in entire contents of queue, and keep the most recent entry.
-                while not ozi_push_queue.empty():
-                    data = ozi_push_queue.get()
-        except:
-            traceback.print_exc()
-            continue
+    stage_timer = None
 
-        try:
-            if station_config['ozi_enabled']:
-                push_telemetry_to_ozi(data,hostname=station_config['ozi_hostname'], udp_port=station_config['ozi_port'])
+def wideband_rx(config, stop_time=None):
+    """ Receive and decode multiple sondes at once, from a single wideband IQ stream. """
 
-            if station_config['payload_summary_enabled']:
-                push_payload_summary(data, udp_port=station_config['payload_summary_port'])
-        except:
-            traceback.print_exc()
+    # Centre the receiver in the search range, unless told otherwise. As with rtl_fm, the centre is offset by
+    # a quarter of the sample rate, to keep the middle of the search range off the RTLSDR's DC spike.
+    if config['multi_center_freq'] != 0.0:
+        center_freq = config['multi_center_freq']*1e6
+    else:
+        center_freq = (config['min_freq'] + config['max_freq'])*1e6/2.0 + config['scan_sample_rate']/4.0
 
-        time.sleep(station_config['ozi_update_rate'])
+    if config['scan_method'] == 'iq_file':
+        source = IQFileSource(config['scan_iq_file'], sample_rate=config['scan_sample_rate'])
+    else:
+        source = RTLSDRSource(sample_rate=config['scan_sample_rate'], ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'])
 
-    logging.debug("Closing thread.")
+    logging.info("Starting wideband receiver on %.3f MHz (%.3f MHz wide)." % (center_freq/1e6, config['scan_sample_rate']/1e6))
 
+    rx = WidebandReceiver(source, center_freq, handle_decoder_line, config, get_gps_data=get_gps_data)
+    try:
+        rx.run(stop_time=stop_time)
+    except:
+        logging.error("Wideband receiver failed: %s" % traceback.format_exc())
+        rx.close()
 
 if __name__ == "__main__":
 
@@ -637,6 +667,11 @@ if __name__ == "__main__":
     parser.add_argument("-c" ,"--config", default="station.cfg", help="Receive Station Configuration File")
     parser.add_argument("-f", "--frequency", type=float, default=0.0, help="Sonde Frequency (MHz) (bypass scan step, and quit if no sonde found).")
     parser.add_argument("-t", "--timeout", type=int, default=180, help="Stop receiving after X minutes.")
+    parser.add_argument("--replay", default=None, help="Replay recorded decoder output (JSON lines) or a WAV/IQ capture through the telemetry outputs, then exit. Sends to the outputs enabled in the configuration!")
+    parser.add_argument("--replay-type", default="RS41", choices=['RS41', 'RS92'], help="Sonde type of the replayed data.")
+    parser.add_argument("--replay-realtime", action="store_true", default=False, help="Replay at the recorded rate, rather than as fast as possible.")
+    parser.add_argument("--decoder-args", default="", help="Extra decoder arguments, when replaying a capture (i.e. -i for inverted audio).")
+    parser.add_argument("--replay-library", action="store_true", default=False, help="Decode replayed captures in-process with the rs_module library (librs_module.so), rather than rs41ecc/rs92ecc. -i in --decoder-args inverts the audio.")
     args = parser.parse_args()
 
     # Attempt to read in configuration file. Use default config if reading fails.
@@ -646,24 +681,66 @@ if __name__ == "__main__":
 
     timeout_time = time.time() + int(args.timeout)*60
 
-    # Internet push thread object.
-    push_thread_1 = None
-    push_thread_2 = None
+    # Start the telemetry outputs.
+    telemetry_dispatcher = TelemetryDispatcher(config)
+
+    # Start the metrics endpoint, and periodic metrics summary.
+    if config['metrics_enabled']:
+        try:
+            metrics_server = MetricsServer(host=config['metrics_host'], port=config['metrics_port'])
+        except:
+            logging.error("Could not start metrics server: %s" % traceback.format_exc())
+    if config['metrics_log_interval'] > 0:
+        metrics_logger = MetricsLogger(interval=config['metrics_log_interval'])
+
+    # Load the history of frequencies sondes have been found on. Replayed data is not added to it.
+    if config['freq_history_enabled'] and args.replay == None:
+        frequency_history = FrequencyHistory(config['freq_history_file'], half_life=config['freq_history_half_life'])
+
+    # Start the scan scheduler.
+    if config['scheduler_enabled']:
+        scan_scheduler = ScanScheduler(launch_times=parse_launch_times(config['launch_times']),
+            window_before=config['launch_window_before'],
+            window_after=config['launch_window_after'],
+            learn=config['learn_launch_times'],
+            idle_scan_interval=config['idle_scan_interval'],
+            idle_scan_dwell=config['idle_scan_dwell'],
+            search_delay=config['search_mode_delay'],
+            search_attempts=config['search_mode_attempts'])
+
+    # Start pre-fetching GPS data, for RS92 decoding.
+    gps_cache = GPSDataCache()
+    if args.replay == None:
+        gps_cache.start()
+
+    # Open the telemetry store.
+    if config['telemetry_store_enabled']:
+        telemetry_store = TelemetryStore(config['telemetry_store_dir'])
 
     # Sonde Frequency & Type variables.
     sonde_freq = None
     sonde_type = None
 
     # If Habitat upload is enabled and we have been provided with listener coords, push our position to habitat
-    if config['enable_habitat'] and (config['station_lat'] != 0.0) and (config['station_lon'] != 0.0) and config['upload_listener_position']:
+    if config['enable_habitat'] and (config['station_lat'] != 0.0) and (config['station_lon'] != 0.0) and config['upload_listener_position'] and args.replay == None:
         uploadListenerPosition(config['uploader_callsign'], config['station_lat'], config['station_lon'])
 
+    # In replay mode, we replay the recorded data, then skip the main loop and shut down.
+    if args.replay != None:
+        replay(config, args.replay, sonde_type=args.replay_type, frequency=args.frequency*1e6, realtime=args.replay_realtime, decoder_args=args.decoder_args, library=args.replay_library)
+
     # Main scan & track loop. We keep on doing this until we timeout (i.e. after we expect the sonde to have landed)
 
-    while time.time() < timeout_time or args.timeout == 0:
+    while (time.time() < timeout_time or args.timeout == 0) and args.replay == None:
+        # In multi-sonde mode, the wideband receiver handles searching, detection and decoding.
+        if config['multi_sonde']:
+            wideband_rx(config, stop_time=(timeout_time if args.timeout != 0 else None))
+            time.sleep(config['search_delay'])
+            continue
+
         # Attempt to detect a sonde on a supplied frequency.
         if args.frequency != 0.0:
-            sonde_type = detect_sonde(int(float(args.frequency)*1e6), ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'])
+            (sonde_type, confidence) = detect_sonde(int(float(args.frequency)*1e6), ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'])
             if sonde_type != None:
                 sonde_freq = int(float(args.frequency)*1e6)
             else:
@@ -679,10 +756,22 @@ if __name__ == "__main__":
 
         # If nothing is detected, or we haven't been supplied a frequency, perform a scan.
         if sonde_type == None:
-            (sonde_freq, sonde_type) = sonde_search(config, config['search_attempts'])
+            if scan_scheduler != None:
+                # Search aggressively within launch windows, otherwise just do a short scan.
+                search_config = scan_scheduler.search_config(config)
+            else:
+                search_config = config
+
+            (sonde_freq, sonde_type) = sonde_search(search_config, search_config['search_attempts'])
+
+            if sonde_type != None and scan_scheduler != None:
+                scan_scheduler.record_acquisition()
 
         # If we *still* haven't detected a sonde... just keep on trying, until we hit our timeout.
         if sonde_type == None:
+            # Outside of launch windows, only scan every so often.
+            if scan_scheduler != None:
+                time.sleep(scan_scheduler.idle_time())
             continue
 
         logging.info("Starting decoding of %s on %.3f MHz" % (sonde_type, sonde_freq/1e6))
@@ -691,20 +780,11 @@ if __name__ == "__main__":
         if config['enable_habitat'] and (config['station_lat'] != 0.0) and (config['station_lon'] != 0.0) and config['upload_listener_position']:
             uploadListenerPosition(config['uploader_callsign'], config['station_lat'], config['station_lon'])
 
-        # Start both of our internet/ozi push threads, even if we're not going to use them.
-        if push_thread_1 == None:
-            push_thread_1 = Thread(target=internet_push_thread, kwargs={'station_config':config})
-            push_thread_1.start()
-
-        if push_thread_2 == None:
-            push_thread_2 = Thread(target=ozi_push_thread, kwargs={'station_config':config})
-            push_thread_2.start()
-
         # Start decoding the sonde!
         if sonde_type == "RS92":
-            decode_rs92(sonde_freq, ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'], rx_queue=internet_push_queue, timeout=config['rx_timeout'])
+            decode_rs92(sonde_freq, ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'], timeout=config['rx_timeout'])
         elif sonde_type == "RS41":
-            decode_rs41(sonde_freq, ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'], rx_queue=internet_push_queue, timeout=config['rx_timeout'])
+            decode_rs41(sonde_freq, ppm=config['rtlsdr_ppm'], gain=config['rtlsdr_gain'], bias=config['rtlsdr_bias'], timeout=config['rx_timeout'])
         else:
             pass
 
@@ -716,18 +796,31 @@ if __name__ == "__main__":
 
     # Note that if we are running as a service, we won't ever get here.
 
-    logging.info("Exceeded maximum receive time. Exiting.")
+    if args.replay == None:
+        logging.info("Exceeded maximum receive time. Exiting.")
+
+    release_spectrum_scanner()
 
     # Write flight statistics to file.
-    if flight_stats['last'] != None:
-        stats_str = calculate_flight_statistics()
+    for sonde_id in flight_stats:
+        stats_str = calculate_flight_statistics(flight_stats[sonde_id])
         logging.info(stats_str)
 
         f = open("last_positions.txt", 'a')
         f.write(stats_str + "\n")
         f.close()
 
-    # Stop the APRS output thread.
-    INTERNET_PUSH_RUNNING = False
+    # Log a final metrics summary, and stop the metrics outputs.
+    logging.info("Metrics - %s" % METRICS.summary())
+    if metrics_logger != None:
+        metrics_logger.close()
+    if metrics_server != None:
+        metrics_server.close()
+
+    # Stop the telemetry outputs.
+    telemetry_dispatcher.close()
 
+    if telemetry_store != None:
+        telemetry_store.close()
 
+    gps_cache.close()
@@ -5,26 +5,28 @@
 
 # Build rs_detect.
 cd ../scan/
-gcc rs_detect.c -lm -o rs_detect
+gcc rs_detect.c ../demod/fsk_demod.c -I../demod/ -lm -o rs_detect
 gcc reset_usb.c -o reset_usb
 
 
 # Build rs92 and rs41 decoders
 cd ../rs_module/
 gcc -c rs_datum.c
-gcc -c rs_demod.c
+gcc -c -I../demod/ rs_demod.c
+gcc -c ../demod/fsk_demod.c
 gcc -c rs_bch_ecc.c
 gcc -c rs_rs41.c
 gcc -c rs_rs92.c
 gcc -c rs_main41.c
-gcc rs_main41.o rs_rs41.o rs_bch_ecc.o rs_demod.o rs_datum.o -lm -o rs41mod
+gcc rs_main41.o rs_rs41.o rs_bch_ecc.o rs_demod.o fsk_demod.o rs_datum.o -lm -o rs41mod
 gcc -c rs_main92.c
-gcc rs_main92.o rs_rs92.o rs_bch_ecc.o rs_demod.o rs_datum.o -lm -o rs92mod
+gcc rs_main92.o rs_rs92.o rs_bch_ecc.o rs_demod.o fsk_demod.o rs_datum.o -lm -o rs92mod
+gcc -O2 -shared -fPIC -I../demod/ rs_lib.c rs_rs41.c rs_rs92.c rs_bch_ecc.c rs_demod.c rs_datum.c ../demod/fsk_demod.c -lm -o librs_module.so
 
 cd ../rs92/
-gcc rs92ecc.c -lm -o rs92ecc  -I../ecc/
+gcc rs92ecc.c ../demod/fsk_demod.c -lm -o rs92ecc  -I../ecc/ -I../demod/
 cd ../rs41/
-gcc rs41ecc.c -lm -o rs41ecc  -I../ecc/
+gcc rs41ecc.c ../demod/fsk_demod.c -lm -o rs41ecc  -I../ecc/ -I../demod/
 
 # Copy all necessary files into this directory.
 cd ../auto_rx/
@@ -32,6 +34,7 @@ cp ../scan/rs_detect .
 cp ../scan/reset_usb .
 cp ../rs_module/rs41mod .
 cp ../rs_module/rs92mod .
+cp ../rs_module/librs_module.so .
 cp ../rs92/rs92ecc .
 cp ../rs41/rs41ecc .
 
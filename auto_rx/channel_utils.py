@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Wideband IQ Channelizer
+#
+# Splits a wideband IQ stream into narrowband FM-demodulated audio channels.
+# Each channel is frequency shifted to baseband (as with iq/shift_IQ.c), decimated
+# with a boxcar (CIC-1) stage then a FIR low-pass stage, and FM demodulated.
+#
+import struct
+import numpy as np
+
+
+def lowpass_taps(cutoff, sample_rate, num_taps=63):
+    """ Design a windowed-sinc FIR low-pass filter. cutoff is in Hz. """
+    n = np.arange(num_taps) - (num_taps - 1)/2.0
+    taps = np.sinc(2.0*cutoff/sample_rate*n)*np.hamming(num_taps)
+    return (taps/np.sum(taps)).astype(np.float32)
+
+
+def wav_header(sample_rate, data_size=0x7FFFFFDB):
+    """ Produce a mono 16-bit WAV header. The default data size is the maximum allowed,
+    for streaming an open-ended number of samples into a decoder. """
+    return struct.pack('<4sI4s4sIHHIIHH4sI',
+        'RIFF', data_size + 36, 'WAVE',
+        'fmt ', 16, 1, 1, int(round(sample_rate)), int(round(sample_rate))*2, 2, 16,
+        'data', data_size)
+
+
+class FMChannel(object):
+    """
+    A single narrowband FM channel, offset from the centre of a wideband IQ stream.
+
+    Blocks of IQ are passed to process(), which returns the demodulated audio as int16 samples,
+    at a rate of audio_rate (Hz). State is kept between blocks, so the output is continuous.
+    """
+
+    def __init__(self, offset, input_rate, bandwidth=15000, audio_rate=16000):
+        self.offset = float(offset)
+        self.input_rate = float(input_rate)
+
+        # First stage - boxcar decimation down to roughly 8x the channel bandwidth.
+        # A boxcar filter of length N has nulls at multiples of input_rate/N, which is where the aliases land.
+        self.decim_1 = max(1, int(self.input_rate//(8*bandwidth)))
+        if_rate = self.input_rate/self.decim_1
+
+        # Second stage - FIR low-pass and decimation down to the audio rate.
+        self.decim_2 = max(1, int(round(if_rate/audio_rate)))
+        self.audio_rate = if_rate/self.decim_2
+        self.taps = lowpass_taps(bandwidth/2.0, if_rate).astype(np.complex64)
+
+        # Mixer state. The oscillator for the most recent block length is cached.
+        self.sample_count = 0
+        self._osc = None
+
+        # Leftover samples from the previous block, for each of the stages.
+        self._decim_1_buf = np.array([], dtype=np.complex64)
+        self._decim_2_buf = np.zeros(len(self.taps) - 1, dtype=np.complex64)
+        self._last_sample = np.complex64(0)
+
+        # Running DC estimate, used to remove the offset caused by any residual frequency error.
+        self._dc = None
+
+    def _mix(self, block):
+        """ Shift the channel to baseband. """
+        n = len(block)
+        if self._osc is None or len(self._osc) != n:
+            self._osc = np.exp(-2j*np.pi*self.offset*np.arange(n)/self.input_rate).astype(np.complex64)
+
+        # Phase of the oscillator at the start of this block.
+        phase = np.exp(-2j*np.pi*((self.offset*self.sample_count/self.input_rate) % 1.0))
+        self.sample_count += n
+
+        return block*self._osc*np.complex64(phase)
+
+    def process(self, block):
+        """ Process a block of complex IQ samples, returning int16 audio samples. """
+        mixed = self._mix(block)
+
+        # Boxcar decimation.
+        data = np.concatenate((self._decim_1_buf, mixed))
+        n_out = len(data)//self.decim_1
+        self._decim_1_buf = data[n_out*self.decim_1:]
+        data = data[:n_out*self.decim_1].reshape((n_out, self.decim_1)).mean(axis=1)
+
+        # FIR low-pass, only computing the output samples we keep.
+        data = np.concatenate((self._decim_2_buf, data))
+        n_out = (len(data) - len(self.taps) + 1)//self.decim_2
+        if n_out <= 0:
+            self._decim_2_buf = data
+            return np.array([], dtype=np.int16)
+        filtered = np.convolve(data, self.taps, mode='valid')[:n_out*self.decim_2:self.decim_2]
+        self._decim_2_buf = data[n_out*self.decim_2:]
+
+        # FM demodulation (polar discriminator, as in rtl_fm)
+        baseband = np.concatenate(([self._last_sample], filtered))
+        self._last_sample = filtered[-1]
+        audio = np.angle(baseband[1:]*np.conj(baseband[:-1]))
+
+        # DC removal.
+        if self._dc is None:
+            self._dc = np.mean(audio)
+        else:
+            self._dc = 0.95*self._dc + 0.05*np.mean(audio)
+        audio = audio - self._dc
+
+        # Scale so that +/- pi radians per sample maps to full scale.
+        return np.clip(audio*(32767.0/np.pi), -32767, 32767).astype(np.int16)
+
+
+class Channelizer(object):
+    """ A set of FM channels, all fed from the same wideband IQ stream. """
+
+    def __init__(self, center_freq, input_rate, bandwidth=15000, audio_rate=16000):
+        self.center_freq = center_freq
+        self.input_rate = input_rate
+        self.bandwidth = bandwidth
+        self.audio_rate = audio_rate
+        self.channels = {}
+
+    def add_channel(self, freq, bandwidth=None, audio_rate=None):
+        """ Add a channel at an absolute frequency (Hz). Returns the FMChannel object.
+        The channelizer's bandwidth and audio rate are used unless overridden. """
+        channel = FMChannel(freq - self.center_freq, self.input_rate,
+            bandwidth=bandwidth if bandwidth != None else self.bandwidth,
+            audio_rate=audio_rate if audio_rate != None else self.audio_rate)
+        self.channels[freq] = channel
+        return channel
+
+    def remove_channel(self, freq):
+        self.channels.pop(freq, None)
+
+    def process(self, block):
+        """ Process a block of IQ samples, returning a dict of {frequency: int16 audio samples}. """
+        output = {}
+        for freq, channel in self.channels.items():
+            output[freq] = channel.process(block)
+        return output
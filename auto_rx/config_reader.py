@@ -44,12 +44,45 @@ def read_auto_rx_config(filename):
 		'rotator_homing_enabled': False,
 		'rotator_home_azimuth': 0,
 		'rotator_home_elevation': 0,
+		'rotator_update_rate': 30,
 		'ozi_enabled'	: False,
 		'ozi_update_rate': 5,
 		'ozi_hostname'	: '127.0.0.1',
 		'ozi_port'		: 55681,
 		'payload_summary_enabled': False,
-		'payload_summary_port' : 55672
+		'payload_summary_port' : 55672,
+		'payload_summary_hosts': '<broadcast>',
+		'telemetry_store_enabled': False,
+		'telemetry_store_dir': 'log/telemetry',
+		'scan_method'	: 'rtl_power',
+		'scan_sample_rate': 2048000,
+		'rtl_tcp_port'	: 1234,
+		'scan_iq_file'	: '',
+		'parallel_detect': False,
+		'multi_sonde'	: False,
+		'multi_center_freq': 0.0,
+		'freq_history_enabled': True,
+		'freq_history_file': 'frequency_history.json',
+		'freq_history_half_life': 30,
+		'freq_history_precheck': 2,
+		'scan_dwell'	: 20,
+		'noise_floor_window': 200000,
+		'detect_confidence': 0.0,
+		'scheduler_enabled': False,
+		'launch_times'	: '',
+		'launch_window_before': 30,
+		'launch_window_after': 180,
+		'learn_launch_times': True,
+		'idle_scan_interval': 900,
+		'idle_scan_dwell': 5,
+		'search_mode_delay': 5,
+		'search_mode_attempts': 10,
+		'metrics_enabled': False,
+		'metrics_host'	: '127.0.0.1',
+		'metrics_port'	: 9110,
+		'metrics_log_interval': 900,
+		'aprs_server'	: 'rotate.aprs2.net',
+		'aprs_port'		: 14580
 	}
 
 	try:
@@ -96,10 +129,111 @@ def read_auto_rx_config(filename):
 		auto_rx_config['payload_summary_enabled'] = config.getboolean('oziplotter', 'payload_summary_enabled')
 		auto_rx_config['payload_summary_port'] = config.getint('oziplotter', 'payload_summary_port')
 
-		return auto_rx_config
-
 	except:
 		traceback.print_exc()
 		logging.error("Could not parse config file, using defaults.")
 		return auto_rx_config
 
+	# Newer configuration options are read separately, so that older configuration files
+	# which are missing them still load, with defaults used for the missing options.
+
+	# In-process scanner settings.
+	try:
+		auto_rx_config['scan_method'] = config.get('search_params', 'scan_method')
+		auto_rx_config['scan_sample_rate'] = config.getint('search_params', 'scan_sample_rate')
+		auto_rx_config['rtl_tcp_port'] = config.getint('search_params', 'rtl_tcp_port')
+		auto_rx_config['scan_iq_file'] = config.get('search_params', 'scan_iq_file')
+	except:
+		logging.warning("Config file is missing scanner options, using defaults.")
+
+	# Parallel detection settings.
+	try:
+		auto_rx_config['parallel_detect'] = config.getboolean('search_params', 'parallel_detect')
+	except:
+		logging.warning("Config file is missing parallel detection options, using defaults.")
+
+	# Multi-sonde wideband receiver settings.
+	try:
+		auto_rx_config['multi_sonde'] = config.getboolean('search_params', 'multi_sonde')
+		auto_rx_config['multi_center_freq'] = config.getfloat('search_params', 'multi_center_freq')
+	except:
+		logging.warning("Config file is missing multi-sonde options, using defaults.")
+
+	# Frequency history settings.
+	try:
+		auto_rx_config['freq_history_enabled'] = config.getboolean('search_params', 'freq_history_enabled')
+		auto_rx_config['freq_history_file'] = config.get('search_params', 'freq_history_file')
+		auto_rx_config['freq_history_half_life'] = config.getfloat('search_params', 'freq_history_half_life')
+		auto_rx_config['freq_history_precheck'] = config.getint('search_params', 'freq_history_precheck')
+	except:
+		logging.warning("Config file is missing frequency history options, using defaults.")
+
+	# Scan dwell time.
+	try:
+		auto_rx_config['scan_dwell'] = config.getint('search_params', 'scan_dwell')
+	except:
+		logging.warning("Config file is missing scan dwell time, using default.")
+
+	# Peak detection noise floor window.
+	try:
+		auto_rx_config['noise_floor_window'] = config.getfloat('search_params', 'noise_floor_window')
+	except:
+		logging.warning("Config file is missing noise floor window, using default.")
+
+	# Detection confidence threshold.
+	try:
+		auto_rx_config['detect_confidence'] = config.getfloat('search_params', 'detect_confidence')
+	except:
+		logging.warning("Config file is missing detection confidence, using default.")
+
+	# Scan scheduler settings.
+	try:
+		auto_rx_config['scheduler_enabled'] = config.getboolean('scheduler', 'scheduler_enabled')
+		auto_rx_config['launch_times'] = config.get('scheduler', 'launch_times')
+		auto_rx_config['launch_window_before'] = config.getint('scheduler', 'launch_window_before')
+		auto_rx_config['launch_window_after'] = config.getint('scheduler', 'launch_window_after')
+		auto_rx_config['learn_launch_times'] = config.getboolean('scheduler', 'learn_launch_times')
+		auto_rx_config['idle_scan_interval'] = config.getint('scheduler', 'idle_scan_interval')
+		auto_rx_config['idle_scan_dwell'] = config.getint('scheduler', 'idle_scan_dwell')
+		auto_rx_config['search_mode_delay'] = config.getint('scheduler', 'search_mode_delay')
+		auto_rx_config['search_mode_attempts'] = config.getint('scheduler', 'search_mode_attempts')
+	except:
+		logging.warning("Config file is missing scan scheduler options, using defaults.")
+
+	# APRS-IS server settings.
+	try:
+		auto_rx_config['aprs_server'] = config.get('aprs', 'aprs_server')
+		auto_rx_config['aprs_port'] = config.getint('aprs', 'aprs_port')
+	except:
+		logging.warning("Config file is missing APRS-IS server options, using defaults.")
+
+	# Rotator update rate. Older configs tied this to the upload rate.
+	try:
+		auto_rx_config['rotator_update_rate'] = config.getint('rotator', 'rotator_update_rate')
+	except:
+		auto_rx_config['rotator_update_rate'] = auto_rx_config['upload_rate']
+		logging.warning("Config file is missing rotator update rate, using upload rate.")
+
+	# Additional OziPlotter / payload summary output targets.
+	try:
+		auto_rx_config['payload_summary_hosts'] = config.get('oziplotter', 'payload_summary_hosts')
+	except:
+		logging.warning("Config file is missing payload summary hosts, using defaults.")
+
+	# Telemetry store settings.
+	try:
+		auto_rx_config['telemetry_store_enabled'] = config.getboolean('telemetry_store', 'telemetry_store_enabled')
+		auto_rx_config['telemetry_store_dir'] = config.get('telemetry_store', 'telemetry_store_dir')
+	except:
+		logging.warning("Config file is missing telemetry store options, using defaults.")
+
+	# Metrics settings.
+	try:
+		auto_rx_config['metrics_enabled'] = config.getboolean('metrics', 'metrics_enabled')
+		auto_rx_config['metrics_host'] = config.get('metrics', 'metrics_host')
+		auto_rx_config['metrics_port'] = config.getint('metrics', 'metrics_port')
+		auto_rx_config['metrics_log_interval'] = config.getint('metrics', 'metrics_log_interval')
+	except:
+		logging.warning("Config file is missing metrics options, using defaults.")
+
+	return auto_rx_config
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Parallel Sonde Detection
+#
+# Captures a single wideband block of IQ covering a set of candidate frequencies,
+# channelizes each candidate, and runs rs_detect on all channels concurrently.
+# Also runs single frequency detection pipelines, returning as soon as rs_detect reports.
+#
+import logging
+import os
+import re
+import signal
+import subprocess
+import time
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from channel_utils import Channelizer
+from pipe_utils import PipeLineReader
+
+# rs_detect return codes.
+RS_DETECT_TYPES = {
+    2: 'DFM',
+    3: 'RS41',
+    4: 'RS92',
+    5: 'M10',
+    6: 'iMet'
+}
+
+# rs_detect output, i.e. "found: RS41 (2017-09-18 20:18Z)", and the timing confidence (0-1) of the signal.
+RS_DETECT_FOUND = re.compile(r'found: (-?\w+)')
+RS_DETECT_CONFIDENCE = re.compile(r'confidence: ([\d.]+)')
+
+# Minimum distance (Hz) of a channel from the centre of a capture, to keep it clear of the RTLSDR's DC spike / LO leakage.
+DC_CLEARANCE = 50000
+
+
+def parse_rs_detect_output(output):
+    """ Parse the output of rs_detect. Returns a (sonde type, confidence) tuple, or (None, 0.0) if nothing was found. """
+    found = RS_DETECT_FOUND.search(output)
+    # As with the return codes, inverted signals (i.e. "found: -RS41") are not counted, as the decoders won't decode them.
+    if found == None or found.group(1) not in RS_DETECT_TYPES.values():
+        return (None, 0.0)
+    confidence = RS_DETECT_CONFIDENCE.search(output)
+    return (found.group(1), float(confidence.group(1)) if confidence != None else 0.0)
+
+
+def rs_detect_stream(command, timeout):
+    """
+    Run a shell pipeline ending in rs_detect (e.g. rtl_fm | rs_detect), and return as soon as rs_detect
+    reports a result, or timeout seconds have passed. The whole pipeline is then stopped straight away,
+    rather than waiting for each process to exit on a broken pipe.
+    Returns a (sonde type, confidence) tuple, or (None, 0.0) if nothing was found.
+    """
+    logging.debug("Running command: %s" % command)
+    deadline = time.time() + timeout
+    rx = subprocess.Popen(command, shell=True, stdin=None, stdout=subprocess.PIPE, preexec_fn=os.setsid)
+    rx_stdout = PipeLineReader(rx.stdout, read_size=4096)
+    output = ''
+
+    # rs_detect finishes with a confidence line if it found something, or "found: NO".
+    # The shell keeps stdout open until the rest of the pipeline exits, so don't wait for EOF.
+    while not rx_stdout.eof and time.time() < deadline:
+        output += ''.join(rx_stdout.readlines(max(0, deadline - time.time())))
+        if 'confidence:' in output or 'found: NO' in output:
+            break
+
+    try:
+        os.killpg(os.getpgid(rx.pid), signal.SIGTERM)
+    except OSError:
+        # The pipeline has already exited.
+        pass
+    rx.wait()
+    rx.stdout.close()
+
+    return parse_rs_detect_output(output)
+
+
+def rs_detect_audio(audio, sample_rate, rs_detect='./rs_detect'):
+    """ Run rs_detect over a block of demodulated audio. Returns a (sonde type, confidence) tuple, or (None, 0.0). """
+    rx = subprocess.Popen([rs_detect, '-z', '-t', '8', '--s16', '%d' % int(round(sample_rate))], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (output, _) = rx.communicate(audio.astype('<i2').tostring())
+    return parse_rs_detect_output(output)
+
+
+def capture_center(frequencies, sample_rate, usable_bw=0.8):
+    """
+    Choose a centre frequency for a capture of the supplied frequencies, keeping each one within the usable
+    bandwidth, and at least DC_CLEARANCE from the centre. As rtl_fm does, the capture is offset by a quarter
+    of the sample rate if possible. Failing that, the centre is put in the widest gap between the frequencies.
+    Returns None if there is no such centre frequency.
+    """
+    freqs = sorted(frequencies)
+    middle = (freqs[0] + freqs[-1])/2.0
+    candidates = [middle + sample_rate/4.0, middle - sample_rate/4.0]
+    gaps = sorted(zip(freqs[:-1], freqs[1:]), key=lambda gap: gap[0] - gap[1])
+    candidates += [(low + high)/2.0 for (low, high) in gaps]
+    candidates += [freqs[0] - DC_CLEARANCE, freqs[-1] + DC_CLEARANCE]
+
+    for center_freq in candidates:
+        if all([DC_CLEARANCE <= abs(freq - center_freq) <= sample_rate*usable_bw/2.0 for freq in freqs]):
+            return center_freq
+    return None
+
+
+def group_frequencies(frequencies, sample_rate, usable_bw=0.8):
+    """ Split a list of frequencies into groups which can each be captured at once (see capture_center). """
+    groups = []
+    for freq in sorted(frequencies):
+        if len(groups) > 0 and capture_center(groups[-1] + [freq], sample_rate, usable_bw) != None:
+            groups[-1].append(freq)
+        else:
+            groups.append([freq])
+    return groups
+
+
+def capture_channels(source, frequencies, dwell_time=10, block_size=65536, usable_bw=0.8):
+    """ Capture dwell_time seconds of IQ covering the supplied frequencies (see capture_center), and channelize it.
+    Returns a list of (frequency, audio, audio_rate) tuples. """
+    center_freq = capture_center(frequencies, source.sample_rate, usable_bw)
+    if center_freq == None:
+        raise ValueError("Frequencies do not fit in one capture: %s" % ", ".join(["%.3f" % (f/1e6) for f in frequencies]))
+    source.tune(center_freq)
+
+    channelizer = Channelizer(center_freq, source.sample_rate)
+    for freq in frequencies:
+        channelizer.add_channel(freq)
+
+    audio = dict((freq, []) for freq in frequencies)
+
+    n_blocks = int(dwell_time*source.sample_rate)//block_size
+    for i in range(n_blocks):
+        output = channelizer.process(source.read(block_size))
+        for freq in output:
+            audio[freq].append(output[freq])
+
+    return [(freq, np.concatenate(audio[freq]), channelizer.channels[freq].audio_rate) for freq in frequencies]
+
+
+def detect_sondes_parallel(source, frequencies, dwell_time=10, usable_bw=0.8, rs_detect='./rs_detect'):
+    """
+    Test a list of candidate frequencies for radiosondes, using one wideband capture per group of candidates
+    that fit within the source's bandwidth. Results are returned in the same order as the supplied frequencies,
+    as a list of (frequency, sonde_type, confidence) tuples, where sonde_type is None if nothing was detected.
+    """
+    # Quantization may have given us duplicate frequencies.
+    frequencies = [f for i, f in enumerate(frequencies) if f not in frequencies[:i]]
+
+    detected = {}
+    pool = ThreadPool(processes=len(frequencies))
+
+    try:
+        for group in group_frequencies(frequencies, source.sample_rate, usable_bw):
+            logging.info("Attempting sonde detection on %s MHz" % ", ".join(["%.3f" % (f/1e6) for f in group]))
+            channels = capture_channels(source, group, dwell_time=dwell_time, usable_bw=usable_bw)
+
+            results = pool.map(lambda ch: rs_detect_audio(ch[1], ch[2], rs_detect=rs_detect), channels)
+
+            for (freq, audio, audio_rate), (sonde_type, confidence) in zip(channels, results):
+                detected[freq] = (sonde_type, confidence)
+                if sonde_type != None:
+                    logging.info("Detected a %s on %.3f MHz! (Confidence %.2f)" % (sonde_type, freq/1e6, confidence))
+    finally:
+        pool.close()
+
+    return [(freq,) + detected[freq] for freq in frequencies]
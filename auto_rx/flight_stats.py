@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Flight Statistics
+#
+# Incrementally updated statistics for a single sonde flight. Each frame is processed in constant time
+# and memory: rates are exponentially weighted moving averages over a time window, and only the first,
+# apogee and last frames are kept.
+#
+import calendar
+import math
+import time
+
+# Used for the landing position prediction.
+EARTH_RADIUS = 6371000.0
+
+# Cache of the epoch time of the start of each minute seen, so we only need to parse each minute once.
+_minute_cache = {}
+_MINUTE_CACHE_SIZE = 10000
+
+
+def sonde_time(datetime_str):
+    """ Quickly convert a decoder timestamp (i.e. 2017-12-01T01:23:45.678 or 2017-12-01T01:23:45.678Z) to seconds since the epoch. """
+    minute = datetime_str[:16]
+    try:
+        minute_time = _minute_cache[minute]
+    except KeyError:
+        if len(_minute_cache) > _MINUTE_CACHE_SIZE:
+            _minute_cache.clear()
+        minute_time = _minute_cache[minute] = calendar.timegm(time.strptime(minute, "%Y-%m-%dT%H:%M"))
+    return minute_time + float(datetime_str[17:].rstrip('Z'))
+
+
+class FlightStats(object):
+    """
+    Statistics for a single sonde flight.
+
+    window is the time constant (seconds) of the rolling rate averages. A burst is flagged once the sonde
+    is descending, and is more than burst_margin metres below its peak altitude. Time to landing and the
+    landing position are estimated from the rolling descent rate and horizontal velocity, assuming a
+    landing at ground_alt metres.
+    """
+
+    def __init__(self, window=30.0, burst_margin=200.0, ground_alt=0.0):
+        self.window = window
+        self.burst_margin = burst_margin
+        self.ground_alt = ground_alt
+
+        self.first = None
+        self.apogee = None
+        self.last = None
+        self.first_time = None
+        self.apogee_time = None
+        self.last_time = None
+
+        # Rolling averages of the vertical rate, and the east/north velocity components (m/s).
+        self.vel_v = None
+        self.vel_east = 0.0
+        self.vel_north = 0.0
+
+        # Rolling ascent rate (while ascending), and descent rate (after burst).
+        self.ascent_rate = None
+        self.descent_rate = None
+        self.burst = False
+        self.burst_time = None
+
+    def update(self, data):
+        """ Update the statistics with a frame of telemetry (as produced by process_rs_line). """
+        frame_time = data['timestamp'] if 'timestamp' in data else sonde_time(data['datetime_str'])
+
+        if self.first == None:
+            self.first = self.apogee = self.last = data
+            self.first_time = self.apogee_time = self.last_time = frame_time
+            self.vel_v = data.get('vel_v', 0.0)
+            self.update_velocity(data, 1.0)
+            return
+
+        dt = frame_time - self.last_time
+        if dt <= 0:
+            # Repeated or out-of-order frame.
+            return
+
+        # Vertical rate from the altitude change, averaged over the window.
+        rate = (data['alt'] - self.last['alt'])/dt
+        alpha = 1.0 - math.exp(-dt/self.window)
+        self.vel_v += alpha*(rate - self.vel_v)
+        self.update_velocity(data, alpha)
+
+        if data['alt'] > self.apogee['alt']:
+            self.apogee = data
+            self.apogee_time = frame_time
+            # Only update the ascent rate while we are still climbing, so it isn't dragged down around apogee.
+            if not self.burst and self.vel_v > 0:
+                self.ascent_rate = self.vel_v
+
+        if not self.burst:
+            if self.vel_v < 0 and data['alt'] < (self.apogee['alt'] - self.burst_margin):
+                self.burst = True
+                self.burst_time = frame_time
+                self.descent_rate = self.vel_v
+        else:
+            self.descent_rate += alpha*(rate - self.descent_rate)
+
+        self.last = data
+        self.last_time = frame_time
+
+    def update_velocity(self, data, alpha):
+        """ Update the rolling horizontal velocity, from the decoder's speed and heading. """
+        if 'vel_h' not in data or 'heading' not in data:
+            return
+        heading = math.radians(data['heading'])
+        self.vel_east += alpha*(data['vel_h']*math.sin(heading) - self.vel_east)
+        self.vel_north += alpha*(data['vel_h']*math.cos(heading) - self.vel_north)
+
+    def time_to_landing(self):
+        """ Estimated time to landing (seconds), or None if the sonde has not burst (or is not descending). """
+        if not self.burst or self.vel_v >= 0:
+            return None
+        return max(0.0, (self.last['alt'] - self.ground_alt)/-self.vel_v)
+
+    def landing_position(self):
+        """ Estimated landing position (lat, lon), or None if the sonde has not burst. """
+        ttl = self.time_to_landing()
+        if ttl == None:
+            return None
+        lat = self.last['lat'] + math.degrees(self.vel_north*ttl/EARTH_RADIUS)
+        lon = self.last['lon'] + math.degrees(self.vel_east*ttl/(EARTH_RADIUS*math.cos(math.radians(self.last['lat']))))
+        return (lat, lon)
+
+    def average_ascent_rate(self):
+        """ Average ascent rate from acquisition to apogee, or None if we only saw the sonde descending. """
+        if self.first is self.apogee or self.apogee_time <= self.first_time:
+            return None
+        return (self.apogee['alt'] - self.first['alt'])/(self.apogee_time - self.first_time)
+
+    def live(self):
+        """ Get the current statistics, as a dict which can be merged into the telemetry data. """
+        landing = self.landing_position()
+        return {
+            'vel_v_avg': self.vel_v,
+            'ascent_rate': self.ascent_rate,
+            'descent_rate': self.descent_rate,
+            'burst': self.burst,
+            'time_to_landing': self.time_to_landing(),
+            'landing_lat': landing[0] if landing != None else None,
+            'landing_lon': landing[1] if landing != None else None
+        }
+
+    def summary(self):
+        """ Produce a flight summary, for inclusion in the log file. """
+        ascent_rate = self.average_ascent_rate()
+        if ascent_rate == None:
+            # We have only caught a flight during descent.
+            ascent_rate = -1.0
+
+        # Use the rolling descent rate if we saw the burst, otherwise the last reported vertical rate.
+        descent_rate = self.descent_rate if self.descent_rate != None else self.last['vel_v']
+
+        stats_str = "Acquired %s at %s on %s, at %d m altitude.\n" % (self.first['type'], self.first['datetime_str'], self.first['freq'], int(self.first['alt']))
+        stats_str += "Ascent Rate: %.1f m/s, Peak Altitude: %d, Descent Rate: %.1f m/s\n" % (ascent_rate, int(self.apogee['alt']), descent_rate)
+        stats_str += "Last Position: %.5f, %.5f, %d m alt, at %s\n" % (self.last['lat'], self.last['lon'], int(self.last['alt']), self.last['datetime_str'])
+        landing = self.landing_position()
+        if landing != None:
+            stats_str += "Predicted Landing: %.5f, %.5f\n" % landing
+        stats_str += "Flight Path: https://aprs.fi/#!call=%s&timerange=10800&tail=10800\n" % self.last['id']
+
+        return stats_str
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Frequency History
+#
+# Keeps a persistent record of the frequencies sondes have been found on, so that the scanner can try
+# the frequencies used by local launch sites first. Each frequency has a score, which is increased when
+# a sonde is detected or decoded there, and decays with a configurable half-life. Frequencies with a
+# negligible score are forgotten.
+#
+import json
+import logging
+import os
+import threading
+import time
+
+# Score added when a sonde is detected on a frequency.
+DETECTION_WEIGHT = 1.0
+# Score added when a sonde is decoded on a frequency. This is only added once per flight.
+DECODE_WEIGHT = 2.0
+
+
+class FrequencyHistory(object):
+    """ Persistent, decaying record of the frequencies sondes have been found on. """
+
+    def __init__(self, filename="frequency_history.json", half_life=30, min_score=0.05, max_entries=32, flight_gap=3*3600, clock=time.time):
+        """
+        half_life is in days. Frequencies with a score below min_score are evicted, as are the lowest scoring
+        frequencies if there are more than max_entries. Decodes on a frequency more than flight_gap seconds
+        apart are counted as separate flights.
+        """
+        self.filename = filename
+        self.half_life = half_life*86400.0
+        self.min_score = min_score
+        self.max_entries = max_entries
+        self.flight_gap = flight_gap
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        # Entries keyed by frequency (in Hz, as a string), each a dict with
+        # 'score', 'updated', 'type', 'detections', 'flights' and 'last_decode' fields.
+        self.entries = {}
+        try:
+            f = open(self.filename, 'r')
+            self.entries = json.load(f)
+            f.close()
+        except IOError:
+            pass
+        except:
+            logging.error("Frequency History - Could not read %s, starting afresh." % self.filename)
+
+    def decayed_score(self, entry, now=None):
+        if now == None:
+            now = self.clock()
+        return entry['score'] * 0.5**(max(0.0, now - entry['updated'])/self.half_life)
+
+    def _add(self, frequency, sonde_type, weight, decode=False):
+        now = self.clock()
+        key = str(int(round(frequency)))
+
+        with self.lock:
+            entry = self.entries.get(key, {'score': 0.0, 'updated': now, 'type': sonde_type, 'detections': 0, 'flights': 0, 'last_decode': 0})
+
+            if decode:
+                # Only count the first decoded frame of each flight.
+                new_flight = (now - entry['last_decode']) > self.flight_gap
+                entry['last_decode'] = now
+                if not new_flight:
+                    self.entries[key] = entry
+                    return
+                entry['flights'] += 1
+            else:
+                entry['detections'] += 1
+
+            entry['score'] = self.decayed_score(entry, now) + weight
+            entry['updated'] = now
+            entry['type'] = sonde_type
+            self.entries[key] = entry
+
+            self.evict(now)
+            self.save()
+
+    def record_detection(self, frequency, sonde_type):
+        """ Record a sonde being detected on a frequency (Hz). """
+        self._add(frequency, sonde_type, DETECTION_WEIGHT)
+
+    def record_decode(self, frequency, sonde_type):
+        """ Record telemetry being decoded on a frequency (Hz). This can be called for every frame. """
+        self._add(frequency, sonde_type, DECODE_WEIGHT, decode=True)
+
+    def evict(self, now):
+        """ Drop frequencies with a negligible score, and the lowest scoring frequencies if we have too many. """
+        scores = sorted([(self.decayed_score(entry, now), key) for (key, entry) in self.entries.items()], reverse=True)
+        for (index, (score, key)) in enumerate(scores):
+            if score < self.min_score or index >= self.max_entries:
+                self.entries.pop(key)
+
+    def save(self):
+        try:
+            f = open(self.filename + '.tmp', 'w')
+            json.dump(self.entries, f)
+            f.close()
+            os.rename(self.filename + '.tmp', self.filename)
+        except:
+            logging.error("Frequency History - Could not write %s" % self.filename)
+
+    def likely_frequencies(self, min_freq=None, max_freq=None, count=None):
+        """ Get known frequencies (Hz) within a range, as a list of (frequency, score) tuples, most likely first. """
+        now = self.clock()
+        with self.lock:
+            results = []
+            for (key, entry) in self.entries.items():
+                freq = float(key)
+                if (min_freq != None and freq < min_freq) or (max_freq != None and freq > max_freq):
+                    continue
+                score = self.decayed_score(entry, now)
+                if score >= self.min_score:
+                    results.append((freq, score))
+
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results[:count] if count != None else results
+
+    def prioritise(self, frequencies, tolerance=5000):
+        """
+        Re-order a list of frequencies (Hz, i.e. scan peaks, strongest first), so that those within tolerance of
+        a known frequency come first, in order of score. The remaining frequencies keep their order.
+        """
+        scores = self.likely_frequencies()
+
+        def score(freq):
+            for (known, known_score) in scores:
+                if abs(freq - known) <= tolerance:
+                    return known_score
+            return 0.0
+
+        # sorted() is stable, so frequencies with equal scores stay in their original order.
+        return sorted(frequencies, key=score, reverse=True)
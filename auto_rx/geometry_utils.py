@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Listener / Sonde Geometry
+#
+# Earthmaths code by Daniel Richman (thanks!)
+# Copyright 2012 (C) Daniel Richman; GNU GPL 3
+#
+# Vectorised with numpy, so that whole telemetry histories can be processed in one call.
+#
+import numpy as np
+from math import radians
+
+# Mean Earth radius, in metres.
+EARTH_RADIUS = 6371000.0
+
+# WGS84 ellipsoid semi-major and semi-minor axes, in metres.
+WGS84_A = 6378137.0
+WGS84_B = 6356752.314245
+
+
+def wgs84_radius(lat):
+    """ Geocentric radius of the WGS84 ellipsoid at a latitude (degrees), in metres.
+    This can be passed as the radius to position_info_batch, to get a better local Earth model. """
+    lat = np.radians(lat)
+    a_cos = WGS84_A**2 * np.cos(lat)
+    b_sin = WGS84_B**2 * np.sin(lat)
+    return np.sqrt((a_cos**2 + b_sin**2)/((WGS84_A*np.cos(lat))**2 + (WGS84_B*np.sin(lat))**2))
+
+
+def position_info_batch(listener, balloon, radius=EARTH_RADIUS):
+    """
+    Calculate relative position information between arrays of (lat, lon, alt) positions.
+
+    listener and balloon are array-likes with (lat, lon, alt) along their last axis, i.e. of shape (N, 3),
+    and are broadcast against each other, so a single listener position can be used with many balloon positions.
+    radius may be a scalar or an array (again broadcast against the positions).
+
+    Returns a dict of arrays:
+
+     - angle_at_centre
+     - great_circle_distance
+     - straight_distance (distance in a straight line)
+     - bearing (azimuth or initial course)
+     - elevation (altitude)
+
+    Input and output latitudes, longitudes, angles, bearings and elevations are
+    in degrees, and input altitudes and output distances are in meters.
+    """
+    listener = np.asarray(listener, dtype=np.float64)
+    balloon = np.asarray(balloon, dtype=np.float64)
+
+    lat1 = np.radians(listener[..., 0])
+    lon1 = np.radians(listener[..., 1])
+    alt1 = listener[..., 2]
+    lat2 = np.radians(balloon[..., 0])
+    lon2 = np.radians(balloon[..., 1])
+    alt2 = balloon[..., 2]
+
+    # Calculate the bearing, the angle at the centre, and the great circle
+    # distance using Vincenty's_formulae with f = 0 (a sphere). See
+    # http://en.wikipedia.org/wiki/Great_circle_distance#Formulas and
+    # http://en.wikipedia.org/wiki/Great-circle_navigation and
+    # http://en.wikipedia.org/wiki/Vincenty%27s_formulae
+    d_lon = lon2 - lon1
+    cos_d_lon = np.cos(d_lon)
+    sin_lat1 = np.sin(lat1)
+    cos_lat1 = np.cos(lat1)
+    sin_lat2 = np.sin(lat2)
+    cos_lat2 = np.cos(lat2)
+
+    sa = cos_lat2 * np.sin(d_lon)
+    sb = (cos_lat1 * sin_lat2) - (sin_lat1 * cos_lat2 * cos_d_lon)
+    bearing = np.arctan2(sa, sb)
+    aa = np.sqrt((sa ** 2) + (sb ** 2))
+    ab = (sin_lat1 * sin_lat2) + (cos_lat1 * cos_lat2 * cos_d_lon)
+    angle_at_centre = np.arctan2(aa, ab)
+    great_circle_distance = angle_at_centre * radius
+
+    # Armed with the angle at the centre, calculating the remaining items
+    # is a simple 2D triangley circley problem:
+
+    # Use the triangle with sides (r + alt1), (r + alt2), distance in a
+    # straight line. The angle between (r + alt1) and (r + alt2) is the
+    # angle at the centre. The angle between distance in a straight line and
+    # (r + alt1) is the elevation plus pi/2.
+
+    # Use sum of angle in a triangle to express the third angle in terms
+    # of the other two. Use sine rule on sides (r + alt1) and (r + alt2),
+    # expand with compound angle formulae and solve for tan elevation by
+    # dividing both sides by cos elevation
+    ta = radius + alt1
+    tb = radius + alt2
+    cos_aac = np.cos(angle_at_centre)
+    ea = (cos_aac * tb) - ta
+    eb = np.sin(angle_at_centre) * tb
+    elevation = np.arctan2(ea, eb)
+
+    # Use cosine rule to find unknown side.
+    distance = np.sqrt((ta ** 2) + (tb ** 2) - 2 * tb * ta * cos_aac)
+
+    # Give a bearing in range 0 <= b < 2pi
+    bearing = np.mod(bearing, 2 * np.pi)
+
+    return {
+        "angle_at_centre": np.degrees(angle_at_centre),
+        "bearing": np.degrees(bearing),
+        "great_circle_distance": great_circle_distance,
+        "straight_distance": distance,
+        "elevation": np.degrees(elevation)
+    }
+
+
+def position_info(listener, balloon, radius=EARTH_RADIUS):
+    """
+    Calculate and return information from 2 (lat, lon, alt) tuples
+
+    Returns a dict with:
+
+     - angle at centre
+     - great circle distance
+     - distance in a straight line
+     - bearing (azimuth or initial course)
+     - elevation (altitude)
+
+    Input and output latitudes, longitudes, angles, bearings and elevations are
+    in degrees, and input altitudes and output distances are in meters.
+    Angles are also provided in radians, with a _radians suffix.
+    """
+    batch = position_info_batch(listener, balloon, radius=radius)
+
+    (lat1, lon1, alt1) = listener
+    (lat2, lon2, alt2) = balloon
+
+    info = {
+        "listener": listener, "balloon": balloon,
+        "listener_radians": (radians(lat1), radians(lon1), alt1),
+        "balloon_radians": (radians(lat2), radians(lon2), alt2),
+    }
+    for (key, value) in batch.items():
+        info[key] = float(value)
+
+    for key in ["angle_at_centre", "bearing", "elevation"]:
+        info[key + "_radians"] = radians(info[key])
+
+    return info
@@ -7,38 +7,62 @@
 import ftplib
 import urllib2
 import datetime
+import json
 import logging
 import os
+import shutil
+import threading
+import time
 
-def get_ephemeris(destination="ephemeris.dat"):
+# Data sources.
+EPHEMERIS_HOST = "cddis.gsfc.nasa.gov"
+ALMANAC_URL = "https://www.navcen.uscg.gov/?pageName=currentAlmanac&format=sem"
+
+def get_ephemeris(destination="ephemeris.dat", host=EPHEMERIS_HOST, port=21, now=None):
 	''' Download the latest GPS ephemeris file from the CDDIS's FTP server '''
+	if now == None:
+		now = datetime.datetime.utcnow()
+
 	try:
 		logging.info("Connecting to GSFC FTP Server...")
-		ftp = ftplib.FTP("cddis.gsfc.nasa.gov", timeout=10)
+		ftp = ftplib.FTP(timeout=10)
+		ftp.connect(host, port)
 		ftp.login("anonymous","anonymous")
-		ftp.cwd("gnss/data/daily/%s/brdc/" % datetime.datetime.utcnow().strftime("%Y"))
+		ftp.cwd("gnss/data/daily/%s/brdc/" % now.strftime("%Y"))
 		file_list= ftp.nlst()
 
-		# We expect the latest files to be the last in the list.
+		# Look for today's file, then yesterday's.
+		# The daily broadcast ephemeris files are named brdcDDD0.YYn.Z, where DDD is the day of year.
 		download_file = None
-		if "17n.Z" in file_list[-1]:
-			download_file = file_list[-1]
-		elif "17n.Z" in file_list[-2]:
-			download_file = file_list[-2]
-		else:
-			logging.error("Could not find appropriate ephemeris file.")
-			return None
+		for day in [now, now - datetime.timedelta(days=1)]:
+			filename = "brdc%s0.%sn.Z" % (day.strftime("%j"), day.strftime("%y"))
+			if filename in file_list:
+				download_file = filename
+				break
+
+		if download_file == None:
+			# Otherwise, we expect the latest files to be the last in the list.
+			year_suffix = "%sn.Z" % now.strftime("%y")
+			if year_suffix in file_list[-1]:
+				download_file = file_list[-1]
+			elif year_suffix in file_list[-2]:
+				download_file = file_list[-2]
+			else:
+				logging.error("Could not find appropriate ephemeris file.")
+				return None
 
 		logging.info("Downloading ephemeris data file: %s" % download_file)
 
 		# Download file.
-		f_eph = open(destination+".Z",'w')
+		f_eph = open(destination+".Z",'wb')
 		ftp.retrbinary("RETR %s" % download_file, f_eph.write)
 		f_eph.close()
 		ftp.close()
 
 		# Unzip file.
-		os.system("gunzip -q -f ./%s" % (destination+".Z"))
+		if os.system("gunzip -q -f '%s'" % (destination+".Z")) != 0:
+			logging.error("Could not decompress ephemeris file.")
+			return None
 
 		logging.info("Ephemeris downloaded to %s successfuly!" % destination)
 
@@ -47,11 +71,11 @@ def get_ephemeris(destination="ephemeris.dat"):
 		logging.error("Could not download ephemeris file.")
 		return None
 
-def get_almanac(destination="almanac.txt"):
+def get_almanac(destination="almanac.txt", url=ALMANAC_URL):
 	''' Download the latest GPS almanac file from the US Coast Guard website. '''
 	try:
-		req = urllib2.Request("https://www.navcen.uscg.gov/?pageName=currentAlmanac&format=sem")
-		res = urllib2.urlopen(req)
+		req = urllib2.Request(url)
+		res = urllib2.urlopen(req, timeout=10)
 		data = res.read()
 		if "CURRENT.ALM" in data:
 			f = open(destination,'wb')
@@ -66,6 +90,187 @@ def get_almanac(destination="almanac.txt"):
 		logging.error("Failed to download almanac data")
 		return None
 
+
+class GPSDataCache(object):
+	'''
+	Cache of GPS ephemeris and almanac files, keyed by GPS day (taken as the UTC date).
+
+	Each cached file is:
+	 - fresh, if it was downloaded on the current GPS day, within max_age seconds. It is used as-is.
+	 - usable, if it was downloaded within usable_age seconds. It is used straight away, and a newer file
+	   is downloaded in the background.
+	 - otherwise stale, and a new file must be downloaded before it can be used.
+	The background thread started by start() downloads files at startup, when they stop being fresh, and at day rollover.
+
+	clock is used in place of time.time(), and the downloader functions can be replaced, for testing.
+	'''
+
+	def __init__(self, cache_dir="gps_cache", ephemeris_max_age=2*3600, ephemeris_usable_age=12*3600,
+			almanac_max_age=24*3600, almanac_usable_age=7*24*3600, clock=time.time,
+			ephemeris_downloader=get_ephemeris, almanac_downloader=get_almanac):
+
+		self.cache_dir = cache_dir
+		self.clock = clock
+		self.downloaders = {'ephemeris': ephemeris_downloader, 'almanac': almanac_downloader}
+		self.max_age = {'ephemeris': ephemeris_max_age, 'almanac': almanac_max_age}
+		self.usable_age = {'ephemeris': ephemeris_usable_age, 'almanac': almanac_usable_age}
+		self.extensions = {'ephemeris': 'dat', 'almanac': 'txt'}
+
+		# Only run one download of each kind at a time.
+		self.locks = {'ephemeris': threading.Lock(), 'almanac': threading.Lock()}
+		self.running = False
+
+		if not os.path.isdir(self.cache_dir):
+			os.makedirs(self.cache_dir)
+
+		# Details of the cached files, keyed by kind ('ephemeris' or 'almanac'). Each entry is a dict with
+		# 'file', 'day' (GPS day, as YYYYMMDD) and 'fetched' (time of download) fields.
+		self.entries = {}
+		try:
+			f = open(os.path.join(self.cache_dir, "gps_cache.json"), 'r')
+			self.entries = json.load(f)
+			f.close()
+		except:
+			pass
+
+	def gps_day(self, timestamp=None):
+		if timestamp == None:
+			timestamp = self.clock()
+		return datetime.datetime.utcfromtimestamp(timestamp).strftime("%Y%m%d")
+
+	def state(self, kind):
+		''' Get the state of a cached file: 'fresh', 'usable', or 'stale'. '''
+		entry = self.entries.get(kind)
+		if entry == None or not os.path.isfile(entry['file']):
+			return 'stale'
+
+		age = self.clock() - entry['fetched']
+		if entry['day'] == self.gps_day() and age < self.max_age[kind]:
+			return 'fresh'
+		elif age < self.usable_age[kind]:
+			return 'usable'
+		else:
+			return 'stale'
+
+	def refresh(self, kind):
+		''' Download a new file, unless someone else already is. Returns the cached file name, or None. '''
+		if not self.locks[kind].acquire(False):
+			# A download is already in progress. Wait for it to finish.
+			self.locks[kind].acquire()
+			self.locks[kind].release()
+			return self.cached_file(kind)
+
+		try:
+			now = self.clock()
+			day = self.gps_day(now)
+			temp_file = os.path.join(self.cache_dir, "%s_download.%s" % (kind, self.extensions[kind]))
+
+			if kind == 'ephemeris':
+				result = self.downloaders[kind](destination=temp_file, now=datetime.datetime.utcfromtimestamp(now))
+			else:
+				result = self.downloaders[kind](destination=temp_file)
+
+			if result == None:
+				return self.cached_file(kind)
+
+			cached_file = os.path.join(self.cache_dir, "%s_%s.%s" % (kind, day, self.extensions[kind]))
+			shutil.move(temp_file, cached_file)
+
+			old_entry = self.entries.get(kind)
+			self.entries[kind] = {'file': cached_file, 'day': day, 'fetched': now}
+			self.write_entries()
+
+			# Clean up the previous day's file.
+			if old_entry != None and old_entry['file'] != cached_file and os.path.isfile(old_entry['file']):
+				os.remove(old_entry['file'])
+
+			return cached_file
+		finally:
+			self.locks[kind].release()
+
+	def cached_file(self, kind):
+		''' Get the cached file name, if it is usable. '''
+		if self.state(kind) == 'stale':
+			return None
+		return self.entries[kind]['file']
+
+	def write_entries(self):
+		f = open(os.path.join(self.cache_dir, "gps_cache.json"), 'w')
+		json.dump(self.entries, f)
+		f.close()
+
+	def get(self, kind):
+		''' Get a GPS data file, downloading it only if we have nothing usable. Returns the file name, or None. '''
+		state = self.state(kind)
+		if state == 'fresh':
+			return self.entries[kind]['file']
+		elif state == 'usable':
+			logging.info("Using cached %s data, and refreshing it in the background." % kind)
+			self.prefetch([kind])
+			return self.entries[kind]['file']
+		else:
+			return self.refresh(kind)
+
+	def get_ephemeris(self):
+		return self.get('ephemeris')
+
+	def get_almanac(self):
+		return self.get('almanac')
+
+	def get_gps_data(self):
+		''' Get GPS data for RS92 decoding, falling back to an almanac. Returns a (ephemeris, almanac) tuple. '''
+		ephemeris = self.get_ephemeris()
+		almanac = None
+
+		if ephemeris == None:
+			logging.error("Could not obtain ephemeris data, trying to download an almanac.")
+			almanac = self.get_almanac()
+
+		return (ephemeris, almanac)
+
+	def prefetch(self, kinds=['ephemeris', 'almanac']):
+		''' Refresh any files which are not fresh, in the background. '''
+		for kind in kinds:
+			if self.state(kind) != 'fresh' and not self.locks[kind].locked():
+				t = threading.Thread(target=self.refresh, args=(kind,))
+				t.daemon = True
+				t.start()
+
+	def next_refresh(self):
+		''' Time at which the next file will stop being fresh (either due to age, or day rollover). '''
+		now = self.clock()
+		next_day = (int(now)//86400 + 1)*86400
+		times = [next_day]
+		for (kind, entry) in self.entries.items():
+			times.append(entry['fetched'] + self.max_age[kind])
+		return max(now, min(times))
+
+	def run(self):
+		while self.running:
+			failed = False
+			for kind in ['ephemeris', 'almanac']:
+				if self.state(kind) != 'fresh':
+					self.refresh(kind)
+					failed = failed or (self.state(kind) != 'fresh')
+
+			if failed:
+				# Re-try failed downloads after a few minutes.
+				time.sleep(300)
+			else:
+				# Sleep until something needs refreshing.
+				time.sleep(min(max(self.next_refresh() - self.clock(), 1), 3600))
+
+	def start(self):
+		''' Start pre-fetching GPS data in the background. '''
+		self.running = True
+		t = threading.Thread(target=self.run)
+		t.daemon = True
+		t.start()
+
+	def close(self):
+		self.running = False
+
+
 if __name__ == "__main__":
 	logging.basicConfig(level=logging.DEBUG)
 	get_almanac()
@@ -12,6 +12,8 @@ import logging
 import time
 import traceback
 import json
+import threading
+import Queue
 from base64 import b64encode
 from hashlib import sha256
 
@@ -30,8 +32,7 @@ def crc16_ccitt(data):
 
 def telemetry_to_sentence(sonde_data, payload_callsign="RADIOSONDE"):
     # RS produces timestamps with microseconds on the end, we only want HH:MM:SS for uploading to habitat.
-    data_datetime = datetime.datetime.strptime(sonde_data['datetime_str'],"%Y-%m-%dT%H:%M:%S.%f")
-    short_time = data_datetime.strftime("%H:%M:%S")
+    short_time = sonde_data['short_time']
 
     sentence = "$$%s,%d,%s,%.5f,%.5f,%d,%.1f,%.1f,%.1f" % (payload_callsign,sonde_data['frame'],short_time,sonde_data['lat'],
         sonde_data['lon'],int(sonde_data['alt']),sonde_data['vel_h'], sonde_data['temp'], sonde_data['humidity'])
@@ -40,13 +41,13 @@ def telemetry_to_sentence(sonde_data, payload_callsign="RADIOSONDE"):
     output = sentence + "*" + checksum + "\n"
     return output
 
-def habitat_upload_payload_telemetry(telemetry, payload_callsign = "RADIOSONDE", callsign="N0CALL"):
-
-    sentence = telemetry_to_sentence(telemetry, payload_callsign = payload_callsign)
-
+def sentence_to_habitat_request(sentence, callsign="N0CALL", time_created=None):
+    """ Produce the (url, body) of a Habitat add_listener request for a telemetry sentence. """
     sentence_b64 = b64encode(sentence)
 
     date = datetime.datetime.utcnow().isoformat("T") + "Z"
+    if time_created == None:
+        time_created = date
 
     data = {
         "type": "payload_telemetry",
@@ -55,17 +56,28 @@ def habitat_upload_payload_telemetry(telemetry, payload_callsign = "RADIOSONDE",
             },
         "receivers": {
             callsign: {
-                "time_created": date,
+                "time_created": time_created,
                 "time_uploaded": date,
                 },
             },
     }
+
+    url = "/habitat/_design/payload_telemetry/_update/add_listener/%s" % sha256(sentence_b64).hexdigest()
+
+    return (url, json.dumps(data))
+
+def habitat_upload_payload_telemetry(telemetry, payload_callsign = "RADIOSONDE", callsign="N0CALL"):
+
+    sentence = telemetry_to_sentence(telemetry, payload_callsign = payload_callsign)
+
+    (url, body) = sentence_to_habitat_request(sentence, callsign=callsign)
+
     try:
         c = httplib.HTTPConnection("habitat.habhub.org",timeout=4)
         c.request(
             "PUT",
-            "/habitat/_design/payload_telemetry/_update/add_listener/%s" % sha256(sentence_b64).hexdigest(),
-            json.dumps(data),  # BODY
+            url,
+            body,  # BODY
             {"Content-Type": "application/json"}  # HEADERS
             )
 
@@ -76,6 +88,116 @@ def habitat_upload_payload_telemetry(telemetry, payload_callsign = "RADIOSONDE",
         logging.error("Failed to upload to Habitat: %s" % (str(e)))
         return
 
+
+class HabitatUploader(object):
+    """
+    Upload telemetry to Habitat from a dedicated worker thread, over a persistent HTTP connection.
+
+    Sentences are added to a bounded queue with add(), so a slow Habitat server never blocks the caller.
+    If the queue fills up, the oldest sentence is dropped. When the worker falls behind, it takes every
+    queued sentence and uploads them back-to-back over the same connection. Habitat's add_listener update
+    handler only accepts one sentence per request, so this avoids a new connection per sentence but still
+    makes one request each. Failed uploads are retried with an exponential backoff.
+    """
+
+    def __init__(self, payload_callsign="RADIOSONDE", callsign="N0CALL", host="habitat.habhub.org", port=80,
+        timeout=4, queue_size=32, max_retries=3, retry_delay=2):
+        self.payload_callsign = payload_callsign
+        self.callsign = callsign
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self.queue = Queue.Queue(queue_size)
+        self.conn = None
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, telemetry):
+        """ Queue a telemetry frame for upload. Returns immediately. """
+        sentence = telemetry_to_sentence(telemetry, payload_callsign=self.payload_callsign)
+        time_created = datetime.datetime.utcnow().isoformat("T") + "Z"
+
+        while True:
+            try:
+                self.queue.put_nowait((sentence, time_created))
+                return
+            except Queue.Full:
+                # Drop the oldest sentence to make room.
+                try:
+                    self.queue.get_nowait()
+                    logging.warning("Habitat upload queue full, dropped oldest sentence.")
+                except Queue.Empty:
+                    pass
+
+    def upload(self, sentence, time_created=None):
+        """ Upload a single sentence over the persistent connection. Raises an exception on failure. """
+        (url, body) = sentence_to_habitat_request(sentence, callsign=self.callsign, time_created=time_created)
+
+        if self.conn == None:
+            self.conn = httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+        try:
+            self.conn.request("PUT", url, body, {"Content-Type": "application/json"})
+            response = self.conn.getresponse()
+            # The response must be read in full before the connection can be re-used.
+            response.read()
+        except:
+            # Drop the connection, so we start afresh on the next attempt.
+            self.conn.close()
+            self.conn = None
+            raise
+
+        if response.status >= 500 or response.status == 409:
+            # Server error, or a conflicting update from another listener - both worth retrying.
+            raise IOError("HTTP %d %s" % (response.status, response.reason))
+
+        logging.info("Telemetry uploaded to Habitat: %s" % sentence.strip())
+
+    def run(self):
+        while self.running:
+            # Block until a sentence is available. None is used to wake us up at shutdown.
+            item = self.queue.get()
+            if item == None:
+                continue
+
+            batch = [item]
+            while not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item != None:
+                    batch.append(item)
+
+            if len(batch) > 1:
+                logging.debug("Habitat upload falling behind, uploading %d queued sentences." % len(batch))
+
+            for (sentence, time_created) in batch:
+                delay = self.retry_delay
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self.upload(sentence, time_created=time_created)
+                        break
+                    except Exception as e:
+                        if attempt == self.max_retries:
+                            logging.error("Failed to upload to Habitat: %s" % (str(e)))
+                        else:
+                            time.sleep(delay)
+                            delay *= 2
+
+        if self.conn != None:
+            self.conn.close()
+
+    def close(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except Queue.Full:
+            pass
+
 #
 # Functions for uploading a listener position to Habitat.
 # from https://raw.githubusercontent.com/rossengeorgiev/hab-tools/master/spot2habitat_chase.py
@@ -84,6 +206,13 @@ callsign_init = False
 url_habitat_uuids = "http://habitat.habhub.org/_uuids?count=%d"
 url_habitat_db = "http://habitat.habhub.org/habitat/"
 uuids = []
+uuids_lock = threading.Lock()
+uuids_fetching = False
+
+# Fetch UUIDs in batches of this size, and start fetching more in the background when we have fewer than
+# UUID_LOW_WATER left, so posting listener data does not need to wait for a UUID request.
+UUID_BATCH = 50
+UUID_LOW_WATER = 5
 
 def ISOStringNow():
     return "%sZ" % datetime.datetime.utcnow().isoformat()
@@ -96,7 +225,13 @@ def postListenerData(doc):
         fetchUuids()
 
     # add uuid and uploade time
-    doc['_id'] = uuids.pop()
+    with uuids_lock:
+        doc['_id'] = uuids.pop()
+
+    # Top up the UUID list in the background, if we are running low.
+    if len(uuids) < UUID_LOW_WATER:
+        prefetchUuids()
+
     doc['time_uploaded'] = ISOStringNow()
 
     data = json.dumps(doc)
@@ -108,20 +243,43 @@ def postListenerData(doc):
     req = urllib2.Request(url_habitat_db, data, headers)
     return urllib2.urlopen(req).read()
 
-def fetchUuids():
+def fetchUuids(count=UUID_BATCH):
     global uuids, url_habitat_uuids
     while True:
         try:
-            resp = urllib2.urlopen(url_habitat_uuids % 10).read()
+            resp = urllib2.urlopen(url_habitat_uuids % count).read()
             data = json.loads(resp)
         except urllib2.HTTPError, e:
             logging.error("Habitat Listener: Unable to fetch UUIDs, retrying in 10 seconds.")
             time.sleep(10)
             continue
 
-        uuids.extend(data['uuids'])
+        with uuids_lock:
+            uuids.extend(data['uuids'])
         break;
 
+def prefetchUuids():
+    """ Fetch a batch of UUIDs in a background thread, if a fetch is not already running. """
+    global uuids_fetching
+
+    with uuids_lock:
+        if uuids_fetching:
+            return
+        uuids_fetching = True
+
+    def _fetch():
+        global uuids_fetching
+        try:
+            fetchUuids()
+        except Exception as e:
+            logging.error("Habitat Listener: Unable to pre-fetch UUIDs: %s" % str(e))
+        finally:
+            uuids_fetching = False
+
+    t = threading.Thread(target=_fetch)
+    t.daemon = True
+    t.start()
+
 
 def initListenerCallsign(callsign):
     doc = {
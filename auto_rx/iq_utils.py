@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - IQ Sample Sources
+#
+# Long-lived sources of raw IQ samples, used by the in-process spectrum scanner.
+# All sources provide the same interface:
+#   source.sample_rate  - Sample rate, in Hz.
+#   source.tune(freq)   - Re-tune the source to a new centre frequency (Hz).
+#   source.read(n)      - Read n complex samples, as a complex64 numpy array.
+#   source.close()      - Release the source.
+#
+import errno
+import logging
+import os
+import signal
+import socket
+import struct
+import subprocess
+import time
+import numpy as np
+
+# rtl_tcp command codes (from rtl_tcp.c)
+RTL_TCP_SET_FREQ = 0x01
+RTL_TCP_SET_SAMPLE_RATE = 0x02
+RTL_TCP_SET_GAIN_MODE = 0x03
+RTL_TCP_SET_GAIN = 0x04
+RTL_TCP_SET_FREQ_CORRECTION = 0x05
+RTL_TCP_SET_BIAS_TEE = 0x0e
+
+# rtl_tcp socket timeout (seconds).
+RTL_TCP_TIMEOUT = 5
+# rtl_tcp streams whether or not we read, so after this long (seconds) without a read, the backlog is discarded.
+RTL_TCP_IDLE_TIME = 0.5
+
+
+def cu8_to_complex(data):
+    """ Convert interleaved unsigned 8-bit IQ (as produced by rtl_sdr / rtl_tcp) to complex64 """
+    samples = np.frombuffer(data, dtype=np.uint8).astype(np.float32)
+    samples = (samples - 127.5)/127.5
+    return samples.view(np.complex64)
+
+
+def cf32_to_complex(data):
+    """ Convert interleaved 32-bit float IQ to complex64 """
+    return np.frombuffer(data, dtype=np.complex64)
+
+
+class IQFileSource(object):
+    """
+    Replay IQ samples from a file or FIFO, for testing the scanner without hardware.
+
+    Re-tuning only updates the reported centre frequency - the recorded samples are replayed as-is.
+    If loop is set, the file is re-opened when we hit the end of it.
+    """
+
+    def __init__(self, filename, sample_rate=2048000, fmt='cu8', loop=True):
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.loop = loop
+        self.center_freq = 0
+
+        if fmt == 'cu8':
+            self.bytes_per_sample = 2
+            self.convert = cu8_to_complex
+        elif fmt == 'cf32':
+            self.bytes_per_sample = 8
+            self.convert = cf32_to_complex
+        else:
+            raise ValueError("Unknown IQ format: %s" % fmt)
+
+        self.f = open(self.filename, 'rb')
+
+    def tune(self, freq):
+        self.center_freq = freq
+
+    def read(self, n):
+        data = self.f.read(n*self.bytes_per_sample)
+
+        while len(data) < n*self.bytes_per_sample:
+            if not self.loop:
+                raise EOFError("End of IQ file reached.")
+            self.f.close()
+            self.f = open(self.filename, 'rb')
+            chunk = self.f.read(n*self.bytes_per_sample - len(data))
+            if len(chunk) == 0:
+                raise EOFError("IQ file is empty.")
+            data += chunk
+
+        return self.convert(data)
+
+    def close(self):
+        self.f.close()
+
+
+class RTLTCPSource(object):
+    """
+    Stream IQ samples from a rtl_tcp server, re-tuning via the rtl_tcp command channel.
+
+    If start_server is set, a local rtl_tcp process is started and kept running until close() is called,
+    so the RTLSDR is only opened once for any number of scans.
+
+    rtl_tcp keeps streaming whether or not we read, and the samples queue up in its buffers and the socket's.
+    That backlog is discarded on each re-tune, and before reading after an idle gap, so reads always
+    return current samples.
+    """
+
+    def __init__(self, hostname='127.0.0.1', port=1234, sample_rate=2048000, ppm=0, gain=-1, bias=False,
+                start_server=True, settle_time=0.1):
+        self.hostname = hostname
+        self.port = port
+        self.sample_rate = sample_rate
+        self.settle_time = settle_time
+        self.center_freq = 0
+        self.server = None
+        self.last_read = time.time()
+
+        if start_server:
+            server_cmd = ['rtl_tcp', '-a', hostname, '-p', str(port), '-s', str(int(sample_rate))]
+            logging.debug("Starting rtl_tcp: %s" % " ".join(server_cmd))
+            self.server = subprocess.Popen(server_cmd, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+
+        self.sock = self._connect()
+
+        # rtl_tcp sends a 12 byte 'dongle info' header on connection. We don't use it.
+        self._recv_exact(12)
+
+        self._command(RTL_TCP_SET_SAMPLE_RATE, int(sample_rate))
+        self._command(RTL_TCP_SET_FREQ_CORRECTION, int(ppm))
+        if gain == -1:
+            self._command(RTL_TCP_SET_GAIN_MODE, 0)
+        else:
+            self._command(RTL_TCP_SET_GAIN_MODE, 1)
+            self._command(RTL_TCP_SET_GAIN, int(gain*10))
+        self._command(RTL_TCP_SET_BIAS_TEE, 1 if bias else 0)
+
+    def _connect(self, attempts=10):
+        """ Connect to the rtl_tcp server, allowing for it taking a moment to start up. """
+        for i in range(attempts):
+            try:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.connect((self.hostname, self.port))
+                s.settimeout(RTL_TCP_TIMEOUT)
+                return s
+            except socket.error:
+                s.close()
+                time.sleep(0.5)
+
+        self.close()
+        raise IOError("Could not connect to rtl_tcp at %s:%d" % (self.hostname, self.port))
+
+    def _command(self, cmd, param):
+        self.sock.sendall(struct.pack('>BI', cmd, param & 0xFFFFFFFF))
+
+    def _recv_exact(self, nbytes):
+        buf = bytearray(nbytes)
+        view = memoryview(buf)
+        pos = 0
+        while pos < nbytes:
+            n = self.sock.recv_into(view[pos:], nbytes - pos)
+            if n == 0:
+                raise IOError("rtl_tcp connection closed.")
+            pos += n
+        return buf
+
+    def _drain(self):
+        """ Discard everything already queued on the socket, keeping the stream aligned to whole IQ samples.
+        Returns the number of bytes discarded. """
+        discarded = 0
+        self.sock.setblocking(0)
+        try:
+            while True:
+                try:
+                    data = self.sock.recv(65536)
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    raise
+                if len(data) == 0:
+                    raise IOError("rtl_tcp connection closed.")
+                discarded += len(data)
+        finally:
+            self.sock.settimeout(RTL_TCP_TIMEOUT)
+
+        if discarded % 2:
+            self._recv_exact(1)
+            discarded += 1
+        return discarded
+
+    def tune(self, freq):
+        self.center_freq = freq
+        self._command(RTL_TCP_SET_FREQ, int(freq))
+        # Discard the backlog (all captured on the previous frequency, or while re-tuning),
+        # then the samples captured shortly after the tuner re-tuned.
+        discarded = self._drain()
+        logging.debug("rtl_tcp: Discarded %d queued samples on re-tune." % (discarded//2))
+        self._recv_exact(2*int(self.sample_rate*self.settle_time))
+        self.last_read = time.time()
+
+    def read(self, n):
+        if time.time() - self.last_read > RTL_TCP_IDLE_TIME:
+            discarded = self._drain()
+            logging.debug("rtl_tcp: Discarded %d samples queued while idle." % (discarded//2))
+        data = self._recv_exact(2*n)
+        self.last_read = time.time()
+        return cu8_to_complex(data)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except:
+            pass
+
+        if self.server != None:
+            try:
+                os.killpg(os.getpgid(self.server.pid), signal.SIGTERM)
+                self.server.wait()
+            except:
+                pass
+            self.server = None
+
+
+class RTLSDRSource(object):
+    """
+    Capture IQ samples using rtl_sdr. As rtl_sdr cannot be re-tuned while running, tune() (re)starts it.
+    This is used for one-off wideband captures when the in-process scanner is not in use.
+    """
+
+    def __init__(self, sample_rate=2048000, ppm=0, gain=-1, bias=False):
+        self.sample_rate = sample_rate
+        self.ppm = ppm
+        self.gain = gain
+        self.bias = bias
+        self.center_freq = 0
+        self.rx = None
+
+    def tune(self, freq):
+        self.close()
+        self.center_freq = freq
+
+        rx_cmd = ['rtl_sdr', '-f', str(int(freq)), '-s', str(int(self.sample_rate)), '-p', str(int(self.ppm))]
+        if self.gain != -1:
+            rx_cmd += ['-g', '%.1f' % self.gain]
+        if self.bias:
+            rx_cmd += ['-T']
+        rx_cmd += ['-']
+
+        logging.debug("Running command: %s" % " ".join(rx_cmd))
+        self.rx = subprocess.Popen(rx_cmd, stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'), preexec_fn=os.setsid)
+
+    def read(self, n):
+        data = self.rx.stdout.read(2*n)
+        if len(data) < 2*n:
+            raise EOFError("rtl_sdr exited.")
+        return cu8_to_complex(data)
+
+    def close(self):
+        if self.rx != None:
+            try:
+                os.killpg(os.getpgid(self.rx.pid), signal.SIGTERM)
+                self.rx.wait()
+            except:
+                pass
+            self.rx = None
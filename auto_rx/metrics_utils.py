@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Metrics
+#
+# Counters, gauges and histograms describing the health of a station (frame rates, decode quality,
+# scan and detection times, output latency and queue depths). These can be scraped from a local HTTP
+# endpoint in the Prometheus text format, and are summarised in the log file every so often.
+#
+# Updating a metric is a lock and an addition, so metrics can be updated on every telemetry frame.
+# (The locks are acquired and released explicitly, as this is quicker than a with statement.)
+#
+import bisect
+import logging
+import threading
+import time
+import traceback
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+# Default histogram buckets (seconds), suitable for timing anything from frame handling to a network upload.
+DEFAULT_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter(object):
+    """ A value which only ever increases. """
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        self.lock.acquire()
+        self.value += amount
+        self.lock.release()
+
+    def samples(self, name):
+        return [(name, (), self.value)]
+
+
+class Gauge(object):
+    """ A value which can go up and down. """
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.lock.acquire()
+        self.value += amount
+        self.lock.release()
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self, name):
+        return [(name, (), self.value)]
+
+
+class Histogram(object):
+    """ Counts of observed values (i.e. durations) falling into a set of buckets, along with their sum. """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Non-cumulative counts for each bucket, plus one for values above the largest bucket.
+        self.counts = [0]*(len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        # Buckets are upper bounds, inclusive of the bound.
+        index = bisect.bisect_left(self.buckets, value)
+        self.lock.acquire()
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+        self.lock.release()
+
+    def samples(self, name):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+            count = self.count
+
+        samples = []
+        cumulative = 0
+        for (bound, bucket_count) in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            samples.append((name + '_bucket', (('le', format_value(bound)),), cumulative))
+        samples.append((name + '_sum', (), total))
+        samples.append((name + '_count', (), count))
+        return samples
+
+
+class MetricFamily(object):
+    """ A set of metrics of one type, sharing a name, and distinguished by the values of their labels. """
+
+    def __init__(self, name, help, metric_type, metric_class, labelnames, **kwargs):
+        self.name = name
+        self.help = help
+        self.type = metric_type
+        self.metric_class = metric_class
+        self.labelnames = tuple(labelnames)
+        self.kwargs = kwargs
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        """ Get the metric for a set of label values, creating it if required. """
+        try:
+            return self.children[values]
+        except KeyError:
+            if len(values) != len(self.labelnames):
+                raise ValueError("%s expects labels %s" % (self.name, str(self.labelnames)))
+            with self.lock:
+                return self.children.setdefault(values, self.metric_class(**self.kwargs))
+
+    def samples(self):
+        samples = []
+        for (values, child) in sorted(self.children.items()):
+            labels = tuple(zip(self.labelnames, values))
+            for (name, extra_labels, value) in child.samples(self.name):
+                samples.append((name, labels + extra_labels, value))
+        return samples
+
+    def totals(self):
+        """ Get the total (and count, for histograms) across all label values, for the log summary. """
+        if self.type == 'histogram':
+            return (sum([c.sum for c in self.children.values()]), sum([c.count for c in self.children.values()]))
+        return (sum([c.value for c in self.children.values()]), None)
+
+
+class MetricsRegistry(object):
+    """
+    The set of all metrics.
+
+    counter(), gauge() and histogram() return the metric itself if no labelnames are given, otherwise
+    a MetricFamily, from which the metric for each set of label values is obtained with labels().
+    Values which are already tracked elsewhere (i.e. the output statistics) can be added at collection
+    time with add_collector(). A collector returns a list of (name, help, type, samples) tuples, where
+    samples is a list of (labels dict, value) tuples.
+    """
+
+    def __init__(self):
+        self.families = []
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def _add(self, name, help, metric_type, metric_class, labelnames, **kwargs):
+        family = MetricFamily(name, help, metric_type, metric_class, labelnames, **kwargs)
+        with self.lock:
+            self.families.append(family)
+        return family if len(labelnames) > 0 else family.labels()
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(name, help, 'counter', Counter, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(name, help, 'gauge', Gauge, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(name, help, 'histogram', Histogram, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        with self.lock:
+            self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self.lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def collect(self):
+        """ Get every metric, as a list of (name, help, type, samples) tuples, where samples are (name, labels, value) tuples. """
+        with self.lock:
+            families = list(self.families)
+            collectors = list(self.collectors)
+
+        metrics = [(f.name, f.help, f.type, f.samples()) for f in families]
+        for collector in collectors:
+            try:
+                for (name, help, metric_type, samples) in collector():
+                    metrics.append((name, help, metric_type, [(name, tuple(sorted(labels.items())), value) for (labels, value) in samples]))
+            except:
+                logging.error("Metrics - Collector failed: %s" % traceback.format_exc())
+        return metrics
+
+    def render(self):
+        """ Render every metric in the Prometheus text exposition format. """
+        lines = []
+        for (name, help, metric_type, samples) in self.collect():
+            lines.append("# HELP %s %s" % (name, help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            for (sample_name, labels, value) in samples:
+                if len(labels) > 0:
+                    label_str = ','.join(['%s="%s"' % (k, escape_label(v)) for (k, v) in labels])
+                    lines.append("%s{%s} %s" % (sample_name, label_str, format_value(value)))
+                else:
+                    lines.append("%s %s" % (sample_name, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, previous=None, interval=None):
+        """
+        Produce a short summary of the metrics, for the log file. Counter rates are calculated from the counter
+        totals in previous (as returned by totals()), over interval seconds.
+        """
+        parts = []
+        for family in list(self.families):
+            if len(family.children) == 0:
+                continue
+            (total, count) = family.totals()
+            name = family.name.replace('auto_rx_', '')
+            if family.type == 'histogram':
+                if count > 0:
+                    parts.append("%s: %d (avg %.3g)" % (name, count, total/count))
+            elif family.type == 'counter' and previous != None and interval:
+                rate = (total - previous.get(family.name, 0))/float(interval)
+                parts.append("%s: %s (%.2f/s)" % (name, format_value(total), rate))
+            else:
+                parts.append("%s: %s" % (name, format_value(total)))
+        return ', '.join(parts)
+
+    def totals(self):
+        """ Get the counter totals, for calculating rates in the next summary. """
+        return dict([(f.name, f.totals()[0]) for f in list(self.families) if f.type == 'counter'])
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    elif value == float('-inf'):
+        return '-Inf'
+    elif isinstance(value, bool):
+        return '1' if value else '0'
+    elif isinstance(value, (int, long)):
+        return str(value)
+    return repr(float(value))
+
+
+# The metrics registry used throughout auto_rx.
+METRICS = MetricsRegistry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Serve the metrics at /metrics. """
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Don't log every scrape.
+        pass
+
+
+class MetricsServer(object):
+    """ HTTP server for the metrics, running in its own thread. """
+
+    def __init__(self, host='127.0.0.1', port=9110, registry=METRICS):
+        self.server = HTTPServer((host, port), MetricsHandler)
+        self.server.registry = registry
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        logging.info("Metrics - Serving metrics on http://%s:%d/metrics" % (host, self.server.server_address[1]))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsLogger(object):
+    """ Log a summary of the metrics every interval seconds. """
+
+    def __init__(self, interval=300, registry=METRICS):
+        self.interval = interval
+        self.registry = registry
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        previous = self.registry.totals()
+        last_time = time.time()
+        while self.running:
+            time.sleep(self.interval)
+            if not self.running:
+                break
+            now = time.time()
+            logging.info("Metrics - %s" % self.registry.summary(previous, now - last_time))
+            previous = self.registry.totals()
+            last_time = now
+
+    def close(self):
+        self.running = False
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Multi-Sonde Wideband Receiver
+#
+# Receives a single wideband IQ stream, and splits it into a FM channel per radiosonde,
+# each of which feeds its own decoder process. The stream is periodically searched for
+# new signals, which are tested with rs_detect and added as decoder channels if a supported
+# sonde is found. Channels are dropped when their decoder stops producing telemetry.
+#
+import logging
+import os
+import signal
+import subprocess
+import time
+import traceback
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from pipe_utils import PipeLineReader
+from channel_utils import Channelizer
+from detect_utils import rs_detect_audio, DC_CLEARANCE
+from peak_utils import detect_peaks_cfar
+
+# Channel bandwidths (and audio rates) used for each sonde type, matching the rtl_fm settings used in auto_rx.py
+CHANNEL_BANDWIDTHS = {
+    'RS41': 15000,
+    'RS92': 12000
+}
+
+
+def decoder_command(sonde_type, ephemeris=None, almanac=None):
+    """ Get the decoder command line for a sonde type. The decoder reads a WAV stream on stdin, unless --s16 is added. """
+    if sonde_type == 'RS41':
+        return "./rs41ecc --crc --ecc"
+    elif sonde_type == 'RS92':
+        if ephemeris != None:
+            return "./rs92ecc -v --crc --ecc --vel -e %s" % ephemeris
+        elif almanac != None:
+            return "./rs92ecc -v --crc --ecc --vel -a %s" % almanac
+    return None
+
+
+class DecoderChannel(object):
+    """ A decoder process, fed with raw int16 audio from a single channel of the wideband receiver. """
+
+    def __init__(self, freq, sonde_type, decoder_cmd, audio_rate):
+        self.freq = freq
+        self.sonde_type = sonde_type
+        self.last_line = time.time()
+
+        # As with the rtl_fm pipelines, the decoder reads raw audio at the channel's native rate.
+        decoder_cmd += " --s16 %d" % int(round(audio_rate))
+
+        logging.debug("Running command: %s" % decoder_cmd)
+        self.rx = subprocess.Popen(decoder_cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, preexec_fn=os.setsid)
+        self.rx_stdout = PipeLineReader(self.rx.stdout)
+
+    def write(self, audio):
+        """ Write a block of int16 audio to the decoder. Returns False if the decoder has exited. """
+        try:
+            self.rx.stdin.write(audio.astype('<i2').tostring())
+            return True
+        except IOError:
+            return False
+
+    def readlines(self):
+        """ Get any available lines of decoder output, without blocking. """
+        lines = self.rx_stdout.readlines(timeout=0)
+        if len(lines) > 0:
+            self.last_line = time.time()
+        return lines
+
+    def close(self):
+        try:
+            self.rx.stdin.close()
+        except:
+            pass
+        try:
+            os.killpg(os.getpgid(self.rx.pid), signal.SIGTERM)
+            self.rx.wait()
+        except:
+            pass
+        self.rx.stdout.close()
+
+
+class WidebandReceiver(object):
+    """
+    Decode multiple radiosondes concurrently from a single wideband IQ source.
+
+    Decoded telemetry lines are passed to line_callback(line, frequency, sonde_type).
+    get_gps_data is called (in a worker thread) before starting a RS92 decoder, and should return
+    a (ephemeris, almanac) tuple, either of which may be None.
+    """
+
+    def __init__(self, source, center_freq, line_callback, config, get_gps_data=None, block_size=65536, usable_bw=0.8, search_time=2.0):
+        self.source = source
+        self.center_freq = center_freq
+        self.line_callback = line_callback
+        self.config = config
+        self.get_gps_data = get_gps_data
+        self.block_size = block_size
+        self.running = True
+
+        self.channelizer = Channelizer(center_freq, source.sample_rate)
+
+        # Signals within this range of the centre frequency can be received.
+        self.max_offset = source.sample_rate*usable_bw/2.0
+
+        # Active decoder channels, keyed by frequency.
+        self.decoders = {}
+        # Channels currently being tested with rs_detect, keyed by frequency, holding lists of audio blocks.
+        self.probes = {}
+        self.probe_start = 0
+
+        # Detection (and RS92 GPS data download) is run in the background, so we don't stall the IQ stream.
+        # Outstanding detections are held as (frequency, AsyncResult) tuples.
+        self.pool = ThreadPool(processes=4)
+        self.pending = []
+
+        # Spectrum accumulation for the in-stream search.
+        self.fft_size = int(2**np.ceil(np.log2(source.sample_rate/float(config['search_step']))))
+        self.freq_step = source.sample_rate/float(self.fft_size)
+        self.window = np.hanning(self.fft_size).astype(np.float32)
+        self.spectrum = None
+        self.spectrum_count = 0
+        self.search_time = search_time
+        self.next_search = time.time()
+
+    def search_block(self, block):
+        """ Accumulate a block of IQ into the search spectrum. """
+        n = len(block)//self.fft_size
+        spectra = np.fft.fft(block[:n*self.fft_size].reshape((n, self.fft_size))*self.window, axis=1)
+        power = np.sum(spectra.real**2 + spectra.imag**2, axis=0)
+        if self.spectrum is None:
+            self.spectrum = power
+        else:
+            self.spectrum += power
+        self.spectrum_count += n
+
+    def search_peaks(self):
+        """ Find peaks in the accumulated spectrum, and start testing any new ones. """
+        power = 10*np.log10(np.fft.fftshift(self.spectrum)/self.spectrum_count + 1e-20)
+        freq = self.center_freq + (np.arange(self.fft_size) - self.fft_size//2)*self.freq_step
+        self.spectrum = None
+        self.spectrum_count = 0
+
+        # Only consider the usable part of the spectrum.
+        in_range = (np.abs(freq - self.center_freq) < self.max_offset) & \
+            (freq >= self.config['min_freq']*1e6) & (freq <= self.config['max_freq']*1e6)
+        freq = freq[in_range]
+        power = power[in_range]
+
+        (peak_indices, peak_snrs) = detect_peaks_cfar(power, min_snr=self.config['min_snr'],
+            min_distance=self.config['min_distance']/self.freq_step, noise_window=self.config['noise_floor_window']/self.freq_step)
+
+        if len(peak_indices) == 0:
+            return
+
+        # Sort peaks by SNR, so the strongest of a cluster of peaks from one signal is tested first.
+        peak_frequencies = freq[peak_indices][np.argsort(peak_snrs)][::-1]
+        peak_frequencies = np.round(peak_frequencies/self.config['quantization'])*self.config['quantization']
+
+        for peak in peak_frequencies:
+            # Skip anything we are already decoding or testing.
+            if self.in_use(peak):
+                continue
+
+            # Skip the RTLSDR's DC spike, and anything sitting on it.
+            if abs(peak - self.center_freq) < DC_CLEARANCE:
+                logging.debug("Wideband RX - Skipping signal on %.3f MHz, too close to the centre frequency." % (peak/1e6))
+                continue
+
+            logging.info("Wideband RX - Testing new signal on %.3f MHz" % (peak/1e6))
+            self.channelizer.add_channel(peak)
+            self.probes[peak] = []
+
+        self.probe_start = time.time()
+
+    def in_use(self, freq):
+        """ Check if a frequency is within a channel bandwidth of a frequency we are decoding or testing. """
+        guard = max(CHANNEL_BANDWIDTHS.values())
+        active = self.decoders.keys() + self.probes.keys() + [f for (f, r) in self.pending]
+        return any([abs(freq - f) <= guard for f in active])
+
+    def check_probes(self):
+        """ Once we have dwell_time seconds of audio from each probe channel, run rs_detect on them. """
+        if len(self.probes) == 0 or (time.time() - self.probe_start) < self.config['dwell_time']:
+            return
+
+        for freq in self.probes.keys():
+            channel = self.channelizer.channels[freq]
+            audio = np.concatenate(self.probes.pop(freq))
+            self.channelizer.remove_channel(freq)
+            self.pending.append((freq, self.pool.apply_async(self.detect_and_prepare, (freq, audio, channel.audio_rate))))
+
+    def detect_and_prepare(self, freq, audio, audio_rate):
+        """ Run in a worker thread. Returns (freq, sonde_type, decoder_cmd) """
+        (sonde_type, confidence) = rs_detect_audio(audio, audio_rate)
+
+        if sonde_type not in CHANNEL_BANDWIDTHS:
+            if sonde_type != None:
+                logging.info("Wideband RX - Detected a %s on %.3f MHz (Unsupported)" % (sonde_type, freq/1e6))
+            return (freq, None, None)
+
+        logging.info("Wideband RX - Detected a %s on %.3f MHz! (Confidence %.2f)" % (sonde_type, freq/1e6, confidence))
+
+        (ephemeris, almanac) = (None, None)
+        if sonde_type == 'RS92' and self.get_gps_data != None:
+            (ephemeris, almanac) = self.get_gps_data()
+            if ephemeris == None and almanac == None:
+                logging.critical("Wideband RX - Could not obtain GPS ephemeris or almanac data.")
+                return (freq, None, None)
+
+        return (freq, sonde_type, decoder_command(sonde_type, ephemeris=ephemeris, almanac=almanac))
+
+    def check_pending(self):
+        """ Start decoders for any completed detections. """
+        for (pending_freq, result) in [p for p in self.pending if p[1].ready()]:
+            self.pending.remove((pending_freq, result))
+            try:
+                (freq, sonde_type, decoder_cmd) = result.get()
+            except:
+                logging.error("Wideband RX - Detection failed: %s" % traceback.format_exc())
+                continue
+
+            if sonde_type == None or self.in_use(freq):
+                continue
+
+            channel = self.channelizer.add_channel(freq, bandwidth=CHANNEL_BANDWIDTHS[sonde_type], audio_rate=CHANNEL_BANDWIDTHS[sonde_type])
+            self.decoders[freq] = DecoderChannel(freq, sonde_type, decoder_cmd, channel.audio_rate)
+            logging.info("Wideband RX - Started decoding %s on %.3f MHz (%d active)." % (sonde_type, freq/1e6, len(self.decoders)))
+
+    def drop_decoder(self, freq):
+        self.decoders.pop(freq).close()
+        self.channelizer.remove_channel(freq)
+
+    def run(self, stop_time=None):
+        """ Receive until stop() is called, or until stop_time (if provided). """
+        self.source.tune(self.center_freq)
+
+        while self.running and (stop_time == None or time.time() < stop_time):
+            block = self.source.read(self.block_size)
+
+            # Run the in-stream search, if it is due. We accumulate search_time seconds of spectrum.
+            if time.time() >= self.next_search:
+                self.search_block(block)
+                if self.spectrum_count*self.fft_size >= self.search_time*self.source.sample_rate:
+                    self.search_peaks()
+                    self.next_search = time.time() + self.config['search_delay']
+
+            for freq, audio in self.channelizer.process(block).items():
+                if freq in self.probes:
+                    self.probes[freq].append(audio)
+                elif freq in self.decoders:
+                    if not self.decoders[freq].write(audio):
+                        logging.error("Wideband RX - Decoder on %.3f MHz exited." % (freq/1e6))
+                        self.drop_decoder(freq)
+
+            self.check_probes()
+            self.check_pending()
+
+            # Handle decoder output, and drop any decoders that have stopped producing telemetry.
+            for freq in self.decoders.keys():
+                decoder = self.decoders[freq]
+                for line in decoder.readlines():
+                    if (line != None) and (line != ""):
+                        try:
+                            self.line_callback(line, freq, decoder.sonde_type)
+                        except:
+                            traceback.print_exc()
+                            logging.error("Error parsing line: %s" % line)
+
+                if time.time() > (decoder.last_line + self.config['rx_timeout']):
+                    logging.error("Wideband RX - %s on %.3f MHz timed out." % (decoder.sonde_type, freq/1e6))
+                    self.drop_decoder(freq)
+
+        self.close()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        for freq in self.decoders.keys():
+            self.drop_decoder(freq)
+        self.pool.close()
+        self.source.close()
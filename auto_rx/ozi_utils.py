@@ -1,5 +1,6 @@
 # OziPlotter push utils for Sonde auto RX.
 
+import logging
 import socket
 import json
 
@@ -8,9 +9,71 @@ import json
 HORUS_UDP_PORT = 55672
 HORUS_OZIPLOTTER_PORT = 8942
 
-# Send an update on the core payload telemetry statistics into the network via UDP broadcast.
-# This can be used by other devices hanging off the network to display vital stats about the payload.
-def send_payload_summary(callsign, latitude, longitude, altitude, packet_time, speed=-1, heading=-1, udp_port = HORUS_UDP_PORT):
+
+def parse_udp_targets(hosts, default_port):
+    """ Parse a comma separated list of hosts (each optionally with a :port suffix) into a list of (host, port) tuples. """
+    targets = []
+    for host in hosts.split(','):
+        host = host.strip()
+        if host == '':
+            continue
+        if ':' in host:
+            (host, port) = host.rsplit(':', 1)
+            targets.append((host, int(port)))
+        else:
+            targets.append((host, default_port))
+    return targets
+
+
+class UDPOutput(object):
+    """
+    A UDP socket which is created once and re-used, sending each packet to one or more (host, port) targets.
+    A target host of '<broadcast>' requires broadcast to be enabled. If a broadcast fails (i.e. we have no network),
+    the packet is sent to localhost instead. If bind_port is provided, packets are sent from that port.
+    """
+
+    def __init__(self, targets, broadcast=False, bind_port=None):
+        self.targets = targets
+
+        self.sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+        self.sock.settimeout(1)
+        if broadcast:
+            self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
+
+        if bind_port != None:
+            # Allow re-use of the address, so other applications can also send from this port.
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except:
+                pass
+            try:
+                self.sock.bind(('',bind_port))
+            except socket.error as e:
+                logging.error("Could not bind to UDP port %d: %s" % (bind_port, str(e)))
+
+    def send(self, packet):
+        """ Send a packet to all targets. Returns the number of targets the packet was sent to. """
+        sent = 0
+        for (host, port) in self.targets:
+            try:
+                try:
+                    self.sock.sendto(packet, (host, port))
+                except socket.error:
+                    if host != '<broadcast>':
+                        raise
+                    self.sock.sendto(packet, ('127.0.0.1', port))
+                sent += 1
+            except Exception as e:
+                logging.error("Failed to send UDP packet to %s:%d: %s" % (host, port, str(e)))
+        return sent
+
+    def close(self):
+        self.sock.close()
+
+
+def payload_summary_packet(callsign, latitude, longitude, altitude, packet_time, speed=-1, heading=-1):
+    """ Produce a payload summary packet. """
     packet = {
         'type' : 'PAYLOAD_SUMMARY',
         'callsign' : callsign,
@@ -21,6 +84,29 @@ def send_payload_summary(callsign, latitude, longitude, altitude, packet_time, s
         'heading': heading,
         'time' : packet_time
     }
+    return json.dumps(packet)
+
+
+def telemetry_to_payload_summary(telemetry):
+    """ Produce a payload summary packet from radiosonde telemetry data. """
+    return payload_summary_packet(telemetry['id'], telemetry['lat'], telemetry['lon'], telemetry['alt'], telemetry['short_time'])
+
+
+def ozi_sentence(time, latitude, longitude, altitude):
+    """ Produce a 'generic' OziPlotter telemetry sentence. """
+    return "TELEMETRY,%s,%.5f,%.5f,%d\n" % (time, latitude, longitude, altitude)
+
+
+def telemetry_to_ozi_sentence(telemetry):
+    """ Produce an OziPlotter telemetry sentence from radiosonde telemetry data. """
+    return ozi_sentence(telemetry['short_time'], telemetry['lat'], telemetry['lon'], telemetry['alt'])
+
+
+# Send an update on the core payload telemetry statistics into the network via UDP broadcast.
+# This can be used by other devices hanging off the network to display vital stats about the payload.
+# Note that this creates a new socket for every packet. Use a UDPOutput to send a stream of packets.
+def send_payload_summary(callsign, latitude, longitude, altitude, packet_time, speed=-1, heading=-1, udp_port = HORUS_UDP_PORT):
+    packet = payload_summary_packet(callsign, latitude, longitude, altitude, packet_time, speed=speed, heading=heading)
 
     # Set up our UDP socket
     s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
@@ -34,13 +120,13 @@ def send_payload_summary(callsign, latitude, longitude, altitude, packet_time, s
         pass
     s.bind(('',HORUS_UDP_PORT))
     try:
-        s.sendto(json.dumps(packet), ('<broadcast>', udp_port))
+        s.sendto(packet, ('<broadcast>', udp_port))
     except socket.error:
-        s.sendto(json.dumps(packet), ('127.0.0.1', udp_port))
+        s.sendto(packet, ('127.0.0.1', udp_port))
 
 # The new 'generic' OziPlotter upload function, with no callsign, or checksumming (why bother, really)
 def oziplotter_upload_basic_telemetry(time, latitude, longitude, altitude, hostname="192.168.88.2", udp_port = HORUS_OZIPLOTTER_PORT):
-    sentence = "TELEMETRY,%s,%.5f,%.5f,%d\n" % (time, latitude, longitude, altitude)
+    sentence = ozi_sentence(time, latitude, longitude, altitude)
 
     try:
         ozisock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Scan Peak Detection
+#
+# Constant false alarm rate (CFAR) style peak detection for power spectra (in dB).
+# Rather than comparing peaks against the mean power across the whole band (which strong signals pull up),
+# each bin is compared against a local noise floor, estimated from a percentile of the surrounding bins.
+# Everything is vectorised - there are no Python loops over bins or peaks.
+#
+import numpy as np
+
+
+def block_noise_floor(power, window, percentile=50):
+    """
+    Estimate the noise floor of a power spectrum (dB) over blocks of window bins.
+
+    Each block's floor is the given percentile of its bins, which is robust to narrow signals provided they
+    occupy less than (100 - percentile)% of the block. To stop a wide signal filling one block from raising
+    the floor of the blocks either side (where the floor is interpolated), each block's floor is then the
+    smallest of its own and its neighbours' (as in smallest-of CFAR).
+
+    Returns (block centres, block floors), the centres being bin indices. This is O(n).
+    """
+    power = np.asarray(power, dtype=np.float64)
+    n = len(power)
+    window = int(max(1, min(window, n)))
+    num_blocks = n//window
+    kth = int(round(percentile/100.0*(window - 1)))
+
+    floors = np.partition(power[:num_blocks*window].reshape((num_blocks, window)), kth, axis=1)[:, kth]
+    centres = np.arange(num_blocks)*window + (window - 1)/2.0
+
+    # Include the remaining bins if there are enough of them to be meaningful.
+    remainder = n - num_blocks*window
+    if remainder > 0 and remainder >= window//2:
+        floors = np.append(floors, np.percentile(power[num_blocks*window:], percentile))
+        centres = np.append(centres, num_blocks*window + (remainder - 1)/2.0)
+
+    if len(floors) > 2:
+        floors = np.minimum(floors, np.minimum(np.concatenate((floors[:1], floors[:-1])), np.concatenate((floors[1:], floors[-1:]))))
+
+    return (centres, floors)
+
+
+def noise_floor(power, window, percentile=50):
+    """ Estimate the noise floor of every bin in a power spectrum (dB). See block_noise_floor(). """
+    (centres, floors) = block_noise_floor(power, window, percentile)
+    # np.interp holds the end values constant beyond the first and last block centres.
+    return np.interp(np.arange(len(power)), centres, floors)
+
+
+def detect_peaks_cfar(power, min_snr=10, min_distance=1, noise_window=256, percentile=50):
+    """
+    Find peaks in a power spectrum (dB), which are at least min_snr dB above the local noise floor, and are
+    the highest point within +/- min_distance bins. The noise floor is estimated over blocks of noise_window bins.
+
+    Returns a tuple of (peak indices, peak SNRs in dB), with the peaks in order of index.
+    As with detect_peaks(), the first and last bins cannot be peaks. Of equal height peaks within
+    min_distance bins, only the first is kept.
+
+    The noise floor and the peak test are only evaluated for bins above the lowest noise floor estimate
+    plus min_snr, so this is O(n) for the noise floor, plus O(candidates * min_distance).
+    """
+    power = np.asarray(power, dtype=np.float64)
+    n = len(power)
+    if n < 3:
+        return (np.array([], dtype=int), np.array([]))
+
+    (centres, floors) = block_noise_floor(power, noise_window, percentile)
+
+    # No bin can pass the threshold unless it is above the lowest floor by min_snr.
+    candidates = np.nonzero(power[1:-1] >= (np.min(floors) + min_snr))[0] + 1
+
+    # Check against the local noise floor.
+    snr = power[candidates] - np.interp(candidates, centres, floors)
+    keep = snr >= min_snr
+    (candidates, snr) = (candidates[keep], snr[keep])
+    if len(candidates) == 0:
+        return (np.array([], dtype=int), np.array([]))
+
+    # Keep candidates which are the highest point within +/- min_distance bins. reduceat() over the interleaved
+    # window start and end indices gives the maximum of each window (and some unused values in between).
+    radius = int(max(1, min_distance))
+    bounds = np.empty(2*len(candidates), dtype=int)
+    bounds[0::2] = np.maximum(candidates - radius, 0)
+    bounds[1::2] = np.minimum(candidates + radius + 1, n)
+    window_max = np.maximum.reduceat(np.append(power, 0), bounds)[0::2]
+    keep = power[candidates] >= window_max
+    (candidates, snr) = (candidates[keep], snr[keep])
+
+    # Drop equal height peaks following another within min_distance (i.e. flat topped peaks).
+    if len(candidates) > 1:
+        duplicate = np.concatenate(([False], (np.diff(candidates) <= radius) & (power[candidates[1:]] == power[candidates[:-1]])))
+        (candidates, snr) = (candidates[~duplicate], snr[~duplicate])
+
+    return (candidates, snr)
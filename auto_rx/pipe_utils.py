@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Decoder Output Reader
+#
+# Reads lines from a subprocess's stdout pipe, blocking in select() until output arrives.
+# Unlike polling a reader thread's queue, this wakes up only when the decoder produces output
+# (or a timeout expires), and hands each line on as soon as it is written.
+#
+import os
+import select
+
+
+class PipeLineReader(object):
+    """ Line reader for a pipe, using select() to wait for data with a timeout. """
+
+    def __init__(self, pipe, read_size=65536):
+        self.fd = pipe.fileno()
+        self.read_size = read_size
+        self.buffer = ''
+        self.eof = False
+
+    def readlines(self, timeout=None):
+        """
+        Wait up to timeout seconds (or forever, if None) for output, and return a list of any complete lines.
+        A timeout of 0 checks for available output without blocking. The returned list may be empty.
+        At the end of the stream, any partial line is returned, and the eof attribute is set.
+        """
+        if self.eof:
+            return []
+
+        (readable, _, _) = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, self.read_size)
+
+        if data == '':
+            self.eof = True
+            lines = [self.buffer] if self.buffer != '' else []
+            self.buffer = ''
+            return lines
+
+        lines = (self.buffer + data).split('\n')
+        # The last element is either an incomplete line, or an empty string.
+        self.buffer = lines.pop()
+        return [line + '\n' for line in lines]
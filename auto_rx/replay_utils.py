@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Offline Replay
+#
+# Feeds recorded data through the telemetry pipeline, without a RTLSDR, for testing and benchmarking.
+# Either recorded decoder output (rs41ecc/rs92ecc JSON lines) is replayed directly, or a WAV capture is
+# run through the real decoders. WAV captures can be FM audio (as in rs41/wav), or 2-channel IQ (as in
+# iq/dfmIQ.wav), which is FM demodulated first. WAV captures can also be decoded in-process, with the
+# rs_module decoder library. Data can be replayed in real time, or as fast as possible.
+#
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+import wave
+import numpy as np
+from channel_utils import FMChannel, wav_header
+from flight_stats import sonde_time
+from pipe_utils import PipeLineReader
+from rs_module_utils import RSDecoder
+
+# Audio rate used when demodulating IQ captures, as used by the rtl_fm pipelines in auto_rx.py
+IQ_AUDIO_RATE = 48000
+
+# Length of each block of audio written to the decoder.
+BLOCK_TIME = 0.1
+
+
+class StageTimer(object):
+    """
+    Record the time taken by each stage of handling a telemetry frame.
+
+    start() is called at the start of each frame, and mark(stage) at the end of each stage,
+    which records the time since the previous mark.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.order = []
+        self.last = None
+
+    def start(self):
+        self.last = time.time()
+
+    def mark(self, stage):
+        now = time.time()
+        if stage not in self.times:
+            self.times[stage] = []
+            self.order.append(stage)
+        self.times[stage].append(now - self.last)
+        self.last = now
+
+    def report(self):
+        """ Produce a table of the latency of each stage, in microseconds. """
+        lines = ["%-14s %8s %8s %8s %8s %8s" % ("Stage", "Count", "Mean", "Median", "99%", "Max")]
+        for stage in self.order:
+            times = np.array(self.times[stage])*1e6
+            lines.append("%-14s %8d %8.1f %8.1f %8.1f %8.1f" % (stage, len(times), np.mean(times), np.median(times), np.percentile(times, 99), np.max(times)))
+        return '\n'.join(lines)
+
+
+def replay_lines(filename, line_callback, realtime=False):
+    """
+    Replay a file of recorded decoder output, passing each line to line_callback(line).
+    In real time mode, lines are delayed according to the time of each frame. Returns the number of lines.
+    """
+    start_time = None
+    first_frame_time = None
+    count = 0
+
+    f = open(filename, 'r')
+    for line in f:
+        if realtime and line.startswith('{'):
+            try:
+                frame_time = sonde_time(json.loads(line)['datetime'])
+                if first_frame_time == None:
+                    (start_time, first_frame_time) = (time.time(), frame_time)
+                delay = (start_time + frame_time - first_frame_time) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            except:
+                pass
+
+        line_callback(line)
+        count += 1
+
+    f.close()
+    return count
+
+
+def wav_audio_blocks(filename, bandwidth=15000, realtime=False):
+    """
+    Read a WAV file, yielding blocks of 16-bit audio, as (samples, sample rate, duration) tuples.
+    FM audio files are converted to int16 samples. IQ (2-channel) files are FM demodulated, to IQ_AUDIO_RATE.
+    In real time mode, blocks are produced at the rate they were recorded at.
+    """
+    w = wave.open(filename, 'rb')
+    channels = w.getnchannels()
+    sample_width = w.getsampwidth()
+    sample_rate = w.getframerate()
+    block_frames = int(sample_rate*BLOCK_TIME)
+
+    if sample_width == 1:
+        # 8-bit WAV samples are unsigned.
+        to_float = lambda data: (np.fromstring(data, dtype=np.uint8).astype(np.float32) - 127.5)/128.0
+        to_audio = lambda data: (np.fromstring(data, dtype=np.uint8).astype(np.int16) - 128)*256
+    elif sample_width == 2:
+        to_float = lambda data: np.fromstring(data, dtype='<i2').astype(np.float32)/32768.0
+        to_audio = lambda data: np.fromstring(data, dtype='<i2')
+    else:
+        raise ValueError("Unsupported WAV sample width: %d bytes" % sample_width)
+
+    if channels == 1:
+        audio_rate = sample_rate
+        demod = to_audio
+    elif channels == 2:
+        channel = FMChannel(0, sample_rate, bandwidth=bandwidth, audio_rate=IQ_AUDIO_RATE)
+        audio_rate = channel.audio_rate
+
+        def demod(data):
+            samples = to_float(data)
+            return channel.process((samples[0::2] + 1j*samples[1::2]).astype(np.complex64))
+    else:
+        raise ValueError("Unsupported number of WAV channels: %d" % channels)
+
+    start = time.time()
+    elapsed = 0.0
+    while True:
+        data = w.readframes(block_frames)
+        if len(data) == 0:
+            break
+        duration = len(data)/float(sample_width*channels*sample_rate)
+        if realtime:
+            delay = start + elapsed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        elapsed += duration
+        yield (demod(data), audio_rate, duration)
+
+    w.close()
+
+
+def wav_blocks(filename, bandwidth=15000, realtime=False):
+    """
+    Read a WAV file, yielding blocks of data to be written to a decoder, with the audio duration of each.
+    This is a WAV header, followed by 16-bit audio (see wav_audio_blocks()).
+    """
+    header_sent = False
+    for (audio, audio_rate, duration) in wav_audio_blocks(filename, bandwidth=bandwidth, realtime=realtime):
+        if not header_sent:
+            yield (wav_header(audio_rate), 0.0)
+            header_sent = True
+        yield (audio.astype('<i2').tostring(), duration)
+
+
+def replay_wav(filename, decoder_cmd, line_callback, bandwidth=15000, realtime=False):
+    """
+    Run a WAV capture through a decoder, passing each line of decoder output to line_callback(line).
+    The decoder reads a WAV stream on stdin. Returns the duration of the capture, in seconds.
+    """
+    logging.debug("Running command: %s" % decoder_cmd)
+    rx = subprocess.Popen(decoder_cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, preexec_fn=os.setsid)
+    rx_stdout = PipeLineReader(rx.stdout)
+    duration = [0.0]
+
+    # Feed the decoder from a separate thread, so that its output is handled as soon as it is produced.
+    def feed():
+        try:
+            for (data, block_duration) in wav_blocks(filename, bandwidth=bandwidth, realtime=realtime):
+                rx.stdin.write(data)
+                duration[0] += block_duration
+        except IOError:
+            logging.error("Replay - Decoder exited early.")
+        finally:
+            rx.stdin.close()
+
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+
+    while not rx_stdout.eof:
+        for line in rx_stdout.readlines():
+            if line != "":
+                line_callback(line)
+
+    feeder.join()
+    rx.wait()
+    rx.stdout.close()
+    return duration[0]
+
+
+def replay_wav_library(filename, sonde_type, frame_callback, invert=False, ephemeris=None, almanac=None, bandwidth=15000, realtime=False):
+    """
+    Decode a WAV capture in-process, with the rs_module decoder library, passing each decoded TelemetryFrame
+    to frame_callback(frame). Returns the duration of the capture, in seconds.
+    """
+    decoder = None
+    duration = 0.0
+
+    try:
+        for (audio, audio_rate, block_duration) in wav_audio_blocks(filename, bandwidth=bandwidth, realtime=realtime):
+            if decoder == None:
+                decoder = RSDecoder(sonde_type, audio_rate, invert=invert, ephemeris=ephemeris, almanac=almanac)
+            for frame in decoder.process(audio):
+                frame_callback(frame)
+            duration += block_duration
+    finally:
+        if decoder != None:
+            logging.debug("Replay - %d frames failed their CRC checks." % decoder.crc_errors)
+            decoder.close()
+
+    return duration
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - In-process RS41/RS92 Decoding
+#
+# ctypes binding to librs_module.so (rs_module/rs_lib.c), which decodes blocks of demodulated audio samples
+# with the rs_module RS41/RS92 decoders, and returns each frame as a record. Frames are produced as
+# TelemetryFrames directly, so there is no decoder process, pipe, text output or JSON parsing involved.
+#
+import ctypes
+import os
+import threading
+import numpy as np
+from telemetry_frame import TelemetryFrame
+
+# Library location, built by build.sh
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'librs_module.so')
+
+# Sonde types, as in rs_lib.h
+SONDE_TYPES = {
+    'RS41': 41,
+    'RS92': 92
+}
+
+# Number of frames read from the library at a time.
+READ_FRAMES = 16
+
+# The rs_module decoders keep calibration and GPS data in static variables,
+# so only decode with one decoder at a time.
+_decode_lock = threading.Lock()
+
+_library = None
+
+
+class RSFrame(ctypes.Structure):
+    """ rs_frame_t, as in rs_lib.h """
+    _fields_ = [
+        ('frame', ctypes.c_int),
+        ('id', ctypes.c_char*12),
+        ('year', ctypes.c_int),
+        ('month', ctypes.c_int),
+        ('day', ctypes.c_int),
+        ('hr', ctypes.c_int),
+        ('min', ctypes.c_int),
+        ('sec', ctypes.c_float),
+        ('lat', ctypes.c_double),
+        ('lon', ctypes.c_double),
+        ('alt', ctypes.c_double),
+        ('vel_h', ctypes.c_double),
+        ('heading', ctypes.c_double),
+        ('vel_v', ctypes.c_double),
+        ('freq', ctypes.c_int),
+        ('crc', ctypes.c_int),
+        ('ecc', ctypes.c_int),
+        ('valid', ctypes.c_int)
+    ]
+
+
+def load_library(path=LIBRARY_PATH):
+    """ Load librs_module.so (once), and declare its functions. Raises OSError if it can't be loaded. """
+    global _library
+    if _library == None:
+        lib = ctypes.CDLL(path)
+        lib.rs_decoder_new.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_char_p]
+        lib.rs_decoder_new.restype = ctypes.c_void_p
+        lib.rs_decoder_process.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_short), ctypes.c_int]
+        lib.rs_decoder_process.restype = ctypes.c_int
+        lib.rs_decoder_read.argtypes = [ctypes.c_void_p, ctypes.POINTER(RSFrame), ctypes.c_int]
+        lib.rs_decoder_read.restype = ctypes.c_int
+        lib.rs_decoder_free.argtypes = [ctypes.c_void_p]
+        lib.rs_decoder_free.restype = None
+        _library = lib
+    return _library
+
+
+def frame_to_telemetry(frame):
+    """ Convert a RSFrame to a TelemetryFrame, with the same fields (and rounding) as the rs41ecc/rs92ecc JSON output. """
+    return TelemetryFrame(
+        frame=frame.frame,
+        id=frame.id,
+        datetime="%04d-%02d-%02dT%02d:%02d:%06.3fZ" % (frame.year, frame.month, frame.day, frame.hr, frame.min, frame.sec),
+        lat=round(frame.lat, 5),
+        lon=round(frame.lon, 5),
+        alt=round(frame.alt, 5),
+        vel_h=round(frame.vel_h, 5),
+        heading=round(frame.heading, 5),
+        vel_v=round(frame.vel_v, 5))
+
+
+class RSDecoder(object):
+    """
+    An RS41 or RS92 decoder, for blocks of demodulated audio at sample_rate.
+    For RS92 position decoding, supply an ephemeris (RINEX) or almanac (SEM) filename.
+    """
+
+    def __init__(self, sonde_type, sample_rate, invert=False, ephemeris=None, almanac=None, library_path=LIBRARY_PATH):
+        self.decoder = None
+        if sonde_type not in SONDE_TYPES:
+            raise ValueError("Unsupported sonde type: %s" % sonde_type)
+
+        self.lib = load_library(library_path)
+        self.sonde_type = sonde_type
+        self.sample_rate = sample_rate
+
+        if ephemeris != None:
+            (orbdata, eph_file) = (2, ephemeris)
+        elif almanac != None:
+            (orbdata, eph_file) = (1, almanac)
+        else:
+            (orbdata, eph_file) = (0, None)
+
+        self.decoder = self.lib.rs_decoder_new(SONDE_TYPES[sonde_type], int(round(sample_rate)), int(invert), orbdata, eph_file)
+        if self.decoder == None:
+            raise MemoryError("Could not create %s decoder." % sonde_type)
+
+        self.frames = (RSFrame*READ_FRAMES)()
+        # Frames which failed their CRC checks.
+        self.crc_errors = 0
+
+    def process_records(self, samples):
+        """ Decode a block of int16 audio samples, returning a list of any RSFrames completed, including those which failed their CRC checks. """
+        samples = np.ascontiguousarray(samples, dtype=np.int16)
+        records = []
+
+        with _decode_lock:
+            pending = self.lib.rs_decoder_process(self.decoder, samples.ctypes.data_as(ctypes.POINTER(ctypes.c_short)), len(samples))
+            if pending < 0:
+                raise MemoryError("%s decoder could not store frames." % self.sonde_type)
+            while pending > 0:
+                count = self.lib.rs_decoder_read(self.decoder, self.frames, READ_FRAMES)
+                # Copy the records, as the buffer is re-used.
+                records.extend([RSFrame.from_buffer_copy(self.frames[i]) for i in range(count)])
+                pending -= count
+
+        return records
+
+    def process(self, samples):
+        """ Decode a block of int16 audio samples, returning a list of TelemetryFrames for the frames which passed their CRC checks. """
+        frames = []
+        for record in self.process_records(samples):
+            if record.valid:
+                frames.append(frame_to_telemetry(record))
+            else:
+                self.crc_errors += 1
+        return frames
+
+    def close(self):
+        if self.decoder != None:
+            self.lib.rs_decoder_free(self.decoder)
+            self.decoder = None
+
+    def __del__(self):
+        self.close()
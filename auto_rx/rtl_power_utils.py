@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - rtl_power log file reader
+#
+# Shared between auto_rx.py and the debug utilities in utils/
+#
+import logging
+import numpy as np
+
+
+def read_rtl_power(filename):
+    """ Read in frequency samples from a single-shot log file produced by rtl_power """
+
+    # Read the entire file in one go. Single-shot (-1) scans are at most a few MB.
+    f = open(filename, 'r')
+    lines = f.read().splitlines()
+    f.close()
+
+    # rtl_power log files are csv's, with the first 6 fields in each line describing the time and frequency scan parameters
+    # for the remaining fields, which contain the power samples.
+    # First pass over the (already in-memory) lines - extract the hop headers and the raw sample text.
+    hops = []
+    total_samples = 0
+    freq_step = 0
+
+    for line in lines:
+        if line.strip() == "":
+            continue
+
+        # Split off the header fields, leaving the sample data as a single string.
+        fields = line.split(',', 6)
+
+        if len(fields) < 7:
+            logging.error("Invalid number of samples in input file - corrupt?")
+            raise Exception("Invalid number of samples in input file - corrupt?")
+
+        start_freq = float(fields[2])
+        stop_freq = float(fields[3])
+        freq_step = float(fields[4])
+
+        # rtl_power writes 'nan' and '-nan' for bins it could not compute, both of which parse as NaN.
+        samples = np.fromstring(fields[6], dtype=np.float64, sep=',')
+
+        hops.append((start_freq, stop_freq, samples))
+        total_samples += len(samples)
+
+    # rtl_power emits hops in frequency order, but sort anyway so the stitching below is valid.
+    hops.sort(key=lambda hop: hop[0])
+
+    # Preallocate output buffers, and fill them in hop by hop.
+    freq = np.empty(total_samples)
+    power = np.empty(total_samples)
+
+    pos = 0
+    last_stop = None
+    for (start_freq, stop_freq, samples) in hops:
+        freq_range = np.linspace(start_freq, stop_freq, len(samples))
+
+        # If this hop overlaps the previous one, drop the bins that fall inside the previous hop.
+        if last_stop is not None and start_freq < last_stop:
+            keep = freq_range >= last_stop
+            freq_range = freq_range[keep]
+            samples = samples[keep]
+
+        n = len(samples)
+        freq[pos:pos+n] = freq_range
+        power[pos:pos+n] = samples
+        pos += n
+        last_stop = stop_freq
+
+    freq = freq[:pos]
+    power = power[:pos]
+
+    # Sanitize power values, to remove the nan's that rtl_power puts in there occasionally.
+    power = np.nan_to_num(power)
+
+    return (freq, power, freq_step)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Launch Schedule Aware Scan Scheduler
+#
+# Most radiosonde launch sites launch at fixed times each day (i.e. shortly before the 00Z and 12Z synoptic times).
+# Outside of the launch windows there is nothing to find, so rather than scanning continuously, we drop into a
+# low-duty idle mode, with short, infrequent scans. Within a launch window, we search aggressively.
+# Launch times can be configured, and are also learnt from the times sondes are acquired.
+#
+import copy
+import json
+import logging
+import os
+import time
+
+
+def parse_launch_times(launch_times):
+    """ Parse a comma separated list of UTC times (HH:MM) into a list of minutes since midnight. """
+    minutes = []
+    for launch_time in launch_times.split(','):
+        launch_time = launch_time.strip()
+        if launch_time == '':
+            continue
+        (hour, minute) = launch_time.split(':')
+        minutes.append((int(hour)*60 + int(minute)) % 1440)
+    return minutes
+
+
+class ScanScheduler(object):
+    """
+    Decide whether we should be searching aggressively, or idling, based on the time of day.
+
+    launch_times is a list of launch times, as minutes since midnight UTC. A launch window extends from
+    window_before minutes before each launch time, to window_after minutes after it.
+    If learn is set, the times at which sondes are acquired (passed to record_acquisition) are remembered,
+    and any half-hour slot of the day with at least min_observations acquisitions in the last max_age days
+    is treated as a launch time. If there are no launch times at all, we are always in search mode.
+
+    clock is used in place of time.time(), so the scheduler can be run against a simulated clock.
+    """
+
+    def __init__(self, launch_times=[], window_before=30, window_after=180, learn=True, history_file="launch_history.json",
+                min_observations=2, max_age=60, slot_size=30, idle_scan_interval=900, idle_scan_dwell=5,
+                search_delay=5, search_attempts=10, clock=time.time):
+
+        self.configured_launch_times = launch_times
+        self.window_before = window_before*60
+        self.window_after = window_after*60
+        self.learn = learn
+        self.history_file = history_file
+        self.min_observations = min_observations
+        self.max_age = max_age*86400
+        self.slot_size = slot_size
+        self.idle_scan_interval = idle_scan_interval
+        self.idle_scan_dwell = idle_scan_dwell
+        self.search_delay = search_delay
+        self.search_attempts = search_attempts
+        self.clock = clock
+        self.last_mode = None
+
+        # Times (seconds since the epoch) at which sondes were acquired.
+        self.acquisitions = []
+        if self.learn and self.history_file != None:
+            try:
+                f = open(self.history_file, 'r')
+                self.acquisitions = json.load(f)
+                f.close()
+            except IOError:
+                pass
+            except:
+                logging.error("Scheduler - Could not read %s" % self.history_file)
+
+    def record_acquisition(self, timestamp=None):
+        """ Record a sonde being acquired. """
+        if not self.learn:
+            return
+
+        if timestamp == None:
+            timestamp = self.clock()
+
+        # Forget old acquisitions.
+        self.acquisitions = [t for t in self.acquisitions if t > (timestamp - self.max_age)]
+        self.acquisitions.append(timestamp)
+
+        if self.history_file != None:
+            try:
+                f = open(self.history_file + '.tmp', 'w')
+                json.dump(self.acquisitions, f)
+                f.close()
+                os.rename(self.history_file + '.tmp', self.history_file)
+            except:
+                logging.error("Scheduler - Could not write %s" % self.history_file)
+
+    def learned_launch_times(self):
+        """ Get launch times (minutes since midnight UTC) learnt from previous acquisitions. """
+        now = self.clock()
+        slots = {}
+        for t in self.acquisitions:
+            if t < (now - self.max_age):
+                continue
+            minute = int(t % 86400)//60
+            slots.setdefault(minute//self.slot_size, []).append(minute)
+
+        # Use the earliest acquisition in each slot as the launch time. The launch window covers the rest.
+        return sorted([min(minutes) for minutes in slots.values() if len(minutes) >= self.min_observations])
+
+    def launch_times(self):
+        """ Get all launch times. Learnt launch times close to a configured launch time are ignored. """
+        launch_times = list(self.configured_launch_times)
+        for learned in self.learned_launch_times():
+            if all([min(abs(learned - t), 1440 - abs(learned - t)) > self.slot_size for t in self.configured_launch_times]):
+                launch_times.append(learned)
+        return sorted(set(launch_times))
+
+    def launches_around(self, timestamp):
+        """ Get the launch times (seconds since the epoch) on the day before, of, and after a timestamp. """
+        day_start = (int(timestamp)//86400)*86400
+        launches = []
+        for day in [-1, 0, 1]:
+            for minute in self.launch_times():
+                launches.append(day_start + day*86400 + minute*60)
+        return launches
+
+    def mode(self):
+        """ Get the current mode, either 'search' or 'idle'. """
+        now = self.clock()
+        launches = self.launches_around(now)
+
+        if len(launches) == 0:
+            mode = 'search'
+        elif any([(launch - self.window_before) <= now <= (launch + self.window_after) for launch in launches]):
+            mode = 'search'
+        else:
+            mode = 'idle'
+
+        if mode != self.last_mode:
+            logging.info("Scheduler - Entering %s mode." % mode)
+            self.last_mode = mode
+
+        return mode
+
+    def next_window(self):
+        """ Get the time (seconds since the epoch) at which the next launch window opens, or None. """
+        now = self.clock()
+        starts = [launch - self.window_before for launch in self.launches_around(now) if (launch - self.window_before) > now]
+        return min(starts) if len(starts) > 0 else None
+
+    def search_config(self, config):
+        """ Get a copy of the configuration, with the search parameters for the current mode. """
+        search_config = copy.copy(config)
+        if self.mode() == 'search':
+            search_config['search_delay'] = self.search_delay
+            search_config['search_attempts'] = self.search_attempts
+        else:
+            # A single, short scan, without checking the known frequencies first.
+            search_config['search_attempts'] = 1
+            search_config['scan_dwell'] = self.idle_scan_dwell
+            search_config['freq_history_precheck'] = 0
+        return search_config
+
+    def idle_time(self):
+        """ Get the time to wait (in seconds) before the next scan, in idle mode. This ends early if a launch window opens. """
+        if self.mode() != 'idle':
+            return 0
+
+        next_window = self.next_window()
+        if next_window == None:
+            return self.idle_scan_interval
+        return max(0, min(self.idle_scan_interval, next_window - self.clock()))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - In-process Spectrum Scanner
+#
+# Computes averaged FFT power spectra across a frequency range from a long-lived IQ source
+# (see iq_utils.py), in place of running rtl_power and reading back its log file.
+#
+import logging
+import time
+import numpy as np
+
+
+class SpectrumScanner(object):
+    """
+    Hop a long-lived IQ source across [min_freq, max_freq], producing an averaged power spectrum.
+
+    scan() returns the same (freq, power, freq_step) tuple as rtl_power_utils.read_rtl_power,
+    so the result can be passed straight to the peak detector.
+    """
+
+    def __init__(self, source, min_freq, max_freq, step=800, dwell=20, crop=0.2, max_fft_block=64):
+        self.source = source
+        self.min_freq = float(min_freq)
+        self.max_freq = float(max_freq)
+        self.dwell = dwell
+        self.max_fft_block = max_fft_block
+
+        sample_rate = float(source.sample_rate)
+
+        # Use the smallest power-of-two FFT which gives us bins at least as narrow as requested.
+        self.fft_size = int(2**np.ceil(np.log2(sample_rate/step)))
+        self.freq_step = sample_rate/self.fft_size
+
+        # As with rtl_power's -c option, discard the edges of each hop, where the RTLSDR's filter roll-off is.
+        self.usable_bins = int(self.fft_size*(1.0 - crop))
+        self.bin_start = (self.fft_size - self.usable_bins)//2
+        usable_bw = self.usable_bins*self.freq_step
+
+        # Hop centre frequencies.
+        n_hops = int(np.ceil((self.max_freq - self.min_freq)/usable_bw))
+        self.hops = self.min_freq + usable_bw/2.0 + np.arange(n_hops)*usable_bw
+
+        self.set_dwell(dwell)
+
+        self.window = np.hanning(self.fft_size).astype(np.float32)
+        # Normalise so a full-scale tone reads ~0 dB, similar to rtl_power.
+        self.window_gain = np.sum(self.window)**2
+
+        # Frequency offsets of each retained FFT bin, relative to the hop centre.
+        self.bin_offsets = (np.arange(self.fft_size) - self.fft_size//2)[self.bin_start:self.bin_start+self.usable_bins]*self.freq_step
+
+        logging.debug("Scanner: %d hops, FFT size %d (%.1f Hz bins), %d averages per hop." % (n_hops, self.fft_size, self.freq_step, self.n_avg))
+
+    def set_dwell(self, dwell):
+        """ Set the total time (seconds) spent receiving during each scan. """
+        self.dwell = dwell
+        # Split the dwell time across the hops.
+        self.n_avg = max(1, int((dwell/float(len(self.hops)))*self.source.sample_rate/self.fft_size))
+
+    def hop_spectrum(self, center_freq):
+        """ Tune to a single hop, and return the averaged power spectrum (linear) of the retained bins. """
+        self.source.tune(center_freq)
+
+        acc = np.zeros(self.fft_size)
+        remaining = self.n_avg
+
+        # Process the FFTs in blocks, to bound memory use at high sample rates / long dwells.
+        while remaining > 0:
+            n = min(remaining, self.max_fft_block)
+            samples = self.source.read(n*self.fft_size).reshape((n, self.fft_size))
+            spectra = np.fft.fft(samples*self.window, axis=1)
+            acc += np.sum(spectra.real**2 + spectra.imag**2, axis=0)
+            remaining -= n
+
+        acc = np.fft.fftshift(acc)/(self.n_avg*self.window_gain)
+
+        return acc[self.bin_start:self.bin_start+self.usable_bins]
+
+    def scan(self):
+        """ Perform a full scan across the frequency range. """
+        start = time.time()
+
+        freq = np.empty(len(self.hops)*self.usable_bins)
+        power = np.empty(len(self.hops)*self.usable_bins)
+
+        for i, center_freq in enumerate(self.hops):
+            n = self.usable_bins
+            freq[i*n:(i+1)*n] = center_freq + self.bin_offsets
+            power[i*n:(i+1)*n] = self.hop_spectrum(center_freq)
+
+        # Trim to the requested frequency range (the last hop may overshoot).
+        in_range = (freq >= self.min_freq) & (freq <= self.max_freq)
+        freq = freq[in_range]
+        power = 10*np.log10(power[in_range] + 1e-20)
+
+        logging.debug("Scanner: Scan of %.3f - %.3f MHz took %.1f seconds." % (self.min_freq/1e6, self.max_freq/1e6, time.time()-start))
+
+        return (freq, power, self.freq_step)
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Telemetry Output Dispatcher
+#
+# Each output (APRS-IS, Habitat, rotator, OziPlotter...) is a sink with its own worker thread,
+# update rate and latest-value-wins queue, so a slow or hung output cannot delay the others.
+# To add a new output, subclass TelemetrySink and decorate it with @register_sink.
+#
+import logging
+import threading
+import time
+import traceback
+from aprs_utils import *
+from habitat_utils import *
+from ozi_utils import *
+from rotator_utils import *
+from metrics_utils import METRICS
+
+# Registered sink classes, in registration order.
+SINKS = []
+
+# Time taken to output each frame, by sink. The other sink statistics are collected by the dispatcher.
+SINK_DURATION = METRICS.histogram('auto_rx_sink_duration_seconds', 'Time taken to output a telemetry frame.', ['sink'])
+
+
+def register_sink(cls):
+    """ Class decorator, registering a sink class with the dispatcher. """
+    SINKS.append(cls)
+    return cls
+
+
+class TelemetrySink(object):
+    """
+    Base class for a telemetry output.
+
+    Subclasses must implement:
+        enabled(config) - classmethod, returning True if this output is enabled in the configuration.
+        handle(data)    - Output a single telemetry frame.
+    and may set:
+        name            - Used in log messages and statistics.
+        per_sonde       - If True, the latest frame from every sonde is output each update.
+                          If False, only the most recently received frame is output.
+    and override shutdown() to release any resources.
+
+    Frames are output at most once every rate seconds (or on every frame, if rate is 0). If synchronous is set,
+    updates are aligned to multiples of rate seconds since the epoch, so that multiple stations upload together.
+    Handling a frame which takes longer than timeout seconds is counted as slow in the statistics.
+    """
+
+    name = "Sink"
+    per_sonde = True
+
+    def __init__(self, config, rate=0, timeout=10, synchronous=False):
+        self.config = config
+        self.rate = rate
+        self.timeout = timeout
+        self.synchronous = synchronous
+
+        # Latest frame for each sonde, waiting to be output.
+        self.pending = {}
+        self.cond = threading.Condition()
+
+        # Health counters.
+        self.stats = {
+            'received': 0,      # Frames passed to this sink.
+            'replaced': 0,      # Frames replaced by a newer frame before they were output.
+            'sent': 0,          # Frames successfully output.
+            'errors': 0,        # Frames which failed to be output.
+            'slow': 0,          # Frames which took longer than timeout to output.
+            'last_duration': 0.0,
+            'last_sent': None
+        }
+        self.duration_metric = SINK_DURATION.labels(self.name)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @classmethod
+    def enabled(cls, config):
+        return False
+
+    def add(self, data):
+        """ Queue a frame for output, replacing any frame from the same sonde which has not yet been output. """
+        key = data['id'] if self.per_sonde else None
+        with self.cond:
+            self.stats['received'] += 1
+            if key in self.pending:
+                self.stats['replaced'] += 1
+            self.pending[key] = data
+            self.cond.notify()
+
+    def queue_depth(self):
+        return len(self.pending)
+
+    def handle(self, data):
+        raise NotImplementedError()
+
+    def shutdown(self):
+        pass
+
+    def wait_for_slot(self):
+        """ Wait until we are next allowed to output, or until the sink is closed. """
+        if self.rate <= 0:
+            return
+
+        if self.synchronous:
+            # Wait at least a second to ensure we don't double upload in the same slot, then wait until the
+            # time since epoch modulus the upload rate is equal to zero.
+            next_slot = time.time() + 1
+            next_slot += self.rate - (next_slot % self.rate)
+        else:
+            next_slot = time.time() + self.rate
+
+        # Wait on the condition rather than sleeping, so that close() wakes us immediately.
+        with self.cond:
+            while self.running:
+                remaining = next_slot - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+    def run(self):
+        while self.running:
+            # Block until there is something to output.
+            with self.cond:
+                while self.running and len(self.pending) == 0:
+                    self.cond.wait()
+                frames = self.pending.values()
+                self.pending = {}
+
+            # Output anything we have taken from the queue, even if we are closing.
+            for data in frames:
+                start = time.time()
+                try:
+                    self.handle(data)
+                    self.stats['sent'] += 1
+                    self.stats['last_sent'] = time.time()
+                except:
+                    self.stats['errors'] += 1
+                    logging.error("%s - Error while outputting data: %s" % (self.name, traceback.format_exc()))
+
+                self.stats['last_duration'] = time.time() - start
+                self.duration_metric.observe(self.stats['last_duration'])
+                if self.stats['last_duration'] > self.timeout:
+                    self.stats['slow'] += 1
+                    logging.warning("%s - Output took %.1f seconds." % (self.name, self.stats['last_duration']))
+
+            self.wait_for_slot()
+
+        self.shutdown()
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def join(self):
+        """ Wait for the worker thread to finish, for up to timeout seconds. """
+        self.thread.join(self.timeout)
+        if self.thread.is_alive():
+            logging.warning("%s - Output thread did not exit within %d seconds." % (self.name, self.timeout))
+
+
+@register_sink
+class APRSSink(TelemetrySink):
+    """ Upload sonde positions to APRS-IS as objects. """
+    name = "APRS-IS"
+
+    @classmethod
+    def enabled(cls, config):
+        return config['enable_aprs']
+
+    def __init__(self, config):
+        # Persistent APRS-IS connection, which is re-used for every upload.
+        self.aprs_client = APRSISClient(aprsUser=config['aprs_user'],
+                                aprsPass=config['aprs_pass'],
+                                serverHost=config['aprs_server'],
+                                serverPort=config['aprs_port'])
+
+        TelemetrySink.__init__(self, config, rate=config['upload_rate'], synchronous=config['synchronous_upload'])
+
+    def handle(self, data):
+        # Produce aprs comment, based on user config.
+        aprs_comment = self.config['aprs_custom_comment']
+        aprs_comment = aprs_comment.replace("<freq>", data['freq'])
+        aprs_comment = aprs_comment.replace("<id>", data['id'])
+        # Use the rolling vertical rate from the flight statistics if we have it, as it is less noisy.
+        aprs_comment = aprs_comment.replace("<vel_v>", "%.1fm/s" % data.get('vel_v_avg', data['vel_v']))
+        aprs_comment = aprs_comment.replace("<type>", data['type'])
+        if data.get('time_to_landing') != None:
+            aprs_comment = aprs_comment.replace("<ttl>", "Landing in %d min" % int(data['time_to_landing']/60))
+            aprs_comment = aprs_comment.replace("<landing>", "Pred. landing %.4f,%.4f" % (data['landing_lat'], data['landing_lon']))
+        else:
+            aprs_comment = aprs_comment.replace("<ttl>", "")
+            aprs_comment = aprs_comment.replace("<landing>", "")
+
+        # Push data to APRS.
+        aprs_data = push_balloon_to_aprs(data,
+                                        object_name=self.config['aprs_object_id'],
+                                        aprs_comment=aprs_comment,
+                                        aprsUser=self.config['aprs_user'],
+                                        aprsPass=self.config['aprs_pass'],
+                                        aprs_client=self.aprs_client)
+        logging.info("Data pushed to APRS-IS: %s" % aprs_data)
+
+    def shutdown(self):
+        self.aprs_client.close()
+
+
+@register_sink
+class HabitatSink(TelemetrySink):
+    """ Upload telemetry sentences to Habitat. """
+    name = "Habitat"
+
+    @classmethod
+    def enabled(cls, config):
+        return config['enable_habitat']
+
+    def __init__(self, config):
+        self.uploader = HabitatUploader(payload_callsign=config['payload_callsign'], callsign=config['uploader_callsign'])
+        TelemetrySink.__init__(self, config, rate=config['upload_rate'], synchronous=config['synchronous_upload'])
+
+    def handle(self, data):
+        self.uploader.add(data)
+        logging.debug("Data queued for upload to Habitat.")
+
+    def queue_depth(self):
+        return len(self.pending) + self.uploader.queue.qsize()
+
+    def shutdown(self):
+        self.uploader.close()
+
+
+@register_sink
+class RotatorSink(TelemetrySink):
+    """ Point a rotator (via rotctld) at the sonde. The rotator follows whichever sonde we heard from most recently. """
+    name = "Rotator"
+    per_sonde = False
+
+    @classmethod
+    def enabled(cls, config):
+        return config['enable_rotator'] and (config['station_lat'] != 0.0) and (config['station_lon'] != 0.0)
+
+    def __init__(self, config):
+        TelemetrySink.__init__(self, config, rate=config['rotator_update_rate'])
+
+    def handle(self, data):
+        # Calculate Azimuth & Elevation to Radiosonde.
+        rel_position = position_info((self.config['station_lat'], self.config['station_lon'], self.config['station_alt']),
+            (data['lat'], data['lon'], data['alt']))
+
+        # Update the rotator with the current sonde position.
+        update_rotctld(hostname=self.config['rotator_hostname'],
+                    port=self.config['rotator_port'],
+                    azimuth=rel_position['bearing'],
+                    elevation=rel_position['elevation'])
+
+
+@register_sink
+class OziPlotterSink(TelemetrySink):
+    """ Push telemetry to OziPlotter, on one or more hosts. """
+    name = "OziPlotter"
+
+    @classmethod
+    def enabled(cls, config):
+        return config['ozi_enabled']
+
+    def __init__(self, config):
+        self.output = UDPOutput(parse_udp_targets(config['ozi_hostname'], config['ozi_port']))
+        TelemetrySink.__init__(self, config, rate=config['ozi_update_rate'])
+
+    def handle(self, data):
+        self.output.send(telemetry_to_ozi_sentence(data))
+
+    def shutdown(self):
+        self.output.close()
+
+
+@register_sink
+class PayloadSummarySink(TelemetrySink):
+    """ Send payload summary packets (by default, as a broadcast), for the Horus Ground Station tools. """
+    name = "Payload Summary"
+
+    @classmethod
+    def enabled(cls, config):
+        return config['payload_summary_enabled']
+
+    def __init__(self, config):
+        targets = parse_udp_targets(config['payload_summary_hosts'], config['payload_summary_port'])
+        self.output = UDPOutput(targets, broadcast=True, bind_port=HORUS_UDP_PORT)
+        TelemetrySink.__init__(self, config, rate=config['ozi_update_rate'])
+
+    def handle(self, data):
+        self.output.send(telemetry_to_payload_summary(data))
+
+    def shutdown(self):
+        self.output.close()
+
+
+class TelemetryDispatcher(object):
+    """ Pass each telemetry frame on to every enabled sink. """
+
+    def __init__(self, config):
+        self.sinks = []
+        for sink_class in SINKS:
+            if sink_class.enabled(config):
+                logging.info("Starting %s output." % sink_class.name)
+                self.sinks.append(sink_class(config))
+
+        METRICS.add_collector(self.collect_metrics)
+
+    def add(self, data):
+        for sink in self.sinks:
+            sink.add(data)
+
+    def stats(self):
+        """ Get the health counters of every sink, as a dict keyed by sink name. """
+        stats = {}
+        for sink in self.sinks:
+            stats[sink.name] = dict(sink.stats, queue_depth=sink.queue_depth())
+        return stats
+
+    def collect_metrics(self):
+        """ Produce metrics from the sink statistics, for the metrics registry. """
+        stats = self.stats()
+        metrics = []
+        for (key, help) in [('received', 'Telemetry frames passed to the output.'),
+                            ('replaced', 'Telemetry frames replaced by a newer frame before being output.'),
+                            ('sent', 'Telemetry frames output.'),
+                            ('errors', 'Telemetry frames which failed to be output.'),
+                            ('slow', 'Telemetry frames which took longer than the output timeout.')]:
+            metrics.append(('auto_rx_sink_frames_%s_total' % key, help, 'counter', [({'sink': name}, s[key]) for (name, s) in stats.items()]))
+        metrics.append(('auto_rx_sink_queue_depth', 'Telemetry frames waiting to be output.', 'gauge', [({'sink': name}, s['queue_depth']) for (name, s) in stats.items()]))
+        return metrics
+
+    def close(self):
+        METRICS.remove_collector(self.collect_metrics)
+        for sink in self.sinks:
+            sink.close()
+        for sink in self.sinks:
+            sink.join()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Telemetry Frame
+#
+# A single frame of sonde telemetry, as produced by the rs41ecc/rs92ecc decoders. The fields are held in
+# slots, rather than a dict, and the derived time fields are only computed (once) when first used.
+# Frames can still be used like the telemetry dicts passed around by earlier versions (data['lat'],
+# data.get('type'), 'vel_h' in data, data.update(...)), so the outputs work with either.
+#
+import datetime
+import json
+import re
+from flight_stats import sonde_time
+
+# Fields output by the decoders, in the order they are output:
+# { "frame": 3172, "id": "L1830070", "datetime": "2015-08-02T11:59:26.000Z", "lat": 46.01891, "lon": 16.34725,
+#   "alt": 14035.75168, "vel_h": 12.34544, "heading": 63.32761, "vel_v": 7.14554 }
+DECODER_FIELDS = ('frame', 'id', 'datetime', 'lat', 'lon', 'alt', 'vel_h', 'heading', 'vel_v')
+
+# Fields added after decoding (by auto_rx.py and the flight statistics).
+EXTRA_FIELDS = ('crc', 'temp', 'humidity', 'freq', 'type', 'vel_v_avg', 'ascent_rate', 'descent_rate', 'burst',
+    'time_to_landing', 'landing_lat', 'landing_lon')
+
+# Derived fields, computed from the datetime field when first used.
+DERIVED_FIELDS = ('datetime_str', 'short_time', 'timestamp', 'parsed_datetime')
+
+# All named fields. Only these are looked up as attributes, so methods and properties aren't keys.
+_FIELDS = frozenset(DECODER_FIELDS + EXTRA_FIELDS + DERIVED_FIELDS)
+
+# Returned by getattr() for unset fields.
+_MISSING = object()
+
+# The decoder output layout, with a group for each field.
+DECODER_LINE = re.compile(r'\{ "frame": (-?\d+), "id": "([^"]*)", "datetime": "([^"]*)", "lat": ([^,]+), "lon": ([^,]+), '
+    r'"alt": ([^,]+), "vel_h": ([^,]+), "heading": ([^,]+), "vel_v": ([^,\s}]+)\s*\}')
+
+
+class TelemetryFrame(object):
+    """
+    A frame of telemetry. Decoder fields which were not present are unset, and behave as missing keys.
+    Any other fields (i.e. from newer decoders) are kept in a dict.
+    """
+
+    __slots__ = DECODER_FIELDS + EXTRA_FIELDS + ('_datetime_str', '_timestamp', '_parsed_datetime', '_other')
+
+    def __init__(self, **fields):
+        # The decoders only output frames which pass their CRC check, and we don't have the PTU data yet.
+        self.crc = True
+        self.temp = 0.0
+        self.humidity = 0.0
+        self._datetime_str = None
+        self._timestamp = None
+        self._parsed_datetime = None
+        self._other = None
+        for (key, value) in fields.items():
+            self[key] = value
+
+    @property
+    def datetime_str(self):
+        """ The frame time without the trailing Z, i.e. 2015-08-02T11:59:26.000 """
+        if self._datetime_str == None:
+            self._datetime_str = self.datetime.rstrip('Z')
+        return self._datetime_str
+
+    @property
+    def short_time(self):
+        """ The frame time as HH:MM:SS """
+        return self.datetime[11:19]
+
+    @property
+    def timestamp(self):
+        """ The frame time, as seconds since the epoch. """
+        if self._timestamp == None:
+            self._timestamp = sonde_time(self.datetime)
+        return self._timestamp
+
+    @property
+    def parsed_datetime(self):
+        """ The frame time, as a (naive, UTC) datetime object. """
+        if self._parsed_datetime == None:
+            self._parsed_datetime = datetime.datetime.utcfromtimestamp(self.timestamp)
+        return self._parsed_datetime
+
+    # Dict-like access.
+
+    def __getitem__(self, key):
+        value = getattr(self, key, _MISSING) if key in _FIELDS else _MISSING
+        if value is not _MISSING:
+            return value
+        if self._other != None and key in self._other:
+            return self._other[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in TelemetryFrame.__slots__ and not key.startswith('_'):
+            setattr(self, key, value)
+        else:
+            if self._other == None:
+                self._other = {}
+            self._other[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        # Avoid raising exceptions for missing fields, as that is comparatively slow.
+        value = getattr(self, key, _MISSING) if key in _FIELDS else _MISSING
+        if value is not _MISSING:
+            return value
+        elif self._other != None:
+            return self._other.get(key, default)
+        return default
+
+    def keys(self):
+        keys = [k for k in DECODER_FIELDS + EXTRA_FIELDS + DERIVED_FIELDS if k in self]
+        if self._other != None:
+            keys.extend(self._other.keys())
+        return keys
+
+    def update(self, fields):
+        for (key, value) in fields.items():
+            self[key] = value
+
+    def to_dict(self):
+        return dict([(k, self[k]) for k in self.keys()])
+
+    def __repr__(self):
+        return "TelemetryFrame(%s)" % ', '.join(["%s=%r" % (k, self[k]) for k in self.keys() if k not in DERIVED_FIELDS])
+
+
+def parse_decoder_line(line):
+    """
+    Parse a line of rs41ecc/rs92ecc JSON output into a TelemetryFrame.
+
+    The decoders always output the same fields in the same order, so the line is matched against that layout,
+    which is much quicker than decoding it as JSON. Lines which do not match are decoded as JSON instead.
+    Raises ValueError if the line cannot be parsed.
+    """
+    match = DECODER_LINE.match(line)
+    if match != None:
+        try:
+            fields = match.groups()
+            # Skip __init__, and set the fields directly.
+            frame = TelemetryFrame.__new__(TelemetryFrame)
+            (frame.crc, frame.temp, frame.humidity) = (True, 0.0, 0.0)
+            (frame._datetime_str, frame._timestamp, frame._parsed_datetime, frame._other) = (None, None, None, None)
+            (frame.frame, frame.id, frame.datetime) = (int(fields[0]), fields[1], fields[2])
+            (frame.lat, frame.lon, frame.alt, frame.vel_h, frame.heading, frame.vel_v) = map(float, fields[3:])
+            return frame
+        except ValueError:
+            pass
+
+    fields = json.loads(line)
+    if not isinstance(fields, dict):
+        raise ValueError("Not a telemetry frame: %s" % line)
+    return TelemetryFrame(**dict([(str(k), v) for (k, v) in fields.items()]))
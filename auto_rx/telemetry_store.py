@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+#
+# Radiosonde Auto RX Tools - Telemetry Store
+#
+# Every decoded telemetry frame is appended to a binary log file as a fixed-size record.
+# Log files are partitioned by date (UTC, from the sonde's own time) and sonde ID:
+#   <store_dir>/<YYYYMMDD>/<sonde id>.bin
+# A sidecar index (<store_dir>/index.json) holds a summary of each partition (frame count, time range
+# and bounding box), so queries only need to read the partitions which could match.
+# The index can always be rebuilt from the log files.
+#
+import argparse
+import calendar
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+
+# On-disk record format. All fields are little-endian.
+FRAME_DTYPE = np.dtype([
+    ('time', '<f8'),        # Sonde time, as seconds since the epoch (UTC)
+    ('frame', '<u4'),
+    ('lat', '<f8'),
+    ('lon', '<f8'),
+    ('alt', '<f4'),
+    ('vel_h', '<f4'),
+    ('vel_v', '<f4'),
+    ('heading', '<f4'),
+    ('temp', '<f4'),
+    ('humidity', '<f4'),
+    ('freq', '<f4'),        # MHz
+    ('type', 'S8')
+])
+
+INDEX_FILE = "index.json"
+
+
+def parse_sonde_time(datetime_str):
+    """ Convert a decoder timestamp (i.e. 2017-12-01T01:23:45.678Z) to seconds since the epoch. """
+    datetime_str = datetime_str.replace("Z", "")
+    if '.' in datetime_str:
+        (datetime_str, fraction) = datetime_str.split('.')
+        fraction = float('0.' + fraction)
+    else:
+        fraction = 0.0
+    return calendar.timegm(time.strptime(datetime_str, "%Y-%m-%dT%H:%M:%S")) + fraction
+
+
+def frame_to_record(data):
+    """ Convert a telemetry frame (as produced by process_rs_line) to a store record. """
+    record = np.zeros(1, dtype=FRAME_DTYPE)
+    record['time'] = data['timestamp'] if 'timestamp' in data else parse_sonde_time(data['datetime'])
+    record['frame'] = data['frame']
+    for field in ['lat', 'lon', 'alt', 'vel_h', 'vel_v', 'heading', 'temp', 'humidity']:
+        record[field] = data.get(field, np.nan)
+    try:
+        record['freq'] = float(data['freq'].split(' ')[0])
+    except:
+        record['freq'] = np.nan
+    record['type'] = data.get('type', '')
+    return record
+
+
+def summarise(records):
+    """ Produce an index entry for an array of records. """
+    return {
+        'count': len(records),
+        'start': float(np.min(records['time'])),
+        'end': float(np.max(records['time'])),
+        'lat_min': float(np.nanmin(records['lat'])),
+        'lat_max': float(np.nanmax(records['lat'])),
+        'lon_min': float(np.nanmin(records['lon'])),
+        'lon_max': float(np.nanmax(records['lon'])),
+        'alt_max': float(np.nanmax(records['alt'])),
+        'type': records['type'][-1]
+    }
+
+
+def merge_summary(entry, record):
+    """ Update an index entry with a single new record. """
+    entry['count'] += 1
+    entry['start'] = min(entry['start'], float(record['time'][0]))
+    entry['end'] = max(entry['end'], float(record['time'][0]))
+    entry['lat_min'] = min(entry['lat_min'], float(record['lat'][0]))
+    entry['lat_max'] = max(entry['lat_max'], float(record['lat'][0]))
+    entry['lon_min'] = min(entry['lon_min'], float(record['lon'][0]))
+    entry['lon_max'] = max(entry['lon_max'], float(record['lon'][0]))
+    entry['alt_max'] = max(entry['alt_max'], float(record['alt'][0]))
+    entry['type'] = record['type'][0]
+
+
+def read_partition(filename):
+    """ Read all complete records from a log file. A partially written record at the end of the file is ignored. """
+    count = os.path.getsize(filename)//FRAME_DTYPE.itemsize
+    return np.fromfile(filename, dtype=FRAME_DTYPE, count=count)
+
+
+class TelemetryStore(object):
+    """ Append-only store of telemetry frames, with an index for lookup by sonde ID, time range and bounding box. """
+
+    def __init__(self, store_dir="log/telemetry", index_interval=10, max_open_files=32):
+        self.store_dir = store_dir
+        self.index_interval = index_interval
+        self.max_open_files = max_open_files
+        self.lock = threading.Lock()
+
+        # Open log files, keyed by partition name (YYYYMMDD/id)
+        self.files = {}
+
+        if not os.path.isdir(self.store_dir):
+            os.makedirs(self.store_dir)
+
+        self.index = self.load_index()
+        self.index_dirty = False
+        self.last_index_write = time.time()
+
+    def load_index(self):
+        try:
+            f = open(os.path.join(self.store_dir, INDEX_FILE), 'r')
+            index = json.load(f)
+            f.close()
+            return index
+        except IOError:
+            return {}
+        except:
+            logging.error("Telemetry Store - Could not read index, rebuilding.")
+            return self.build_index()
+
+    def build_index(self):
+        """ Build the index by reading every log file in the store. """
+        index = {}
+        for date in sorted(os.listdir(self.store_dir)):
+            date_dir = os.path.join(self.store_dir, date)
+            if not os.path.isdir(date_dir):
+                continue
+            for filename in sorted(os.listdir(date_dir)):
+                if not filename.endswith('.bin'):
+                    continue
+                records = read_partition(os.path.join(date_dir, filename))
+                if len(records) > 0:
+                    entry = summarise(records)
+                    entry['id'] = filename[:-4]
+                    entry['date'] = date
+                    index[date + '/' + entry['id']] = entry
+        return index
+
+    def rebuild_index(self):
+        with self.lock:
+            self.index = self.build_index()
+            self.write_index()
+
+    def write_index(self):
+        """ Write out the index, replacing the old one atomically. """
+        filename = os.path.join(self.store_dir, INDEX_FILE)
+        f = open(filename + '.tmp', 'w')
+        json.dump(self.index, f)
+        f.close()
+        os.rename(filename + '.tmp', filename)
+        self.index_dirty = False
+        self.last_index_write = time.time()
+
+    def partition_filename(self, partition):
+        return os.path.join(self.store_dir, partition + '.bin')
+
+    def add(self, data):
+        """ Append a telemetry frame to the store. """
+        record = frame_to_record(data)
+
+        # Sonde IDs are used as file names, so only allow a safe set of characters.
+        sonde_id = re.sub(r'[^A-Za-z0-9_\-]', '_', data['id'])
+        date = datetime.datetime.utcfromtimestamp(record['time'][0]).strftime("%Y%m%d")
+        partition = date + '/' + sonde_id
+
+        with self.lock:
+            if partition not in self.files:
+                if len(self.files) >= self.max_open_files:
+                    self.close_files()
+                if not os.path.isdir(os.path.join(self.store_dir, date)):
+                    os.makedirs(os.path.join(self.store_dir, date))
+                self.files[partition] = open(self.partition_filename(partition), 'ab')
+
+            f = self.files[partition]
+            f.write(record.tostring())
+            f.flush()
+
+            if partition in self.index:
+                merge_summary(self.index[partition], record)
+            else:
+                entry = summarise(record)
+                entry['id'] = sonde_id
+                entry['date'] = date
+                self.index[partition] = entry
+
+            self.index_dirty = True
+            if time.time() > (self.last_index_write + self.index_interval):
+                self.write_index()
+
+    def partitions(self, sonde_id=None, start=None, end=None, bbox=None):
+        """ Get the index entries of all partitions which may contain frames matching a query. """
+        matches = []
+        for (partition, entry) in sorted(self.index.items()):
+            if sonde_id != None and entry['id'] != sonde_id:
+                continue
+            if start != None and entry['end'] < start:
+                continue
+            if end != None and entry['start'] > end:
+                continue
+            if bbox != None:
+                (lat_min, lon_min, lat_max, lon_max) = bbox
+                if entry['lat_max'] < lat_min or entry['lat_min'] > lat_max or entry['lon_max'] < lon_min or entry['lon_min'] > lon_max:
+                    continue
+            matches.append((partition, entry))
+        return matches
+
+    def query(self, sonde_id=None, start=None, end=None, bbox=None):
+        """
+        Get all frames matching a query, as a dict of record arrays (with FRAME_DTYPE) keyed by sonde ID.
+        start and end are seconds since the epoch. bbox is a (lat_min, lon_min, lat_max, lon_max) tuple.
+        """
+        with self.lock:
+            for f in self.files.values():
+                f.flush()
+            partitions = self.partitions(sonde_id=sonde_id, start=start, end=end, bbox=bbox)
+
+        results = {}
+        for (partition, entry) in partitions:
+            records = read_partition(self.partition_filename(partition))
+
+            mask = np.ones(len(records), dtype=bool)
+            if start != None:
+                mask &= records['time'] >= start
+            if end != None:
+                mask &= records['time'] <= end
+            if bbox != None:
+                (lat_min, lon_min, lat_max, lon_max) = bbox
+                mask &= (records['lat'] >= lat_min) & (records['lat'] <= lat_max) & (records['lon'] >= lon_min) & (records['lon'] <= lon_max)
+            records = records[mask]
+
+            if len(records) == 0:
+                continue
+
+            # A sonde may be split across multiple dates.
+            if entry['id'] in results:
+                results[entry['id']] = np.concatenate((results[entry['id']], records))
+            else:
+                results[entry['id']] = records
+
+        return results
+
+    def close_files(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def close(self):
+        with self.lock:
+            self.close_files()
+            if self.index_dirty:
+                self.write_index()
+
+
+if __name__ == "__main__":
+    # Query the telemetry store from the command line.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--store_dir", default="log/telemetry", help="Telemetry store directory.")
+    parser.add_argument("-i", "--id", default=None, help="Sonde ID.")
+    parser.add_argument("--start", default=None, help="Start time (YYYY-MM-DDTHH:MM:SS, UTC).")
+    parser.add_argument("--end", default=None, help="End time (YYYY-MM-DDTHH:MM:SS, UTC).")
+    parser.add_argument("--bbox", default=None, help="Bounding box (lat_min,lon_min,lat_max,lon_max).")
+    parser.add_argument("--rebuild", action="store_true", default=False, help="Rebuild the index from the log files.")
+    args = parser.parse_args()
+
+    store = TelemetryStore(args.store_dir)
+
+    if args.rebuild:
+        store.rebuild_index()
+
+    start = parse_sonde_time(args.start) if args.start != None else None
+    end = parse_sonde_time(args.end) if args.end != None else None
+    bbox = [float(x) for x in args.bbox.split(',')] if args.bbox != None else None
+
+    for (sonde_id, records) in sorted(store.query(sonde_id=args.id, start=start, end=end, bbox=bbox).items()):
+        last = records[np.argmax(records['time'])]
+        print("%s (%s): %d frames, %s to %s, max altitude %d m, last position %.5f, %.5f" % (sonde_id, records['type'][-1], len(records),
+            datetime.datetime.utcfromtimestamp(np.min(records['time'])).isoformat(),
+            datetime.datetime.utcfromtimestamp(np.max(records['time'])).isoformat(),
+            int(np.nanmax(records['alt'])), last['lat'], last['lon']))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark decoder input paths.
+#
+# Compares the CPU used to decode a capture as the rtl_fm pipelines used to (sox resampling the 15 kHz rtl_fm
+# output to a 48 kHz, 8-bit WAV for rs41ecc), against feeding the raw 15 kHz int16 audio straight to
+# rs41ecc --s16 15000. The 15 kHz audio is produced from the WAV capture (lowpassed and resampled), with a DC
+# offset added, as rtl_fm would produce. The sox stage is only timed if sox is installed.
+# Run from the auto_rx directory, after build.sh.
+#
+# Usage: python utils/bench_decoder_input.py [--invert] [--repeat N] [--rate 15000] [file.wav]
+#
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from telemetry_frame import parse_decoder_line
+from bench_rs_module import read_wav
+
+DC_OFFSET = 1500
+
+
+def resample(samples, sample_rate, rate):
+    """ Lowpass (FFT brick-wall, at 0.45*rate) and resample int16 audio to rate, adding a DC offset. """
+    spectrum = np.fft.rfft(samples.astype(np.float64))
+    spectrum[np.fft.rfftfreq(len(samples), 1.0/sample_rate) > 0.45*rate] = 0
+    filtered = np.fft.irfft(spectrum, len(samples))
+    t = np.arange(0, len(samples)/float(sample_rate), 1.0/rate)
+    audio = np.interp(t, np.arange(len(samples))/float(sample_rate), filtered) + DC_OFFSET
+    return np.clip(np.round(audio), -32768, 32767).astype('<i2')
+
+
+def run(command, input_file):
+    """ Run a shell pipeline with input_file on stdin, returning (frames, CPU time of the pipeline). """
+    start = sum(os.times()[2:4])
+    with open(input_file, 'rb') as f:
+        output = subprocess.Popen(command, shell=True, stdin=f, stdout=subprocess.PIPE, stderr=open(os.devnull, 'w')).communicate()[0]
+    cpu = sum(os.times()[2:4]) - start
+    return ([parse_decoder_line(line) for line in output.split('\n') if line.startswith('{')], cpu)
+
+
+def bench(command, input_file, repeat):
+    results = [run(command, input_file) for i in range(repeat)]
+    return (results[0][0], sum([r[1] for r in results])/repeat)
+
+
+def have_sox():
+    try:
+        subprocess.call(['sox', '--version'], stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        return True
+    except OSError:
+        return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../rs41/wav/rs41pre_20150802.wav'))
+    parser.add_argument("-i", "--invert", action="store_true", default=False, help="Inverted audio (as for rs41pre_20150802.wav).")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rate", type=int, default=15000, help="rtl_fm audio rate.")
+    parser.add_argument("--decoder", default="./rs41ecc")
+    args = parser.parse_args()
+
+    # The included sample is inverted.
+    if len(sys.argv) == 1:
+        args.invert = True
+
+    (samples, sample_rate) = read_wav(args.file)
+    duration = len(samples)/float(sample_rate)
+    raw_file = tempfile.NamedTemporaryFile(suffix='.s16')
+    resample(samples, sample_rate, args.rate).tofile(raw_file.name)
+    print("%s: %.1f seconds of audio, resampled to %d Hz" % (os.path.basename(args.file), duration, args.rate))
+
+    decoder = "%s --crc --ecc%s" % (args.decoder, " -i" if args.invert else "")
+    tests = [("%s (48 kHz 8-bit WAV)" % args.decoder, "%s %s" % (decoder, args.file), os.devnull)]
+    if have_sox():
+        tests.append(("sox | %s" % args.decoder, "sox -t raw -r %d -e s -b 16 -c 1 - -r 48000 -b 8 -t wav - highpass 20 2>/dev/null | %s" % (args.rate, decoder), raw_file.name))
+    else:
+        print("  sox not found, only timing the decoder stage of the sox pipeline.")
+    tests.append(("%s --s16 %d" % (args.decoder, args.rate), "%s --s16 %d" % (decoder, args.rate), raw_file.name))
+
+    for (name, command, input_file) in tests:
+        (frames, cpu) = bench(command, input_file, args.repeat)
+        print("  %-35s %3d frames  %7.1f ms CPU  (%.2f%% of one core)" % (name, len(frames), cpu*1e3, 100.0*cpu/duration))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark decoder output latency.
+#
+# Starts a fake decoder subprocess which replays telemetry JSON lines (either from a file of
+# recorded rs41ecc/rs92ecc output, or synthetic lines) at a fixed rate, and measures the time
+# from each line being written to it being handed to the telemetry processing code, for:
+#  - the old AsynchronousFileReader + 100ms polling loop, and
+#  - the select()-based PipeLineReader used by auto_rx.py
+# The number of loop wakeups is also counted, as a proxy for idle CPU load.
+#
+# Usage: python bench_decoder_latency.py [recorded_lines.txt] [lines_per_second]
+#
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from async_file_reader import AsynchronousFileReader
+from pipe_utils import PipeLineReader
+
+# The fake decoder prefixes each line with the time it was written, so we can measure latency.
+FAKE_DECODER = """
+import sys, time
+rate = float(sys.argv[1])
+lines = open(sys.argv[2]).read().splitlines()
+for line in lines:
+    time.sleep(1.0/rate)
+    sys.stdout.write("%.6f %s\\n" % (time.time(), line))
+    sys.stdout.flush()
+"""
+
+
+def synthetic_lines(filename, count=20):
+    f = open(filename, 'w')
+    for i in range(count):
+        f.write(json.dumps({'id': 'N1234567', 'frame': i, 'datetime': '2017-12-01T00:00:%02d.000Z' % i,
+            'lat': -34.5, 'lon': 138.5, 'alt': 1000.0 + 5*i, 'vel_h': 5.0, 'heading': 90.0, 'vel_v': 5.0}) + "\n")
+    f.close()
+
+
+def start_decoder(lines_file, rate):
+    return subprocess.Popen([sys.executable, '-c', FAKE_DECODER, str(rate), lines_file], stdout=subprocess.PIPE)
+
+
+def latency(line):
+    return time.time() - float(line.split(' ', 1)[0])
+
+
+def bench_polling(lines_file, rate):
+    """ The original decode loop. """
+    rx = start_decoder(lines_file, rate)
+    rx_stdout = AsynchronousFileReader(rx.stdout, autostart=True)
+    latencies = []
+    wakeups = 0
+    while not rx_stdout.eof():
+        wakeups += 1
+        for line in rx_stdout.readlines():
+            if (line != None) and (line != ""):
+                json.loads(line.split(' ', 1)[1])
+                latencies.append(latency(line))
+        time.sleep(0.1)
+    rx_stdout.join()
+    return (latencies, wakeups)
+
+
+def bench_select(lines_file, rate):
+    """ The select()-based decode loop. """
+    rx = start_decoder(lines_file, rate)
+    rx_stdout = PipeLineReader(rx.stdout)
+    latencies = []
+    wakeups = 0
+    while not rx_stdout.eof:
+        wakeups += 1
+        for line in rx_stdout.readlines(timeout=120):
+            if (line != None) and (line != ""):
+                json.loads(line.split(' ', 1)[1])
+                latencies.append(latency(line))
+    return (latencies, wakeups)
+
+
+if __name__ == '__main__':
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+    if len(sys.argv) > 1:
+        lines_file = sys.argv[1]
+    else:
+        lines_file = '/tmp/bench_decoder_lines.txt'
+        synthetic_lines(lines_file)
+
+    for name, bench in [('Polling (100 ms)', bench_polling), ('select()', bench_select)]:
+        start = time.time()
+        (latencies, wakeups) = bench(lines_file, rate)
+        elapsed = time.time() - start
+        latencies = np.array(latencies)*1000.0
+        print("%-18s %d lines, latency mean %.2f ms, max %.2f ms, %.1f wakeups/s" % (name, len(latencies), np.mean(latencies), np.max(latencies), wakeups/elapsed))
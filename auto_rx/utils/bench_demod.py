@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark the demodulators' sample throughput.
+#
+# Runs each decoder (rs41ecc, rs41mod, rs92ecc, rs92mod, dfm06, m10x, rs_detect) over a long WAV file, and
+# reports the samples per second of CPU time each one processes. The WAV is built by repeating a capture (by
+# default the included RS41 sample) to the requested length, in 8-bit and 16-bit versions. rs_detect stops as soon
+# as it finds a sonde, so it is fed noise of the same length instead.
+#
+# With --baseline, the same decoders from another directory (e.g. built from an older revision) are also
+# run, and their output compared.
+#
+# Usage: python utils/bench_demod.py [--bin-dir DIR] [--baseline DIR] [--seconds N] [--repeat N] [file.wav]
+#
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_rs_module import read_wav
+
+# (binary, arguments, input) - input is 'signal' or 'noise'
+DECODERS = [
+    ('rs41ecc', ['--crc', '--ecc', '-i'], 'signal'),
+    ('rs41mod', ['-i'], 'signal'),
+    ('rs92ecc', ['--crc', '--ecc'], 'signal'),
+    ('rs92mod', [], 'signal'),
+    ('dfm06', [], 'signal'),
+    ('m10x', [], 'signal'),
+    ('rs_detect', ['-z'], 'noise'),
+]
+
+
+def write_wav(filename, samples, sample_rate, sample_width):
+    w = wave.open(filename, 'wb')
+    w.setnchannels(1)
+    w.setsampwidth(sample_width)
+    w.setframerate(sample_rate)
+    if sample_width == 1:
+        w.writeframes((samples//256 + 128).astype(np.uint8).tostring())
+    else:
+        w.writeframes(samples.astype('<i2').tostring())
+    w.close()
+
+
+def run(binary, args, filename):
+    """ Run a decoder over a file, returning (output, CPU time). """
+    start = sum(os.times()[2:4])
+    output = subprocess.Popen([binary] + args + [filename], stdout=subprocess.PIPE, stderr=open(os.devnull, 'w')).communicate()[0]
+    return (output, sum(os.times()[2:4]) - start)
+
+
+def bench(binary, args, filename, repeat):
+    results = [run(binary, args, filename) for i in range(repeat)]
+    return (results[0][0], min([r[1] for r in results]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../rs41/wav/rs41pre_20150802.wav'))
+    parser.add_argument("--bin-dir", default=".", help="Directory containing the decoders.")
+    parser.add_argument("--baseline", default=None, help="Directory containing decoders to compare against.")
+    parser.add_argument("--seconds", type=int, default=600, help="Length of audio to decode.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per decoder (the fastest is reported).")
+    args = parser.parse_args()
+
+    (samples, sample_rate) = read_wav(args.file)
+    samples = np.tile(samples, int(np.ceil(args.seconds*sample_rate/float(len(samples)))))[:args.seconds*sample_rate]
+    noise = np.clip(np.random.RandomState(1).normal(0, 8000, len(samples)), -32768, 32767).astype(np.int16)
+    print("%d seconds of audio at %d Hz (%d samples)" % (args.seconds, sample_rate, len(samples)))
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for sample_width in [1, 2]:
+            files = {}
+            for (name, data) in [('signal', samples), ('noise', noise)]:
+                files[name] = os.path.join(temp_dir, '%s%d.wav' % (name, sample_width))
+                write_wav(files[name], data, sample_rate, sample_width)
+
+            print("%d-bit WAV:" % (8*sample_width))
+            for (decoder, decoder_args, input_name) in DECODERS:
+                binary = os.path.join(args.bin_dir, decoder)
+                if not os.path.exists(binary):
+                    print("  %-10s not found in %s" % (decoder, args.bin_dir))
+                    continue
+
+                (output, cpu) = bench(binary, decoder_args, files[input_name], args.repeat)
+                result = "  %-10s %6.1f Msamples/s (%5.0fx real time)" % (decoder, len(samples)/cpu/1e6, args.seconds/cpu)
+
+                baseline = os.path.join(args.baseline, decoder) if args.baseline else None
+                if baseline and os.path.exists(baseline):
+                    (baseline_output, baseline_cpu) = bench(baseline, decoder_args, files[input_name], args.repeat)
+                    result += ", baseline %6.1f Msamples/s, %.1fx speedup, output %s" % (len(samples)/baseline_cpu/1e6,
+                        baseline_cpu/cpu, "matches" if output == baseline_output else "DIFFERS")
+                print(result)
+    finally:
+        for f in os.listdir(temp_dir):
+            os.remove(os.path.join(temp_dir, f))
+        os.rmdir(temp_dir)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark the metrics overhead on the telemetry path.
+#
+# Times the metric updates made in handle_decoder_line() for each telemetry frame (frame counter,
+# missed frame counter and frame handling time histogram), against an empty loop. The output latency
+# histogram is updated in each output's own thread, so is timed separately.
+#
+# Usage: python bench_metrics.py [num_frames]
+#
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from metrics_utils import *
+
+registry = MetricsRegistry()
+FRAMES = registry.counter('frames_total', 'Frames.', ['type'])
+FRAMES_MISSED = registry.counter('frames_missed_total', 'Missed frames.', ['type'])
+FRAME_DURATION = registry.histogram('frame_duration_seconds', 'Frame duration.', buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0))
+SINK_DURATION = registry.histogram('sink_duration_seconds', 'Sink duration.', ['sink']).labels('OziPlotter')
+
+
+def empty_frame(sonde_type, missed):
+    start = time.time()
+    if missed > 0:
+        pass
+    return time.time() - start
+
+
+def instrumented_frame(sonde_type, missed):
+    start = time.time()
+    FRAMES.labels(sonde_type).inc()
+    if missed > 0:
+        FRAMES_MISSED.labels(sonde_type).inc(missed)
+    duration = time.time() - start
+    FRAME_DURATION.observe(duration)
+    return duration
+
+
+def sink_frame(sonde_type, missed):
+    SINK_DURATION.observe(0.0002)
+
+
+def bench(function, num_frames):
+    start = time.time()
+    for i in range(num_frames):
+        function('RS41', i % 10 == 0)
+    return (time.time() - start)/num_frames
+
+
+if __name__ == '__main__':
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    baseline = bench(empty_frame, num_frames)
+    instrumented = bench(instrumented_frame, num_frames)
+
+    print("Baseline:      %.2f us/frame" % (baseline*1e6))
+    print("Instrumented:  %.2f us/frame" % (instrumented*1e6))
+    print("Overhead:      %.2f us/frame" % ((instrumented - baseline)*1e6))
+    print("Output:        %.2f us/frame, per output" % (bench(sink_frame, num_frames)*1e6))
+
+    start = time.time()
+    text = registry.render()
+    print("Render:        %.1f us (%d bytes)" % ((time.time() - start)*1e6, len(text)))
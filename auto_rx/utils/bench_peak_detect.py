@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Compare scan peak detectors.
+#
+# Generates synthetic rtl_power style spectra with known signals, and compares the original peak detection
+# (a noise floor from the mean power, then findpeaks.detect_peaks) against peak_utils.detect_peaks_cfar.
+# The spectra have an uneven noise floor (a slope, and the roll-off at the edge of each rtl_power hop),
+# strong narrow carriers, a wideband interferer, and a few weaker sondes.
+#
+# Reports how many sondes each detector finds, and how many false alarms (peaks not near any signal) it
+# produces, then times both detectors on increasingly large spectra.
+#
+# Usage: python bench_peak_detect.py [num_spectra]
+#
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from findpeaks import detect_peaks
+from peak_utils import detect_peaks_cfar
+
+MIN_FREQ = 400.4e6
+MAX_FREQ = 404.0e6
+HOP_WIDTH = 2.4e6       # rtl_power hop bandwidth
+MIN_SNR = 10
+MIN_DISTANCE = 1000
+NOISE_WINDOW = 200000
+MATCH_TOLERANCE = 2500  # A detection within this many Hz of a signal counts as finding it.
+
+
+def synthetic_spectrum(step, rng):
+    """ Produce a (freq, power, sonde frequencies, other signal frequencies) tuple. """
+    freq = np.arange(MIN_FREQ, MAX_FREQ, step)
+    n = len(freq)
+
+    # Noise floor, with a slope across the band and roll-off towards the edges of each hop.
+    hop_position = ((freq - MIN_FREQ) % HOP_WIDTH)/HOP_WIDTH*2.0 - 1.0
+    power = -80.0 + rng.uniform(-4, 4)*(freq - MIN_FREQ)/(MAX_FREQ - MIN_FREQ) - 5.0*hop_position**8
+    power += rng.normal(0, 0.7, n)
+
+    # Work in linear power while adding signals.
+    linear = 10**(power/10.0)
+
+    def add_signal(centre, snr, width):
+        local_noise = 10**(np.interp(centre, freq, power)/10.0)
+        linear[:] += local_noise*10**(snr/10.0)*np.exp(-0.5*((freq - centre)/width)**2)
+
+    # Sondes are on 10 kHz channels.
+    sondes = list(np.round(rng.uniform(MIN_FREQ + 50e3, MAX_FREQ - 50e3, rng.randint(1, 5))/10e3)*10e3)
+    for sonde in sondes:
+        add_signal(sonde, rng.uniform(12, 25), 2000)
+
+    # Strong narrow carriers, and a wideband interferer.
+    others = list(rng.uniform(MIN_FREQ + 50e3, MAX_FREQ - 50e3, rng.randint(0, 6)))
+    for carrier in others:
+        add_signal(carrier, rng.uniform(30, 50), max(step, 300))
+    interferer = rng.uniform(MIN_FREQ + 300e3, MAX_FREQ - 300e3)
+    interferer_width = rng.uniform(50e3, 500e3)
+    linear[np.abs(freq - interferer) < interferer_width] *= 10**(rng.uniform(10, 20)/10.0)
+    others.append(interferer)
+
+    power = 10*np.log10(linear)
+    return (freq, power, sondes, others, (interferer - interferer_width, interferer + interferer_width))
+
+
+def mean_detector(power, step):
+    power_nf = np.mean(power)
+    return detect_peaks(power, mph=(power_nf + MIN_SNR), mpd=(MIN_DISTANCE/step), show=False)
+
+
+def cfar_detector(power, step):
+    return detect_peaks_cfar(power, min_snr=MIN_SNR, min_distance=MIN_DISTANCE/step, noise_window=NOISE_WINDOW/step)[0]
+
+
+def score(detections, sondes, others, interferer_band):
+    """ Count the sondes found, and the detections not near any signal. """
+    found = len([s for s in sondes if np.any(np.abs(detections - s) <= MATCH_TOLERANCE)])
+    signals = np.array(sondes + others)
+    false_alarms = 0
+    for d in detections:
+        near_signal = np.any(np.abs(signals - d) <= MATCH_TOLERANCE)
+        in_interferer = interferer_band[0] - MATCH_TOLERANCE <= d <= interferer_band[1] + MATCH_TOLERANCE
+        if not (near_signal or in_interferer):
+            false_alarms += 1
+    return (found, false_alarms)
+
+
+if __name__ == '__main__':
+    num_spectra = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = np.random.RandomState(1234)
+
+    for step in [800, 100]:
+        totals = {'mean': [0, 0], 'cfar': [0, 0]}
+        num_sondes = 0
+        for i in range(num_spectra):
+            (freq, power, sondes, others, interferer_band) = synthetic_spectrum(step, rng)
+            num_sondes += len(sondes)
+            for (name, detector) in [('mean', mean_detector), ('cfar', cfar_detector)]:
+                (found, false_alarms) = score(freq[detector(power, step)], sondes, others, interferer_band)
+                totals[name][0] += found
+                totals[name][1] += false_alarms
+
+        print("%d spectra, %d Hz steps (%d bins), %d sondes:" % (num_spectra, step, len(freq), num_sondes))
+        for name in ['mean', 'cfar']:
+            print("  %-5s detector: %5.1f%% of sondes found, %.2f false alarms per scan" % (name,
+                100.0*totals[name][0]/num_sondes, float(totals[name][1])/num_spectra))
+
+    print("Timing (mean of 10 runs, on noise with min_snr lowered to 3 dB to produce many candidate peaks):")
+    for n in [4500, 36000, 360000]:
+        power = -80.0 + rng.normal(0, 1.0, n)
+        mph = np.mean(power) + 3
+        times = {}
+        for (name, detector) in [('mean', lambda: detect_peaks(power, mph=mph, mpd=10, show=False)),
+                                 ('cfar', lambda: detect_peaks_cfar(power, min_snr=3, min_distance=10, noise_window=250))]:
+            start = time.time()
+            for i in range(10):
+                peaks = detector()
+            times[name] = (time.time() - start)/10
+            if name == 'mean':
+                mean_peaks = len(peaks)
+            else:
+                cfar_peaks = len(peaks[0])
+        print("  %7d bins: mean detector %8.2f ms (%d peaks), cfar detector %6.2f ms (%d peaks)" % (n,
+            times['mean']*1e3, mean_peaks, times['cfar']*1e3, cfar_peaks))
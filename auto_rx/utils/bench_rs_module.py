@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark in-process RS41 decoding.
+#
+# Decodes WAV captures with the rs41ecc binary (as auto_rx.py runs it, reading the WAV and printing JSON,
+# which is then parsed), and in-process with the rs_module library (librs_module.so), feeding the audio in
+# 0.1 second blocks. Reports the throughput of each, and checks both produce the same frames.
+# Run from the auto_rx directory, after build.sh.
+#
+# Usage: python utils/bench_rs_module.py [--invert] [--repeat N] [file.wav ...]
+#
+import argparse
+import os
+import subprocess
+import sys
+import time
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rs_module_utils import RSDecoder
+from telemetry_frame import parse_decoder_line
+
+FIELDS = ('frame', 'id', 'datetime', 'lat', 'lon', 'alt', 'vel_h', 'heading', 'vel_v')
+BLOCK_TIME = 0.1
+
+
+def read_wav(filename):
+    """ Read a mono WAV file, returning (int16 samples, sample rate) """
+    w = wave.open(filename, 'rb')
+    data = w.readframes(w.getnframes())
+    if w.getsampwidth() == 1:
+        samples = (np.fromstring(data, dtype=np.uint8).astype(np.int16) - 128)*256
+    else:
+        samples = np.fromstring(data, dtype='<i2')
+    sample_rate = w.getframerate()
+    w.close()
+    return (samples, sample_rate)
+
+
+def decode_binary(filename, decoder, invert):
+    cmd = [decoder, '--crc', '--ecc'] + (['-i'] if invert else []) + [filename]
+    output = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=open(os.devnull, 'w')).communicate()[0]
+    return [parse_decoder_line(line) for line in output.split('\n') if line.startswith('{')]
+
+
+def decode_library(samples, sample_rate, invert):
+    decoder = RSDecoder('RS41', sample_rate, invert=invert)
+    block = int(sample_rate*BLOCK_TIME)
+    frames = []
+    for i in range(0, len(samples), block):
+        frames.extend(decoder.process(samples[i:i+block]))
+    decoder.close()
+    return frames
+
+
+def bench(function, repeat):
+    """ Returns (result, wall time, CPU time (including child processes)) per run. """
+    start = (time.time(), sum(os.times()[:4]))
+    for i in range(repeat):
+        result = function()
+    return (result, (time.time() - start[0])/repeat, (sum(os.times()[:4]) - start[1])/repeat)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../rs41/wav/rs41pre_20150802.wav')])
+    parser.add_argument("-i", "--invert", action="store_true", default=False, help="Inverted audio (as for rs41pre_20150802.wav).")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--decoder", default="./rs41ecc")
+    args = parser.parse_args()
+
+    # The included sample is inverted.
+    if len(sys.argv) == 1:
+        args.invert = True
+
+    for filename in args.files:
+        (samples, sample_rate) = read_wav(filename)
+        duration = len(samples)/float(sample_rate)
+        print("%s: %.1f seconds of audio at %d Hz" % (os.path.basename(filename), duration, sample_rate))
+
+        (binary_frames, binary_wall, binary_cpu) = bench(lambda: decode_binary(filename, args.decoder, args.invert), args.repeat)
+        (library_frames, library_wall, library_cpu) = bench(lambda: decode_library(samples, sample_rate, args.invert), args.repeat)
+
+        for (name, frames, wall, cpu) in [('rs41ecc + JSON', binary_frames, binary_wall, binary_cpu),
+                                          ('librs_module', library_frames, library_wall, library_cpu)]:
+            print("  %-15s %3d frames  %7.1f ms (%6.1fx real time)  %7.1f ms CPU  %8.1f us CPU/frame" % (name, len(frames),
+                wall*1e3, duration/wall, cpu*1e3, cpu/max(len(frames), 1)*1e6))
+
+        mismatches = 0
+        for (a, b) in zip(binary_frames, library_frames):
+            mismatches += len([k for k in FIELDS if a[k] != b[k]])
+        if len(binary_frames) != len(library_frames) or mismatches > 0:
+            print("  Decoders differ: %d vs %d frames, %d mismatched fields" % (len(binary_frames), len(library_frames), mismatches))
+        else:
+            print("  Frames match. Speedup: %.1fx (wall), %.1fx (CPU)" % (binary_wall/library_wall, binary_cpu/library_cpu))
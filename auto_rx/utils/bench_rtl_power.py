@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark the rtl_power log reader.
+#
+# Generates a synthetic single-shot rtl_power log covering a multi-MHz span, and compares
+# the old per-line np.loadtxt/np.append reader against rtl_power_utils.read_rtl_power.
+#
+# Usage: python bench_rtl_power.py [span_mhz] [search_step_hz]
+# Requires Numpy
+#
+import logging
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rtl_power_utils import read_rtl_power
+
+
+def read_rtl_power_legacy(filename):
+    """ Original reader from auto_rx.py, kept here as a baseline. """
+    freq = np.array([])
+    power = np.array([])
+    freq_step = 0
+
+    f = open(filename,'r')
+    for line in f:
+        fields = line.split(',')
+
+        if len(fields) < 6:
+            raise Exception("Invalid number of samples in input file - corrupt?")
+
+        start_freq = float(fields[2])
+        stop_freq = float(fields[3])
+        freq_step = float(fields[4])
+
+        samples = np.loadtxt(StringIO(",".join(fields[6:])),delimiter=',')
+        freq_range = np.linspace(start_freq,stop_freq,len(samples))
+
+        freq = np.append(freq, freq_range)
+        power = np.append(power, samples)
+
+    f.close()
+
+    power = np.nan_to_num(power)
+
+    return (freq, power, freq_step)
+
+
+def write_synthetic_log(filename, start=400.0e6, span=20e6, step=800, hop_width=1.2e6):
+    """ Write out a rtl_power style CSV, with a few carriers and the occasional nan. """
+    f = open(filename, 'w')
+    hop_start = start
+    while hop_start < start + span:
+        hop_stop = hop_start + hop_width
+        n_bins = int(hop_width/step)
+        samples = np.random.normal(-40.0, 1.5, n_bins)
+        # Sprinkle in a carrier and some nan's.
+        samples[np.random.randint(n_bins)] = -10.0
+        samples[np.random.randint(n_bins)] = np.nan
+        sample_str = ", ".join(["%.2f" % x if not np.isnan(x) else "-nan" for x in samples])
+        f.write("2017-12-01, 00:00:00, %d, %d, %.2f, 2048, %s\n" % (hop_start, hop_stop, step, sample_str))
+        hop_start = hop_stop
+    f.close()
+
+
+def time_reader(reader, filename, runs=5):
+    best = None
+    for i in range(runs):
+        t0 = time.time()
+        result = reader(filename)
+        elapsed = time.time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return (best, result)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    span = float(sys.argv[1])*1e6 if len(sys.argv) > 1 else 20e6
+    step = float(sys.argv[2]) if len(sys.argv) > 2 else 800
+
+    (fd, filename) = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+
+    try:
+        write_synthetic_log(filename, span=span, step=step)
+
+        (t_legacy, (freq_a, power_a, step_a)) = time_reader(read_rtl_power_legacy, filename)
+        (t_new, (freq_b, power_b, step_b)) = time_reader(read_rtl_power, filename)
+
+        print("Span: %.1f MHz, Step: %d Hz, Bins: %d" % (span/1e6, step, len(freq_b)))
+        print("Legacy reader:    %.4f s" % t_legacy)
+        print("rtl_power_utils:  %.4f s" % t_new)
+        print("Speedup:          %.1fx" % (t_legacy/t_new))
+        print("Outputs match:    %s" % (np.array_equal(freq_a, freq_b) and np.array_equal(power_a, power_b) and step_a == step_b))
+    finally:
+        os.remove(filename)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark telemetry line parsing.
+#
+# Parses a large number of decoder output lines (from a file of recorded rs41ecc/rs92ecc output,
+# or synthetic lines), comparing the original json.loads() + derived fields approach against
+# parse_decoder_line(), and checks that both produce the same values.
+#
+# Usage: python bench_telemetry_parse.py [recorded_lines.txt] [num_lines]
+#
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from telemetry_frame import *
+
+SYNTHETIC_LINE = '{ "frame": %d, "id": "L1830070", "datetime": "2015-08-02T11:%02d:%02d.000Z", "lat": 46.01891, "lon": 16.34725, "alt": 14035.75168, "vel_h": 12.34544, "heading": 63.32761, "vel_v": 7.14554 }\n'
+
+
+def parse_json(line):
+    """ The original process_rs_line() parsing. """
+    rs_frame = json.loads(line)
+    rs_frame['crc'] = True
+    rs_frame['temp'] = 0.0
+    rs_frame['humidity'] = 0.0
+    rs_frame['datetime_str'] = rs_frame['datetime'].replace("Z","")
+    rs_frame['short_time'] = rs_frame['datetime'].split(".")[0].split("T")[1]
+    return rs_frame
+
+
+def bench(name, function, lines):
+    start = time.time()
+    for line in lines:
+        function(line)
+    elapsed = time.time() - start
+    print("%-36s %10.0f lines/s  %6.2f us/line" % (name, len(lines)/elapsed, elapsed/len(lines)*1e6))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        recorded = [line for line in open(sys.argv[1]) if line.startswith('{')]
+    else:
+        recorded = [SYNTHETIC_LINE % (i, (i//60) % 60, i % 60) for i in range(3600)]
+    num_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    lines = (recorded*(num_lines//len(recorded) + 1))[:num_lines]
+
+    # Check the parsers agree.
+    for line in recorded:
+        (expected, frame) = (parse_json(line), parse_decoder_line(line))
+        for key in expected:
+            if expected[key] != frame[key]:
+                print("Mismatch in %s: %r != %r" % (key, expected[key], frame[key]))
+                sys.exit(1)
+
+    print("Parsing %d lines:" % len(lines))
+    bench("json.loads + derived fields", parse_json, lines)
+    bench("parse_decoder_line", parse_decoder_line, lines)
+    bench("parse_decoder_line + short_time", lambda line: parse_decoder_line(line)['short_time'], lines)
+    bench("parse_decoder_line + timestamp", lambda line: parse_decoder_line(line)['timestamp'], lines)
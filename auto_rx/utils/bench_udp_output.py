@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Benchmark OziPlotter / payload summary UDP output.
+#
+# Sends a stream of telemetry frames to a receiver on loopback, and compares the frames per second
+# achieved by the original per-frame socket functions in ozi_utils.py against a re-used UDPOutput.
+#
+# Usage: python bench_udp_output.py [num_frames]
+#
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ozi_utils import *
+
+OZI_PORT = 58942
+SUMMARY_PORT = 58672
+
+TELEMETRY = {'id': 'N1234567', 'short_time': '01:23:45', 'lat': -34.91234, 'lon': 138.61234, 'alt': 12345.0}
+
+
+class Receiver(threading.Thread):
+    """ Count the packets received on a UDP port. """
+
+    def __init__(self, port):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.count = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4*1024*1024)
+        self.sock.bind(('', port))
+        self.start()
+
+    def run(self):
+        while True:
+            self.sock.recv(4096)
+            self.count += 1
+
+
+def bench(name, send_frame, receiver, num_frames):
+    start_count = receiver.count
+    start = time.time()
+    for i in range(num_frames):
+        send_frame()
+    elapsed = time.time() - start
+    time.sleep(0.2)
+    print("%-28s %8.0f frames/s (%d/%d received)" % (name, num_frames/elapsed, receiver.count - start_count, num_frames))
+
+
+if __name__ == '__main__':
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    ozi_rx = Receiver(OZI_PORT)
+    summary_rx = Receiver(SUMMARY_PORT)
+
+    bench("OziPlotter (per-frame)", lambda: push_telemetry_to_ozi(TELEMETRY, hostname='127.0.0.1', udp_port=OZI_PORT), ozi_rx, num_frames)
+
+    ozi_output = UDPOutput([('127.0.0.1', OZI_PORT)])
+    bench("OziPlotter (UDPOutput)", lambda: ozi_output.send(telemetry_to_ozi_sentence(TELEMETRY)), ozi_rx, num_frames)
+    ozi_output.close()
+
+    bench("Payload summary (per-frame)", lambda: push_payload_summary(TELEMETRY, udp_port=SUMMARY_PORT), summary_rx, num_frames)
+
+    summary_output = UDPOutput([('127.0.0.1', SUMMARY_PORT)], broadcast=True, bind_port=HORUS_UDP_PORT)
+    bench("Payload summary (UDPOutput)", lambda: summary_output.send(telemetry_to_payload_summary(TELEMETRY)), summary_rx, num_frames)
+    summary_output.close()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# auto_rx debug utils - Simulate the scan scheduler.
+#
+# Runs the ScanScheduler against a simulated clock over a number of days, with sondes launched at fixed
+# times each day, and models the main loop's scanning and decoding. Reports how long each sonde took to be
+# acquired, and the time spent scanning (as a proxy for SDR/CPU/USB load), compared to scanning continuously.
+#
+# Usage: python sim_scan_scheduler.py [days] [launch_times] [configured_launch_times]
+#  i.e.  python sim_scan_scheduler.py 14 23:15,11:15 ""     - Learn the launch times.
+#        python sim_scan_scheduler.py 14 23:15,11:15 23:15,11:15
+#
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from scan_scheduler import *
+
+# Model parameters (seconds).
+SCAN_OVERHEAD = 5       # Starting rtl_power, peak detection, etc.
+DETECT_TIME = 10        # rs_detect dwell time, per peak tested.
+ACQUIRE_DELAY = 300     # Time after launch before the sonde is above our horizon.
+FLIGHT_TIME = 7200      # Time the sonde stays above our horizon.
+RX_TIMEOUT = 120
+SEARCH_DELAY = 10       # search_delay, when not using the scheduler.
+SCAN_DWELL = 20
+
+
+class SimClock(object):
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def simulate(days, launch_times, scheduler):
+    """ Returns (acquisition delays, time spent scanning, number of scans). """
+    clock = SimClock(0.0)
+    if scheduler != None:
+        scheduler.clock = clock
+
+    launches = sorted([day*86400 + minute*60 for day in range(days) for minute in launch_times])
+    visible = lambda t: [l for l in launches if (l + ACQUIRE_DELAY) <= t <= (l + FLIGHT_TIME)]
+    acquired = {}
+    scan_time = 0.0
+    scans = 0
+    config = {'search_attempts': 5, 'search_delay': SEARCH_DELAY, 'scan_dwell': SCAN_DWELL}
+
+    while clock.now < days*86400:
+        search_config = scheduler.search_config(config) if scheduler != None else config
+
+        # sonde_search()
+        found = None
+        for attempt in range(search_config['search_attempts']):
+            duration = SCAN_OVERHEAD + search_config['scan_dwell'] + DETECT_TIME
+            clock.now += duration
+            scan_time += duration
+            scans += 1
+            in_air = [l for l in visible(clock.now) if l not in acquired]
+            if len(in_air) > 0:
+                found = in_air[0]
+                break
+            clock.now += search_config['search_delay']
+
+        if found != None:
+            acquired[found] = clock.now - (found + ACQUIRE_DELAY)
+            if scheduler != None:
+                scheduler.record_acquisition()
+            # Decode until the sonde drops below the horizon, then time out.
+            clock.now = found + FLIGHT_TIME + RX_TIMEOUT
+            clock.now += search_config['search_delay']
+        elif scheduler != None:
+            clock.now += scheduler.idle_time()
+
+    delays = [acquired.get(l) for l in launches if (l + FLIGHT_TIME) < days*86400]
+    return (delays, scan_time, scans)
+
+
+def report(name, delays, scan_time, scans, days):
+    acquired = [d for d in delays if d != None]
+    print("%-28s %d/%d sondes acquired, mean delay %.0f s, max delay %.0f s, %.1f%% of time scanning (%d scans/day)" % (
+        name, len(acquired), len(delays), sum(acquired)/max(1, len(acquired)), max(acquired + [0]), 100.0*scan_time/(days*86400), scans//days))
+    return acquired
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 14
+    launch_times = parse_launch_times(sys.argv[2] if len(sys.argv) > 2 else "23:15,11:15")
+    configured = parse_launch_times(sys.argv[3] if len(sys.argv) > 3 else "")
+
+    (delays, scan_time, scans) = simulate(days, launch_times, None)
+    report("Continuous scanning", delays, scan_time, scans, days)
+
+    history_file = os.path.join(tempfile.mkdtemp(), "launch_history.json")
+    scheduler = ScanScheduler(launch_times=configured, history_file=history_file)
+    (delays, scan_time, scans) = simulate(days, launch_times, scheduler)
+    report("Scheduler", delays, scan_time, scans, days)
+    print("Launch times (minutes since midnight UTC): %s" % str(scheduler.launch_times()))
+
+    # Check that we have not missed any launches.
+    if None in delays:
+        print("MISSED %d launches!" % delays.count(None))
+        sys.exit(1)
@@ -0,0 +1,147 @@
+
+/*
+ * Block sample reader and zero crossing bit slicer, see fsk_demod.h
+ *
+ * gcc -c fsk_demod.c
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "fsk_demod.h"
+
+
+/*
+ * bits_sample: 8 (unsigned) or 16 (signed, little endian)
+ * channels: only the first (left/mono) channel is used
+ */
+int sample_reader_init(sample_reader_t *reader, FILE *fp, int bits_sample, int channels) {
+
+    if ((bits_sample != 8) && (bits_sample != 16)) return -1;
+    if (channels < 1) return -1;
+
+    reader->fp = fp;
+    reader->bits_sample = bits_sample;
+    reader->channels = channels;
+    reader->filter = NULL;
+    reader->count = 0;
+    reader->pos = 0;
+    reader->block_start = 0;
+
+    reader->raw = malloc(SAMPLE_BLOCK * channels * (bits_sample/8));
+    reader->samples = malloc(SAMPLE_BLOCK * sizeof(short));
+    if (reader->raw == NULL || reader->samples == NULL) {
+        sample_reader_free(reader);
+        return -1;
+    }
+
+    return 0;
+}
+
+/*
+ * Read the next block of samples. Returns the number of samples read,
+ * or 0 at the end of the input (an incomplete last frame is dropped).
+ */
+int sample_reader_fill(sample_reader_t *reader) {
+    int i, frames, frame_bytes;
+    unsigned char *p;
+
+    reader->block_start += reader->count;
+    reader->count = 0;
+    reader->pos = 0;
+
+    frame_bytes = reader->channels * (reader->bits_sample/8);
+    frames = fread(reader->raw, frame_bytes, SAMPLE_BLOCK, reader->fp);
+
+    p = reader->raw;
+    if (reader->bits_sample == 8) {
+        for (i = 0; i < frames; i++, p += frame_bytes) {
+            reader->samples[i] = p[0] - 128;  // 8bit: 00..FF, centerpoint 0x80=128
+        }
+    }
+    else {
+        for (i = 0; i < frames; i++, p += frame_bytes) {
+            reader->samples[i] = (short)(p[0] | (p[1] << 8));
+        }
+    }
+
+    if (reader->filter && frames > 0) reader->filter(reader->samples, frames);
+
+    reader->count = frames;
+
+    return frames;
+}
+
+void sample_reader_free(sample_reader_t *reader) {
+    free(reader->raw);
+    free(reader->samples);
+    reader->raw = NULL;
+    reader->samples = NULL;
+}
+
+/* ------------------------------------------------------------------------------------ */
+
+void bit_slicer_init(bit_slicer_t *slicer, int res) {
+    slicer->res = res;
+    slicer->par = 1;
+    slicer->n = 0;
+    slicer->sample = 0;
+    slicer->x0 = 0;
+}
+
+/*
+ * Scan samples[*pos..count) for the end of the current run, i.e. the next
+ * zero crossing. If found, returns 1 with the polarity of the run (bit: 1
+ * above zero, 0 below) and its length in samples (len), and *pos just after
+ * the crossing. Otherwise returns 0, with the run continued in the next block.
+ */
+int bit_slicer_run(bit_slicer_t *slicer, short *samples, int count, int *pos, int *bit, float *len) {
+    int i = *pos,
+        n = slicer->n,
+        par = slicer->par,
+        sample = slicer->sample,
+        y0 = sample;
+    float x1;
+
+    while (i < count) {
+        y0 = sample;
+        sample = samples[i++];
+        n++;
+        if ((sample >= 0) != (par > 0)) break;  // 8bit: 0..127,128..255 (-128..-1,0..127)
+    }
+
+    *pos = i;
+    slicer->sample = sample;
+
+    if ((sample >= 0) == (par > 0)) {  // no crossing in this block
+        slicer->n = n;
+        return 0;
+    }
+
+    if (!slicer->res) *len = (float)n;
+    else {                                 // genauere Bitlaengen-Messung
+        x1 = sample/(float)(sample-y0);    // hilft bei niedriger sample rate
+        *len = n+slicer->x0-x1;
+        slicer->x0 = x1;
+    }
+
+    *bit = (1+par)/2;  // oben 1, unten -1
+
+    slicer->par = -par;
+    slicer->n = 0;
+
+    return 1;
+}
+
+/*
+ * Read the next run of bits from reader, as read_bits_fsk(): returns 0 with
+ * the polarity and length (in samples) of the run, or EOF.
+ */
+int bit_slicer_read(bit_slicer_t *slicer, sample_reader_t *reader, int *bit, float *len) {
+
+    for ( ; ; ) {
+        if (reader->pos == reader->count && sample_reader_fill(reader) == 0) return EOF;
+        if (bit_slicer_run(slicer, reader->samples, reader->count, &reader->pos, bit, len)) return 0;
+    }
+}
+
@@ -0,0 +1,65 @@
+
+#ifndef FSK_DEMOD_H
+#define FSK_DEMOD_H
+
+#include <stdio.h>
+
+
+/*
+ * Block sample reader and zero crossing bit slicer, shared by the FSK
+ * demodulators (rs41ecc, rs92ecc, rs_module, dfm06, m10x, rs_detect).
+ *
+ * The reader fread()s SAMPLE_BLOCK frames of audio at a time, and converts
+ * them to signed 16 bit samples (left/mono channel), instead of two fgetc()
+ * calls per sample. The bit slicer then scans the block for the next zero
+ * crossing in a single loop.
+ */
+
+#define SAMPLE_BLOCK  4096
+
+#define EOF_INT  0x1000000
+
+typedef struct {
+    FILE *fp;
+    int bits_sample;
+    int channels;
+    void (*filter)(short *, int);  // optional, applied to each block as it is read
+    unsigned char *raw;
+    short *samples;
+    int count;                     // samples in the current block
+    int pos;                       // next sample in the current block
+    unsigned long block_start;     // samples before the current block
+} sample_reader_t;
+
+typedef struct {
+    int res;     // interpolated zero crossings (genauere Bitlaengen-Messung)
+    int par;     // polarity of the current run
+    int n;       // samples in the current run
+    int sample;  // last sample
+    float x0;
+} bit_slicer_t;
+
+
+int sample_reader_init(sample_reader_t *, FILE *, int, int);
+int sample_reader_fill(sample_reader_t *);
+void sample_reader_free(sample_reader_t *);
+
+void bit_slicer_init(bit_slicer_t *, int);
+int bit_slicer_run(bit_slicer_t *, short *, int, int *, int *, float *);
+int bit_slicer_read(bit_slicer_t *, sample_reader_t *, int *, float *);
+
+
+// next sample, or EOF_INT
+static inline int sample_reader_get(sample_reader_t *reader) {
+    if (reader->pos == reader->count && sample_reader_fill(reader) == 0) return EOF_INT;
+    return reader->samples[reader->pos++];
+}
+
+// samples read so far
+static inline unsigned long sample_reader_count(sample_reader_t *reader) {
+    return reader->block_start + reader->pos;
+}
+
+
+#endif  /* FSK_DEMOD_H */
+
@@ -13,6 +13,8 @@
  *   -b       alternative Demodulation
  *   --avg    moving average
  *   --ecc    Hamming Error Correction
+ *
+ * gcc dfm06.c ../demod/fsk_demod.c -I../demod -o dfm06
  */
 
 #include <stdio.h>
@@ -21,6 +23,8 @@
 //#include <math.h>
 #include <stdlib.h>
 
+#include "fsk_demod.h"
+
 #ifdef CYGWIN
   #include <fcntl.h>  // cygwin: _setmode()
   #include <io.h>
@@ -133,69 +137,39 @@ int read_wav_header(FILE *fp) {
 }
 
 
-#define EOF_INT  0x1000000
-
 #define LEN_movAvg 3
 int movAvg[LEN_movAvg];
-unsigned long sample_count = 0;
 
-int read_signed_sample(FILE *fp) {  // int = i32_t
-    int byte, i, sample, s=0;       // EOF -> 0x1000000
-
-    for (i = 0; i < channels; i++) {
-                           // i = 0: links bzw. mono
-        byte = fgetc(fp);
-        if (byte == EOF) return EOF_INT;
-        if (i == 0) sample = byte;
+sample_reader_t reader;
+bit_slicer_t slicer;
 
-        if (bits_sample == 16) {
-            byte = fgetc(fp);
-            if (byte == EOF) return EOF_INT;
-            if (i == 0) sample +=  byte << 8;
-        }
+void moving_average(short *samples, int count) {  // option_avg, as reader.filter
+    static unsigned long k = 0;
+    int i, j, s;
 
-    }
-
-    if (bits_sample ==  8)  s = sample-128;   // 8bit: 00..FF, centerpoint 0x80=128
-    if (bits_sample == 16)  s = (short)sample;
-
-    if (option_avg) {
-        movAvg[sample_count % LEN_movAvg] = s;
+    for (i = 0; i < count; i++) {
+        movAvg[k % LEN_movAvg] = samples[i];
+        k++;
         s = 0;
-        for (i = 0; i < LEN_movAvg; i++) s += movAvg[i];
-        s = (s+0.5) / LEN_movAvg;
+        for (j = 0; j < LEN_movAvg; j++) s += movAvg[j];
+        samples[i] = (s+0.5) / LEN_movAvg;
     }
-
-    sample_count++;
-
-    return s;
 }
 
-int par=1, par_alt=1;
+int read_signed_sample(FILE *fp) {  // int = i32_t
+    return sample_reader_get(&reader);  // EOF -> 0x1000000
+}
 
 int read_bits_fsk(FILE *fp, int *bit, int *len) {
-    static int sample;
-    int n;
     float l;
 
-    n = 0;
-    do {
-        sample = read_signed_sample(fp);
-
-        if (sample == EOF_INT) return EOF;
-
-        par_alt = par;
-        par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
-        n++;
-    } while (par*par_alt > 0);
+    if (bit_slicer_read(&slicer, &reader, bit, &l) == EOF) return EOF;
 
-    l = (float)n / samples_per_bit;
+    l /= samples_per_bit;
 
     *len = (int)(l+0.5);
 
-    if (!option_inv) *bit = (1+par_alt)/2;  // oben 1, unten -1
-    else             *bit = (1-par_alt)/2;  // sdr#<rev1381?, invers: unten 1, oben -1
-// *bit = (1+inv*par_alt)/2; // ausser inv=0
+    if (option_inv) *bit ^= 1;  // sdr#<rev1381?, invers: unten 1, oben -1
 
     /* Y-offset ? */
 
@@ -221,7 +195,7 @@ int read_rawbit(FILE *fp, int *bit) {
     do {
         sample = read_signed_sample(fp);
         if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
+        //sample_count++; // in sample_reader_get()
         //par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
         sum += sample;
         scount++;
@@ -251,7 +225,7 @@ int read_rawbit2(FILE *fp, int *bit) {
     do {
         sample = read_signed_sample(fp);
         if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
+        //sample_count++; // in sample_reader_get()
         //par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
         sum += sample;
         scount++;
@@ -261,7 +235,7 @@ int read_rawbit2(FILE *fp, int *bit) {
     do {
         sample = read_signed_sample(fp);
         if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
+        //sample_count++; // in sample_reader_get()
         //par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
         sum -= sample;
         scount++;
@@ -296,7 +270,7 @@ int read_rawbit3(FILE *fp, int *bit) {
     do {
         sample = read_signed_sample(fp);
         if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
+        //sample_count++; // in sample_reader_get()
         //par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
         sum += sample*wc[n];
         n++;
@@ -803,10 +777,13 @@ int main(int argc, char **argv) {
 
 
     i = read_wav_header(fp);
+    if (i == 0) i = sample_reader_init(&reader, fp, bits_sample, channels);
     if (i) {
         fclose(fp);
         return -1;
     }
+    if (option_avg) reader.filter = moving_average;
+    bit_slicer_init(&slicer, 0);
 
     if (option_b > 2) {
         wc = (float*)calloc( 2*(int)(samples_per_bit+1), sizeof(float));
@@ -903,6 +880,7 @@ int main(int argc, char **argv) {
         if (wc) free(wc); wc = NULL;
     }
 
+    sample_reader_free(&reader);
     fclose(fp);
 
     return 0;
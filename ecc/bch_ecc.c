@@ -2,7 +2,7 @@
 /*
  *  BCH / Reed-Solomon
  *    encoder()
- *    decoder()  (Euklid. Alg.)
+ *    decoder()  (Berlekamp-Massey, Euklid. Alg. for uncorrectable words)
  *
  *
  * author: zilog80
@@ -354,7 +354,8 @@ static ui8_t GF_mul(ui8_t p, ui8_t q) {
   ui32_t x;
   if ((p == 0) || (q == 0)) return 0;
   x = (ui32_t)log_a[p] + log_a[q];
-  return exp_a[x % (GF.ord-1)];     // a^(ord-1) = 1
+  if (x >= GF.ord-1) x -= GF.ord-1; // a^(ord-1) = 1
+  return exp_a[x];
 }
 
 static ui8_t GF_inv(ui8_t p) {
@@ -369,29 +370,26 @@ static ui8_t GF_inv(ui8_t p) {
  */
 
 static
-ui8_t poly_eval(ui8_t poly[], ui8_t x) {
+ui8_t poly_evalH(int deg, ui8_t poly[], ui8_t x) {
     int n;
-    ui8_t xn, y;
+    ui8_t y;                          // Horner: p[0] + x(p[1] + x(...))
 
-    y = poly[0];
-    if (x != 0) {
-        for (n = 1; n < GF.ord-1; n++) {
-            xn = exp_a[(n*log_a[x]) % (GF.ord-1)];
-            y ^= GF_mul(poly[n], xn);
-        }
+    if (deg < 0) return 0;
+    y = poly[deg];
+    for (n = deg-1; n >= 0; n--) {
+        y = GF_mul(y, x) ^ poly[n];
     }
     return y;
 }
 
 static
-ui8_t poly_evalH(ui8_t poly[], ui8_t x) {
+ui8_t poly_eval(ui8_t poly[], ui8_t x) {
     int n;
-    ui8_t y;
-    y = poly[GF.ord-1];
-    for (n = GF.ord-2; n >= 0; n--) {
-        y = GF_mul(y, x) ^ poly[n];
-    }
-    return y;
+
+    if (x == 0) return poly[0];
+    n = GF.ord-2;                     // p[0..ord-2]
+    while (n > 0 && poly[n] == 0) n--;
+    return poly_evalH(n, poly, x);
 }
 
 
@@ -466,17 +464,19 @@ int poly_add(ui8_t a[], ui8_t b[], ui8_t *sum) {
 
 static
 int poly_mul(ui8_t a[], ui8_t b[], ui8_t *ab) {
-    int i, j;
+    int i, j, deg_a, deg_b;
     ui8_t c[MAX_DEG+1];
 
-    if (poly_deg(a)+poly_deg(b) > MAX_DEG) {
+    deg_a = poly_deg(a);
+    deg_b = poly_deg(b);
+    if (deg_a+deg_b > MAX_DEG) {
        return -1;
     }
 
     for (i = 0; i <= MAX_DEG; i++) { c[i] = 0; }
 
-    for (i = 0; i <= poly_deg(a); i++) {
-        for (j = 0; j <= poly_deg(b); j++) {
+    for (i = 0; i <= deg_a; i++) {
+        for (j = 0; j <= deg_b; j++) {
             c[i+j] ^= GF_mul(a[i], b[j]);
         }
     }
@@ -584,11 +584,12 @@ int polyGF_lfsr(int deg, int x2t, ui8_t S[],
 
 static
 int poly_D(ui8_t a[], ui8_t *Da) {
-    int i;
+    int i, deg_a;
 
     for (i = 0; i <= MAX_DEG; i++) { Da[i] = 0; } // unten werden nicht immer
                                                   // alle Koeffizienten gesetzt
-    for (i = 1; i <= poly_deg(a); i++) {
+    deg_a = poly_deg(a);
+    for (i = 1; i <= deg_a; i++) {
         if (i % 2) Da[i-1] = a[i];   // GF(2^n): b+b=0
     }
 
@@ -637,20 +638,107 @@ int era_sigma(int n, ui8_t era_pos[], ui8_t *sigma) {
     return 0;
 }
 
+
+/* --------------------------------------------------------------------------------------------- */
+
+/*
+ *  rem(x) = cw(x) mod g(x), deg(rem) < R <= 24
+ *  rem[0..R-1] held in 3 64bit words (rem[j]: word j/8, bits 8*(j%8)..),
+ *  one shift/xor per word for each cw[n]
+ *  S_i = cw(alpha^(b+i)) = rem(alpha^(b+i)), since g(alpha^(b+i)) = 0
+ */
+
+#define REM_WORDS 3
+
+typedef unsigned long long rem_t;
+
+static rem_t rem_tab[256][REM_WORDS],  // rem_tab[c] = c*(g(x) - x^R)
+             rem_mask[REM_WORDS];      // rem[0..R-1]
+static int rem_fb;                     // bit position of rem[R-1]
+
+static
+void rem_genTab(void) {
+    int c, j, k;
+
+    for (c = 0; c < GF.ord; c++) {
+        for (k = 0; k < REM_WORDS; k++) rem_tab[c][k] = 0;
+        for (j = 0; j < RS.R; j++) rem_tab[c][j/8] |= (rem_t)GF_mul(c, RS.g[j]) << (8*(j%8));
+    }
+    for (k = 0; k < REM_WORDS; k++) rem_mask[k] = 0;
+    for (j = 0; j < RS.R; j++) rem_mask[j/8] |= (rem_t)0xFF << (8*(j%8));
+    rem_fb = 8*(RS.R-1);
+}
+
+static
+int poly_rem(ui8_t cw[], ui8_t *rem) {
+    int j, n;
+    rem_t w[REM_WORDS], *t;
+    ui8_t c;
+
+    for (j = 0; j < REM_WORDS; j++) w[j] = 0;
+
+    for (n = RS.N-1; n >= 0; n--) {  // rem = x*rem + cw[n] mod g, x^R = g(x) - x^R
+        c = w[rem_fb/64] >> (rem_fb%64);
+        w[2] = ((w[2] << 8) | (w[1] >> 56)) & rem_mask[2];
+        w[1] = ((w[1] << 8) | (w[0] >> 56)) & rem_mask[1];
+        w[0] = ((w[0] << 8) | cw[n])        & rem_mask[0];
+        t = rem_tab[c];
+        w[0] ^= t[0]; w[1] ^= t[1]; w[2] ^= t[2];
+    }
+
+    if ((w[0] | w[1] | w[2]) == 0) return 0;
+
+    for (j = 0; j < RS.R; j++) rem[j] = w[j/8] >> (8*(j%8));
+    return 1;
+}
+
 static
 int syndromes(ui8_t cw[], ui8_t *S) {
     int i, errors = 0;
-    ui8_t a_i;
+    ui8_t a_i, rem[MAX_DEG+1];
+
+    for (i = 0; i < 2*RS.t; i++) S[i] = 0;
+    if (poly_rem(cw, rem) == 0) return 0;  // S(x)=0
 
     // syndromes: e_j=S(alpha^(b+i))
     for (i = 0; i < 2*RS.t; i++) {
         a_i = exp_a[(RS.b+i) % (GF.ord-1)];  // alpha^(b+i)
-        S[i] = poly_eval(cw, a_i);
+        S[i] = poly_evalH(RS.R-1, rem, a_i);
         if (S[i]) errors = 1;
     }
     return errors;
 }
 
+static
+int polyGF_bm(ui8_t S[], ui8_t *Lambda) {
+// Berlekamp-Massey: shortest LFSR generating S[0..2t-1],
+// Lambda(0)=1, returns L (length)
+    int i, n, L = 0, m = 1;
+    ui8_t B[MAX_DEG+1], T[MAX_DEG+1];
+    ui8_t b = 1, d, c;
+
+    for (i = 0; i <= MAX_DEG; i++) { Lambda[i] = 0; B[i] = 0; }
+    Lambda[0] = 1; B[0] = 1;
+
+    for (n = 0; n < 2*RS.t; n++) {
+        d = S[n];  // discrepancy
+        for (i = 1; i <= L; i++) d ^= GF_mul(Lambda[i], S[n-i]);
+        if (d == 0) { m++; continue; }
+
+        c = GF_mul(d, GF_inv(b));
+        for (i = 0; i <= 2*RS.t; i++) T[i] = Lambda[i];
+        for (i = 0; i+m <= 2*RS.t; i++) Lambda[i+m] ^= GF_mul(c, B[i]);  // Lambda - d/b x^m B
+        if (2*L <= n) {
+            L = n+1-L;
+            for (i = 0; i <= 2*RS.t; i++) B[i] = T[i];
+            b = d;
+            m = 1;
+        }
+        else m++;
+    }
+
+    return L;
+}
 
 static
 int prn_GFpoly(ui32_t p) {
@@ -729,6 +817,7 @@ int rs_init_RS255() {
         Xalp[0] = exp_a[(RS.b+i) % (GF.ord-1)];  // Xalp[0..1]: X - alpha^(b+i)
         poly_mul(RS.g, Xalp, RS.g);
     }
+    rem_genTab();
 
     return check_gen;
 }
@@ -745,6 +834,7 @@ int rs_init_BCH64() {
     // g(X)=X^12+X^10+X^8+X^5+X^4+X^3+1
     //     =(X^6+X+1)(X^6+X^4+X^2+X+1)
     RS.g[0] = RS.g[3] = RS.g[4] = RS.g[5] = RS.g[8] = RS.g[10] = RS.g[12] = 1;
+    rem_genTab();
 
     return check_gen;
 }
@@ -821,7 +911,7 @@ int rs_decode_ErrEra(ui8_t cw[], int nera, ui8_t era_pos[],
         nerr = 0; // Errors + Erasures (erasure-pos bereits bekannt)
         for (i = 1; i < GF.ord ; i++) { // Lambda(0)=1
             x = (ui8_t)i;    // roll-over
-            if (poly_eval(sigLam, x) == 0) { // Lambda(x)=0 fuer x in erasures[] moeglich
+            if (poly_evalH(deg_sigLam, sigLam, x) == 0) { // Lambda(x)=0 fuer x in erasures[] moeglich
                 // error location index
                 err_pos[nerr] = log_a[GF_inv(x)];
                 // error value;   bin-BCH: err_val=1
@@ -844,8 +934,52 @@ int rs_decode_ErrEra(ui8_t cw[], int nera, ui8_t era_pos[],
 }
 
 // Errors <= RS.t
+/*
+ * Syndromes are 0 (no errors) unless cw(x) mod g(x) != 0.
+ * Up to t errors are found with Berlekamp-Massey (Lambda), Chien search and
+ * Forney (Omega = S*Lambda mod x^2t); Lambda is unique then, so the result is
+ * the same as the Euclid decoder's. Anything else (more than t errors) is left
+ * to the Euclid decoder, for the same result in every case.
+ */
 int rs_decode(ui8_t cw[], ui8_t *err_pos, ui8_t *err_val) {
-    ui8_t tmp[1] = {0};
+    ui8_t x, tmp[1],
+          S[MAX_DEG+1],
+          Lambda[MAX_DEG+1],
+          Omega[MAX_DEG+1];
+    int i, j, n, L;
+
+    for (i = 0; i < 2*RS.t; i++) { err_pos[i] = 0; }
+    for (i = 0; i < 2*RS.t; i++) { err_val[i] = 0; }
+
+    for (i = 0; i <= MAX_DEG; i++) { S[i] = 0; }
+    if (syndromes(cw, S) == 0) return 0;
+
+    L = polyGF_bm(S, Lambda);
+    if (L <= RS.t && poly_deg(Lambda) == L) {
+
+        for (i = 0; i <= MAX_DEG; i++) { Omega[i] = 0; }
+        for (i = 0; i < 2*RS.t; i++) {
+            for (j = 0; j <= i && j <= L; j++) Omega[i] ^= GF_mul(Lambda[j], S[i-j]);
+        }
+
+        n = 0;
+        for (i = 1; i < GF.ord ; i++) { // Lambda(0)=1
+            x = (ui8_t)i;    // roll-over
+            if (poly_evalH(L, Lambda, x) == 0) {
+                err_pos[n] = log_a[GF_inv(x)];
+                err_val[n] = forney(x, Omega, Lambda);
+                n++;
+                if (n >= L) break;
+            }
+        }
+
+        if (n == L) {
+            for (i = 0; i < n; i++) cw[err_pos[i]] ^= err_val[i];
+            return n;
+        }
+    }
+
+    tmp[0] = 0;
     return rs_decode_ErrEra(cw, 0, tmp, err_pos, err_val);
 }
 
@@ -857,7 +991,7 @@ int rs_decode_bch_gf2t2(ui8_t cw[], ui8_t *err_pos, ui8_t *err_val) {
           L[MAX_DEG+1], L2,
           Lambda[MAX_DEG+1],
           Omega[MAX_DEG+1];
-    int i, n, errors = 0;
+    int i, n, deg, errors = 0;
 
 
     for (i = 0; i < RS.t; i++) { err_pos[i] = 0; }
@@ -903,20 +1037,21 @@ int rs_decode_bch_gf2t2(ui8_t cw[], ui8_t *err_pos, ui8_t *err_val) {
             }
         }
 
+        deg = poly_deg(Lambda);
         n = 0;
         for (i = 1; i < GF.ord ; i++) { // Lambda(0)=1
             x = (ui8_t)i;    // roll-over
-            if (poly_eval(Lambda, x) == 0) {
+            if (poly_evalH(deg, Lambda, x) == 0) {
                 // error location index
                 err_pos[n] = log_a[GF_inv(x)];
                 // error value;   bin-BCH: err_val=1
                 err_val[n] = 1; // = forney(x, Omega, Lambda);
                 n++;
             }
-            if (n >= poly_deg(Lambda)) break;
+            if (n >= deg) break;
         }
 
-        if (n < poly_deg(Lambda)) errors = -1; // uncorrectable errors
+        if (n < deg) errors = -1; // uncorrectable errors
         else {
             errors = n;
             for (i = 0; i < errors; i++) cw[err_pos[i]] ^= err_val[i];
@@ -0,0 +1,162 @@
+
+/*
+ *  RS(255,231) / BCH(63,51) decoder test and benchmark
+ *
+ *  Encodes random codewords, adds 0,1,2,... random errors, and decodes them,
+ *  reporting for each number of errors the words corrected, detected as
+ *  uncorrectable (<0) and mis-corrected, the codewords decoded per second,
+ *  and a checksum of all decoder output (return value, corrected word,
+ *  err_pos[], err_val[]). The checksums let two versions of the decoder be
+ *  compared bit for bit (-q leaves out the timing, for diff):
+ *
+ *    gcc -O2 ecc_bench.c -o ecc_bench                                  (bch_ecc.c)
+ *    gcc -O2 -DBCH_ECC='"old/bch_ecc.c"' ecc_bench.c -o ecc_bench_old
+ *    gcc -O2 -DRS_MODULE -I../rs_module ecc_bench.c ../rs_module/rs_bch_ecc.c -o ecc_bench_rsm
+ *
+ *    ./ecc_bench [options]
+ *      options:
+ *         -n <count>    codewords for each number of errors (default 20000)
+ *         -s <seed>
+ *         -b            BCH(63,51) (rs_decode_bch_gf2t2 and rs_decode)
+ *         -q            no timing
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#ifdef RS_MODULE
+  #include "rs_data.h"
+  #include "rs_bch_ecc.h"
+#else
+  typedef unsigned char  ui8_t;
+  typedef unsigned int   ui32_t;
+  #ifndef BCH_ECC
+    #define BCH_ECC "bch_ecc.c"
+  #endif
+  #include BCH_ECC
+#endif
+
+
+#define N_MAX   255
+#define ERR_MAX  24  // err_pos[], err_val[]: rs_decode_ErrEra() sets 2t
+
+typedef struct {
+    int ret;
+    ui8_t cw[N_MAX];
+    ui8_t err_pos[ERR_MAX];
+    ui8_t err_val[ERR_MAX];
+} result_t;
+
+static ui32_t rnd_state = 1;
+
+static ui32_t rnd(void) {  // xorshift32
+    rnd_state ^= rnd_state << 13;
+    rnd_state ^= rnd_state >> 17;
+    rnd_state ^= rnd_state << 5;
+    return rnd_state;
+}
+
+static ui32_t fnv1a(ui32_t h, ui8_t *p, int len) {
+    int i;
+    for (i = 0; i < len; i++) { h ^= p[i]; h *= 16777619; }
+    return h;
+}
+
+// random codeword (binary for BCH), with nerr errors at distinct positions
+static void gen_word(int bch, int N, int R, int nerr, ui8_t *cw, ui8_t *err) {
+    int i, j, pos;
+
+    for (i = 0; i < N_MAX; i++) cw[i] = 0;
+    for (i = R; i < N; i++) cw[i] = bch ? rnd() & 1 : rnd() & 0xFF;
+    rs_encode(cw);
+
+    for (i = 0; i < N_MAX; i++) err[i] = cw[i];
+    for (j = 0; j < nerr; j++) {
+        do { pos = rnd() % N; } while (err[pos] != cw[pos]);
+        err[pos] ^= bch ? 1 : 1 + rnd() % 255;
+    }
+}
+
+static int run(char *name, int (*decode)(ui8_t *, ui8_t *, ui8_t *),
+               int bch, int N, int R, int max_err, int count, int timing) {
+    ui8_t *words, *errs;
+    result_t *res;
+    int nerr, k, ok, fail, mis;
+    ui32_t h;
+    clock_t t0, t1;
+
+    words = malloc(count*N_MAX);
+    errs  = malloc(count*N_MAX);
+    res   = calloc(count, sizeof(result_t));
+    if (words == NULL || errs == NULL || res == NULL) return -1;
+
+    printf("%s\n", name);
+    printf("  errors  corrected  uncorrectable  mis-corrected  checksum%s\n", timing ? "   codewords/s" : "");
+
+    for (nerr = 0; nerr <= max_err; nerr++) {
+        for (k = 0; k < count; k++) gen_word(bch, N, R, nerr, words+k*N_MAX, errs+k*N_MAX);
+
+        t0 = clock();
+        for (k = 0; k < count; k++) {
+            memcpy(res[k].cw, errs+k*N_MAX, N_MAX);
+            memset(res[k].err_pos, 0, ERR_MAX);
+            memset(res[k].err_val, 0, ERR_MAX);
+            res[k].ret = decode(res[k].cw, res[k].err_pos, res[k].err_val);
+        }
+        t1 = clock();
+
+        ok = fail = mis = 0;
+        h = 2166136261u;
+        for (k = 0; k < count; k++) {
+            if (res[k].ret < 0) fail++;
+            else if (memcmp(res[k].cw, words+k*N_MAX, N_MAX) == 0) ok++;
+            else mis++;
+            h = fnv1a(h, (ui8_t *)&res[k].ret, sizeof(int));
+            h = fnv1a(h, res[k].cw, N_MAX);
+            h = fnv1a(h, res[k].err_pos, ERR_MAX);
+            h = fnv1a(h, res[k].err_val, ERR_MAX);
+        }
+
+        printf("  %6d  %9d  %13d  %13d  %08X", nerr, ok, fail, mis, h);
+        if (timing) printf("  %12.0f", count / ((double)(t1-t0)/CLOCKS_PER_SEC + 1e-9));
+        printf("\n");
+    }
+
+    free(words);
+    free(errs);
+    free(res);
+    return 0;
+}
+
+
+int main(int argc, char *argv[]) {
+    int count = 20000, bch = 0, timing = 1;
+
+    while (--argc) {
+        argv++;
+        if      (strcmp(*argv, "-b") == 0) bch = 1;
+        else if (strcmp(*argv, "-q") == 0) timing = 0;
+        else if (strcmp(*argv, "-n") == 0 && argc > 1) { count = atoi(*++argv); argc--; }
+        else if (strcmp(*argv, "-s") == 0 && argc > 1) { rnd_state = atoi(*++argv); argc--; }
+        else {
+            fprintf(stderr, "usage: ecc_bench [-n count] [-s seed] [-b] [-q]\n");
+            return 1;
+        }
+    }
+    if (rnd_state == 0) rnd_state = 1;
+
+    if (bch) {
+        rs_init_BCH64();
+        run("BCH(63,51), t=2: rs_decode_bch_gf2t2()", rs_decode_bch_gf2t2, 1, 63, 12, 5, count, timing);
+        run("BCH(63,51), t=2: rs_decode()", rs_decode, 1, 63, 12, 5, count, timing);
+    }
+    else {
+        rs_init_RS255();
+        run("RS(255,231), t=12: rs_decode()", rs_decode, 0, 255, 24, 16, count, timing);
+    }
+
+    return 0;
+}
+
@@ -1,7 +1,7 @@
 
 /* big endian forest
  *
- * gcc -o m10x m10x.c -lm
+ * gcc -o m10x m10x.c ../demod/fsk_demod.c -I../demod -lm
  *
  */
 
@@ -10,6 +10,8 @@
 #include <stdlib.h>
 #include <string.h>
 #include <math.h>
+
+#include "fsk_demod.h"
 #ifdef CYGWIN
   #include <fcntl.h>  // cygwin: _setmode()
   #include <io.h>
@@ -149,76 +151,40 @@ int read_wav_header(FILE *fp) {
 }
 
 
-#define EOF_INT  0x1000000
-
 #define LEN_movAvg 3
 int movAvg[LEN_movAvg];
-unsigned long sample_count = 0;
 double bitgrenze = 0;
 
-int read_signed_sample(FILE *fp) {  // int = i32_t
-    int byte, i, sample, s=0;       // EOF -> 0x1000000
-
-    for (i = 0; i < channels; i++) {
-                           // i = 0: links bzw. mono
-        byte = fgetc(fp);
-        if (byte == EOF) return EOF_INT;
-        if (i == 0) sample = byte;
-    
-        if (bits_sample == 16) {
-            byte = fgetc(fp);
-            if (byte == EOF) return EOF_INT;
-            if (i == 0) sample +=  byte << 8;
-        }
-
-    }
+sample_reader_t reader;
+bit_slicer_t slicer;
 
-    if (bits_sample ==  8)  s = sample-128;   // 8bit: 00..FF, centerpoint 0x80=128
-    if (bits_sample == 16)  s = (short)sample;
+void moving_average(short *samples, int count) {  // option_avg, as reader.filter
+    static unsigned long k = 0;
+    int i, j, s;
 
-    if (option_avg) {
-        movAvg[sample_count % LEN_movAvg] = s;
+    for (i = 0; i < count; i++) {
+        movAvg[k % LEN_movAvg] = samples[i];
+        k++;
         s = 0;
-        for (i = 0; i < LEN_movAvg; i++) s += movAvg[i];
-        s = (s+0.5) / LEN_movAvg;
+        for (j = 0; j < LEN_movAvg; j++) s += movAvg[j];
+        samples[i] = (s+0.5) / LEN_movAvg;
     }
-
-    sample_count++;
-
-    return s;
 }
 
-int par=1, par_alt=1;
+int read_signed_sample(FILE *fp) {  // int = i32_t
+    return sample_reader_get(&reader);  // EOF -> 0x1000000
+}
 
 int read_bits_fsk(FILE *fp, int *bit, int *len) {
-    static int sample;
-    int n, y0;
-    float l, x1;
-    static float x0;
+    float l;
 
-    n = 0;
-    do{
-        y0 = sample;
-        sample = read_signed_sample(fp);
-        if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
-        par_alt = par;
-        par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
-        n++;
-    } while (par*par_alt > 0);
+    if (bit_slicer_read(&slicer, &reader, bit, &l) == EOF) return EOF;
 
-    if (!option_res) l = (float)n / samples_per_bit;
-    else {                                 // genauere Bitlaengen-Messung
-        x1 = sample/(float)(sample-y0);    // hilft bei niedriger sample rate
-        l = (n+x0-x1) / samples_per_bit;   // meist mehr frames (nicht immer)
-        x0 = x1;
-    }
+    l /= samples_per_bit;
 
     *len = (int)(l+0.5);
 
-    if (!option_inv) *bit = (1+par_alt)/2;  // oben 1, unten -1
-    else             *bit = (1-par_alt)/2;  // sdr#<rev1381?, invers: unten 1, oben -1
-// *bit = (1+inv*par_alt)/2; // ausser inv=0
+    if (option_inv) *bit ^= 1;  // sdr#<rev1381?, invers: unten 1, oben -1
 
     /* Y-offset ? */
 
@@ -236,7 +202,7 @@ int read_rawbit(FILE *fp, int *bit) {
     if (bitstart)
     {
         n = 1;    // d.h. bitgrenze = sample_count-1 (?)
-        bitgrenze = sample_count-1;
+        bitgrenze = sample_reader_count(&reader)-1;
         bitstart = 0;
     }
     bitgrenze += samples_per_bit;
@@ -244,11 +210,11 @@ int read_rawbit(FILE *fp, int *bit) {
     do {
         sample = read_signed_sample(fp);
         if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
+        //sample_count++; // in sample_reader_get()
         //par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
         sum += sample;
         n++;
-    } while (sample_count < bitgrenze);  // n < samples_per_bit
+    } while (sample_reader_count(&reader) < bitgrenze);  // n < samples_per_bit
 
     if (sum >= 0) *bit = 1;
     else          *bit = 0;
@@ -874,10 +840,13 @@ int main(int argc, char **argv) {
 
 
     i = read_wav_header(fp);
+    if (i == 0) i = sample_reader_init(&reader, fp, bits_sample, channels);
     if (i) {
         fclose(fp);
         return -1;
     }
+    if (option_avg) reader.filter = moving_average;
+    bit_slicer_init(&slicer, option_res);
 
 
     pos = FRAMESTART;
@@ -934,6 +903,7 @@ int main(int argc, char **argv) {
 
     printf("\n");
 
+    sample_reader_free(&reader);
     fclose(fp);
 
     return 0;
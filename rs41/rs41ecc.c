@@ -12,10 +12,12 @@
  *            --avg        (moving average)
  *            -b           (alt. Demod.)
  *            --ecc        (Reed-Solomon)
+ *            --s16 <rate> (raw signed 16 bit mono input, e.g. from rtl_fm)
  */
 
 
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
 #include <math.h>
 
@@ -34,6 +36,8 @@ typedef int   i32_t;
 
 #include "bch_ecc.c"  // RS/ecc/
 
+#include "fsk_demod.h"
+
 
 typedef struct {
     int typ;
@@ -180,74 +184,90 @@ int read_wav_header(FILE *fp) {
 }
 
 
-#define EOF_INT  0x1000000
+/* ------------------------------------------------------------------------------------ */
 
-#define LEN_movAvg 3
-int movAvg[LEN_movAvg];
-unsigned long sample_count = 0;
+/*
+ * --s16 <sample_rate>: headerless signed 16 bit mono input (e.g. straight from rtl_fm) at any sample rate,
+ * instead of a WAV file. The filtering previously done by sox in the auto_rx pipelines is done here,
+ * and bit lengths are measured from interpolated zero crossings (as --res), as there are only a few
+ * samples per bit at rtl_fm sample rates.
+ */
+#define S16_HIGHPASS  20.0    // Hz, DC block
 
-int read_signed_sample(FILE *fp) {  // int = i32_t
-    int byte, i, sample, s=0;       // EOF -> 0x1000000
-
-    for (i = 0; i < channels; i++) {
-                           // i = 0: links bzw. mono
-        byte = fgetc(fp);
-        if (byte == EOF) return EOF_INT;
-        if (i == 0) sample = byte;
-
-        if (bits_sample == 16) {
-            byte = fgetc(fp);
-            if (byte == EOF) return EOF_INT;
-            if (i == 0) sample +=  byte << 8;
-        }
+int option_s16 = 0;
+float hp_r = 0, hp_x1 = 0, hp_y1 = 0;
+
+int init_s16_input(int rate) {
+    if (rate <= 0) return -1;
+
+    sample_rate = rate;
+    bits_sample = 16;
+    channels = 1;
+    samples_per_bit = sample_rate/(float)BAUD_RATE;
+    option_res = 1;
+
+    hp_r = 1.0 - 2.0*M_PI*S16_HIGHPASS/sample_rate;
+
+    fprintf(stderr, "sample_rate: %d (s16)\n", sample_rate);
+    fprintf(stderr, "samples/bit: %.2f\n", samples_per_bit);
+
+    return 0;
+}
 
+void filter_s16(short *samples, int count) {
+    int i;
+    float x, y;
+
+    for (i = 0; i < count; i++) {
+        x = samples[i];
+        y = x - hp_x1 + hp_r*hp_y1;
+        hp_x1 = x;
+        hp_y1 = y;
+        if (y >  32767) y =  32767;
+        if (y < -32768) y = -32768;
+        samples[i] = (int)(y < 0 ? y-0.5 : y+0.5);
     }
+}
+
 
-    if (bits_sample ==  8)  s = sample-128;   // 8bit: 00..FF, centerpoint 0x80=128
-    if (bits_sample == 16)  s = (short)sample;
+#define LEN_movAvg 3
+int movAvg[LEN_movAvg];
 
-    if (option_avg) {
-        movAvg[sample_count % LEN_movAvg] = s;
+sample_reader_t reader;
+bit_slicer_t slicer;
+
+void moving_average(short *samples, int count) {
+    static unsigned long k = 0;
+    int i, j, s;
+
+    for (i = 0; i < count; i++) {
+        movAvg[k % LEN_movAvg] = samples[i];
+        k++;
         s = 0;
-        for (i = 0; i < LEN_movAvg; i++) s += movAvg[i];
-        s = (s+0.5) / LEN_movAvg;
+        for (j = 0; j < LEN_movAvg; j++) s += movAvg[j];
+        samples[i] = (s+0.5) / LEN_movAvg;
     }
+}
 
-    sample_count++;
-
-    return s;
+void filter_samples(short *samples, int count) {  // as reader.filter
+    if (option_s16) filter_s16(samples, count);
+    if (option_avg) moving_average(samples, count);
 }
 
-int par=1, par_alt=1;
+int read_signed_sample(FILE *fp) {  // int = i32_t
+    return sample_reader_get(&reader);  // EOF -> 0x1000000
+}
 
 int read_bits_fsk(FILE *fp, int *bit, int *len) {
-    static int sample;
-    int n, y0;
-    float l, x1;
-    static float x0;
-
-    n = 0;
-    do{
-        y0 = sample;
-        sample = read_signed_sample(fp);
-        if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
-        par_alt = par;
-        par =  (sample >= 0) ? 1 : -1;  // 8bit: 0..127,128..255 (-128..-1,0..127)
-        n++;
-    } while (par*par_alt > 0);
-
-    if (!option_res) l = (float)n / samples_per_bit;
-    else {                                 // genauere Bitlaengen-Messung
-        x1 = sample/(float)(sample-y0);    // hilft bei niedriger sample rate
-        l = (n+x0-x1) / samples_per_bit;   // meist mehr frames (nicht immer)
-        x0 = x1;
-    }
+    float l;
+
+    if (bit_slicer_read(&slicer, &reader, bit, &l) == EOF) return EOF;
+
+    l /= samples_per_bit;                  // option_res: meist mehr frames (nicht immer)
 
     *len = (int)(l+0.5);
 
-    if (!option_inv) *bit = (1+par_alt)/2;  // oben 1, unten -1
-    else             *bit = (1-par_alt)/2;  // sdr#<rev1381?, invers: unten 1, oben -1
+    if (option_inv) *bit ^= 1;  // sdr#<rev1381?, invers: unten 1, oben -1
 
     /* Y-offset ? */
 
@@ -277,7 +297,7 @@ int read_rawbit(FILE *fp, int *bit) {
     do {
         sample = read_signed_sample(fp);
         if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
+        //sample_count++; // in sample_reader_get()
         //par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
         sum += sample;
 
@@ -1148,6 +1168,7 @@ int main(int argc, char *argv[]) {
             fprintf(stderr, "       -b           (alt. Demod.)\n");
             fprintf(stderr, "       --ecc        (Reed-Solomon)\n");
             fprintf(stderr, "       --std        (std framelen)\n");
+            fprintf(stderr, "       --s16 <rate> (raw s16 input)\n");
             return 0;
         }
         else if ( (strcmp(*argv, "-v") == 0) || (strcmp(*argv, "--verbose") == 0) ) {
@@ -1157,6 +1178,11 @@ int main(int argc, char *argv[]) {
         else if   (strcmp(*argv, "-vv") == 0) { option_verbose = 3; }
         else if   (strcmp(*argv, "--crc") == 0) { option_crc = 1; }
         else if   (strcmp(*argv, "--res") == 0) { option_res = 1; }
+        else if   (strcmp(*argv, "--s16") == 0) {
+            ++argv;
+            if (*argv) option_s16 = atoi(*argv);
+            else return -1;
+        }
         else if ( (strcmp(*argv, "-r") == 0) || (strcmp(*argv, "--raw") == 0) ) {
             option_raw = 1;
         }
@@ -1185,11 +1211,15 @@ int main(int argc, char *argv[]) {
     if (!wavloaded) fp = stdin;
 
 
-    i = read_wav_header(fp);
+    if (option_s16) i = init_s16_input(option_s16);
+    else            i = read_wav_header(fp);
+    if (i == 0) i = sample_reader_init(&reader, fp, bits_sample, channels);
     if (i) {
         fclose(fp);
         return -1;
     }
+    if (option_s16 || option_avg) reader.filter = filter_samples;
+    bit_slicer_init(&slicer, option_res);
 
 
     if (option_ecc) {
@@ -1278,6 +1308,7 @@ int main(int argc, char *argv[]) {
 
     }
 
+    sample_reader_free(&reader);
     fclose(fp);
 
     return 0;
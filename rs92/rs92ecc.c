@@ -19,7 +19,7 @@
  */
 
 /*
-    gcc rs92ecc.c -lm -o rs92ecc
+    gcc rs92ecc.c ../demod/fsk_demod.c -I../ecc/ -I../demod/ -lm -o rs92ecc
     (includes nav_gps_vel.c)
 
     examples:
@@ -30,6 +30,8 @@
     sox -t oss /dev/dsp -t wav - lowpass 2600 2>/dev/null | stdbuf -oL ./rs92ecc -r > raw2.out
     ./rs92ecc --dop 5 -gg -e brdc3050.15n --rawin1 raw.out
 
+    rtl_fm -p 0 -g 26.0 -M fm -F9 -s 12k -f 400500000 2>/dev/null | ./rs92ecc --crc --ecc --vel -e brdc3050.15n --s16 12000
+
     sox -t oss /dev/dsp -t wav - lowpass 2600 2>/dev/null | tee audio.wav | ./rs92ecc -e brdc3050.15n
     ./rs92ecc -g1 -e brdc3050.15n 2015_11_01-14.wav | tee out1.txt
     ./rs92ecc -g2 -e brdc3050.15n 2015_11_01-14.wav | tee out2.txt
@@ -60,6 +62,8 @@ typedef unsigned int   ui32_t;
 
 #include "bch_ecc.c"  // RS/ecc/
 
+#include "fsk_demod.h"
+
 #define rs_N 255
 #define rs_R 24
 #define rs_K (rs_N-rs_R)
@@ -236,75 +240,112 @@ int read_wav_header(FILE *fp) {
 }
 
 
-#define EOF_INT  0x1000000
+/* ------------------------------------------------------------------------------------ */
+
+/*
+ * --s16 <sample_rate>: headerless signed 16 bit mono input (e.g. straight from rtl_fm) at any sample rate,
+ * instead of a WAV file. The filtering previously done by sox in the auto_rx pipelines is done here (highpass and lowpass),
+ * and bit lengths are measured from interpolated zero crossings (as --res), as there are only a few
+ * samples per bit at rtl_fm sample rates.
+ */
+#define S16_HIGHPASS  20.0    // Hz, DC block
+#define S16_LOWPASS 2500.0    // Hz, 2nd order Butterworth
+int option_s16 = 0;
+float hp_r = 0, hp_x1 = 0, hp_y1 = 0;
+float lp_b0 = 1, lp_b1 = 0, lp_b2 = 0, lp_a1 = 0, lp_a2 = 0,
+      lp_x1 = 0, lp_x2 = 0, lp_y1 = 0, lp_y2 = 0;
+
+int init_s16_input(int rate) {
+    double w0, alpha, a0;
+
+    if (rate <= 0) return -1;
+
+    sample_rate = rate;
+    bits_sample = 16;
+    channels = 1;
+    samples_per_bit = sample_rate/(float)BAUD_RATE;
+    option_res = 1;
+
+    hp_r = 1.0 - 2.0*M_PI*S16_HIGHPASS/sample_rate;
+
+    if (S16_LOWPASS < sample_rate/2.0) {
+        w0 = 2.0*M_PI*S16_LOWPASS/sample_rate;
+        alpha = sin(w0)/(2.0*M_SQRT1_2);
+        a0 = 1.0 + alpha;
+        lp_b0 = (1.0 - cos(w0))/2.0/a0;
+        lp_b1 = (1.0 - cos(w0))/a0;
+        lp_b2 = lp_b0;
+        lp_a1 = -2.0*cos(w0)/a0;
+        lp_a2 = (1.0 - alpha)/a0;
+    }
+
+    fprintf(stderr, "sample_rate: %d (s16)\n", sample_rate);
+    fprintf(stderr, "samples/bit: %.2f\n", samples_per_bit);
+
+    return 0;
+}
+
+void filter_s16(short *samples, int count) {
+    int i, x;
+    float y;
+
+    for (i = 0; i < count; i++) {
+        x = samples[i];
+        y = x - hp_x1 + hp_r*hp_y1;
+        hp_x1 = x;
+        hp_y1 = y;
+
+        x = y;
+        y = lp_b0*x + lp_b1*lp_x1 + lp_b2*lp_x2 - lp_a1*lp_y1 - lp_a2*lp_y2;
+        lp_x2 = lp_x1; lp_x1 = x;
+        lp_y2 = lp_y1; lp_y1 = y;
+
+        if (y >  32767) y =  32767;
+        if (y < -32768) y = -32768;
+        samples[i] = (int)(y < 0 ? y-0.5 : y+0.5);
+    }
+}
+
 
 #define LEN_movAvg 3
 int movAvg[LEN_movAvg];
-unsigned long sample_count = 0;
 double bitgrenze = 0;
 
-int read_signed_sample(FILE *fp) {  // int = i32_t
-    int byte, i, sample, s=0;       // EOF -> 0x1000000
-
-    for (i = 0; i < channels; i++) {
-                           // i = 0: links bzw. mono
-        byte = fgetc(fp);
-        if (byte == EOF) return EOF_INT;
-        if (i == 0) sample = byte;
-
-        if (bits_sample == 16) {
-            byte = fgetc(fp);
-            if (byte == EOF) return EOF_INT;
-            if (i == 0) sample +=  byte << 8;
-        }
-
-    }
+sample_reader_t reader;
+bit_slicer_t slicer;
 
-    if (bits_sample ==  8)  s = sample-128;   // 8bit: 00..FF, centerpoint 0x80=128
-    if (bits_sample == 16)  s = (short)sample;
+void moving_average(short *samples, int count) {
+    static unsigned long k = 0;
+    int i, j, s;
 
-    if (option_avg) {
-        movAvg[sample_count % LEN_movAvg] = s;
+    for (i = 0; i < count; i++) {
+        movAvg[k % LEN_movAvg] = samples[i];
+        k++;
         s = 0;
-        for (i = 0; i < LEN_movAvg; i++) s += movAvg[i];
-        s = (s+0.5) / LEN_movAvg;
+        for (j = 0; j < LEN_movAvg; j++) s += movAvg[j];
+        samples[i] = (s+0.5) / LEN_movAvg;
     }
+}
 
-    sample_count++;
-
-    return s;
+void filter_samples(short *samples, int count) {  // as reader.filter
+    if (option_s16) filter_s16(samples, count);
+    if (option_avg) moving_average(samples, count);
 }
 
-int par=1, par_alt=1;
+int read_signed_sample(FILE *fp) {  // int = i32_t
+    return sample_reader_get(&reader);  // EOF -> 0x1000000
+}
 
 int read_bits_fsk(FILE *fp, int *bit, int *len) {
-    static int sample;
-    int n, y0;
-    float l, x1;
-    static float x0;
+    float l;
 
-    n = 0;
-    do{
-        y0 = sample;
-        sample = read_signed_sample(fp);
-        if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
-        par_alt = par;
-        par =  (sample >= 0) ? 1 : -1;  // 8bit: 0..127,128..255 (-128..-1,0..127)
-        n++;
-    } while (par*par_alt > 0);
+    if (bit_slicer_read(&slicer, &reader, bit, &l) == EOF) return EOF;
 
-    if (!option_res) l = (float)n / samples_per_bit;
-    else {                                 // genauere Bitlaengen-Messung
-        x1 = sample/(float)(sample-y0);    // hilft bei niedriger sample rate
-        l = (n+x0-x1) / samples_per_bit;   // meist mehr frames (nicht immer)
-        x0 = x1;
-    }
+    l /= samples_per_bit;
 
     *len = (int)(l+0.5);
 
-    if (!option_inv) *bit = (1+par_alt)/2;  // oben 1, unten -1
-    else             *bit = (1-par_alt)/2;  // sdr#<rev1381?, invers: unten 1, oben -1
+    if (option_inv) *bit ^= 1;  // sdr#<rev1381?, invers: unten 1, oben -1
 
     /* Y-offset ? */
 
@@ -321,7 +362,7 @@ int read_rawbit(FILE *fp, int *bit) {
 
     if (bitstart) {
         n = 1;    // d.h. bitgrenze = sample_count-1 (?)
-        bitgrenze = sample_count-1;
+        bitgrenze = sample_reader_count(&reader)-1;
         bitstart = 0;
     }
     bitgrenze += samples_per_bit;
@@ -329,11 +370,11 @@ int read_rawbit(FILE *fp, int *bit) {
     do {
         sample = read_signed_sample(fp);
         if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
+        //sample_count++; // in sample_reader_get()
         //par =  (sample >= 0) ? 1 : -1;    // 8bit: 0..127,128..255 (-128..-1,0..127)
         sum += sample;
         n++;
-    } while (sample_count < bitgrenze);  // n < samples_per_bit
+    } while (sample_reader_count(&reader) < bitgrenze);  // n < samples_per_bit
 
     if (sum >= 0) *bit = 1;
     else          *bit = 0;
@@ -1483,6 +1524,7 @@ int main(int argc, char *argv[]) {
             fprintf(stderr, "       --crc       (CRC check GPS)\n");
             fprintf(stderr, "       --ecc       (Reed-Solomon)\n");
             fprintf(stderr, "       --rawin1,2  (raw_data file)\n");
+            fprintf(stderr, "       --s16 <rate> (raw s16 audio input)\n");
             return 0;
         }
         else if ( (strcmp(*argv, "--vel") == 0) ) {
@@ -1557,6 +1599,11 @@ int main(int argc, char *argv[]) {
         else if (strcmp(*argv, "-gg") == 0) { option_vergps = 8; }  // vverbose GPS
         else if (strcmp(*argv, "--rawin1") == 0) { rawin = 2; }     // raw_txt input1
         else if (strcmp(*argv, "--rawin2") == 0) { rawin = 3; }     // raw_txt input2 (SM)
+        else if (strcmp(*argv, "--s16") == 0) {                     // raw s16 audio input
+            ++argv;
+            if (*argv) option_s16 = atoi(*argv);
+            else return -1;
+        }
         else if ( (strcmp(*argv, "--avg") == 0) ) {
             option_avg = 1;
         }
@@ -1607,11 +1654,15 @@ int main(int argc, char *argv[]) {
 
     if (!rawin) {
 
-        i = read_wav_header(fp);
+        if (option_s16) i = init_s16_input(option_s16);
+        else            i = read_wav_header(fp);
+        if (i == 0) i = sample_reader_init(&reader, fp, bits_sample, channels);
         if (i) {
             fclose(fp);
             return -1;
         }
+        if (option_s16 || option_avg) reader.filter = filter_samples;
+        bit_slicer_init(&slicer, option_res);
 
         while (!read_bits_fsk(fp, &bit, &len)) {
 
@@ -1703,6 +1754,7 @@ int main(int argc, char *argv[]) {
     }
 
     free(ephs);
+    sample_reader_free(&reader);
     fclose(fp);
 
     return 0;
@@ -3,7 +3,7 @@
 #define RS_DATUM_H
 
 
-char weekday[7][4];
+extern char weekday[7][4];
 
 void Gps2Date(rs_data_t *);
 
@@ -4,6 +4,7 @@
 
 #include "rs_data.h"
 #include "rs_demod.h"
+#include "fsk_demod.h"
 
 
 static int sample_rate = 0,
@@ -11,6 +12,9 @@ static int sample_rate = 0,
            channels = 0;
 static float samples_per_bit = 0.0;
 
+static sample_reader_t reader;
+static bit_slicer_t slicer;
+
 static int findstr(char *buff, char *str, int pos) {
     int i;
     for (i = 0; i < 4; i++) {
@@ -74,72 +78,22 @@ int read_wav_header(FILE *fp, rs_data_t *rs_data) {
     fprintf(stderr, "samples/bit: %.2f\n", samples_per_bit);
     rs_data->samples_per_bit = samples_per_bit;
 
-    return 0;
-}
-
-
-#define EOF_INT  0x1000000
-
-static unsigned long sample_count = 0;
-
-static int read_signed_sample(FILE *fp) {  // int = i32_t
-    int byte, i, sample, s=0;              // EOF -> 0x1000000
-
-    for (i = 0; i < channels; i++) {
-                           // i = 0: left/mono
-        byte = fgetc(fp);
-        if (byte == EOF) return EOF_INT;
-        if (i == 0) sample = byte;
+    if (sample_reader_init(&reader, fp, bits_sample, channels)) return -1;
+    bit_slicer_init(&slicer, 0);
 
-        if (bits_sample == 16) {
-            byte = fgetc(fp);
-            if (byte == EOF) return EOF_INT;
-            if (i == 0) sample +=  byte << 8;
-        }
-
-    }
-
-    if (bits_sample ==  8)  s = sample-128;   // 8bit: 00..FF, centerpoint 0x80=128
-    if (bits_sample == 16)  s = (short)sample;
-
-    sample_count++;
-
-    return s;
+    return 0;
 }
 
-static int par=1, par_alt=1;
 
 int read_bits_fsk(FILE *fp, int *bit, int *len, int inv) {
+    float l;
 
-int option_res = 0;
-
-    static int sample;
-    int n, y0;
-    float l, x1;
-    static float x0;
-
-    n = 0;
-    do{
-        y0 = sample;
-        sample = read_signed_sample(fp);
-        if (sample == EOF_INT) return EOF;
-        //sample_count++; // in read_signed_sample()
-        par_alt = par;
-        par =  (sample >= 0) ? 1 : -1;  // 8bit: 0..127,128..255 (-128..-1,0..127)
-        n++;
-    } while (par*par_alt > 0);
-
-    if (!option_res) l = (float)n / samples_per_bit;
-    else {                                 // genauere Bitlaengen-Messung
-        x1 = sample/(float)(sample-y0);    // hilft bei niedriger sample rate
-        l = (n+x0-x1) / samples_per_bit;   // meist mehr frames (nicht immer)
-        x0 = x1;
-    }
+    if (bit_slicer_read(&slicer, &reader, bit, &l) == EOF) return EOF;
 
+    l /= samples_per_bit;
     *len = (int)(l+0.5);
 
-    if (!inv) *bit = (1+par_alt)/2;  // oben 1, unten -1
-    else      *bit = (1-par_alt)/2;  // sdr#<rev1381?, invers: unten 1, oben -1
+    if (inv) *bit ^= 1;  // sdr#<rev1381?, invers: unten 1, oben -1
 
     /* Y-offset ? */
 
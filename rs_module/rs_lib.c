@@ -0,0 +1,222 @@
+
+/*
+ * rs41/rs92 decoder library
+ *
+ * Decodes blocks of demodulated (FM audio, signed 16 bit) samples, rather
+ * than reading a WAV file: the same zero crossing bit slicer as
+ * read_bits_fsk() (demod/fsk_demod.c) and the same framing as
+ * rs_main41.c/rs_main92.c, but with the decoded frames returned as
+ * rs_frame_t records instead of printed.
+ *
+ * gcc -shared -fPIC -I../demod rs_lib.c rs_rs41.c rs_rs92.c rs_bch_ecc.c rs_demod.c rs_datum.c ../demod/fsk_demod.c -lm -o librs_module.so
+ *
+ * The rs41/rs92 modules keep some state (calibration data, GPS orbit data)
+ * in static variables, so calls for different decoders of the same type
+ * should not be made concurrently.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "rs_data.h"
+#include "rs_demod.h"
+#include "rs_rs41.h"
+#include "rs_rs92.h"
+#include "rs_lib.h"
+#include "fsk_demod.h"
+
+
+// block CRC flags, see rs_rs41.c and rs_rs92.c
+#define RS41_VALID_MASK  ((1<<0) | (1<<2) | (1<<4))  // FRAME, GPS1, GPS3
+#define RS92_VALID_MASK  ((1<<0) | (1<<2))           // CFG, GPS
+
+struct rs_decoder {
+    rs_data_t rs_data;
+    int type;
+    int inv;
+    int valid_mask;
+
+    // bit slicer
+    float samples_per_bit;
+    bit_slicer_t slicer;
+
+    // framing
+    char *bitbuf;
+    int bit_count;
+    int header_found;
+
+    // decoded frames, not yet read
+    rs_frame_t *frames;
+    int num_frames;
+    int max_frames;
+};
+
+
+static int add_frame(rs_decoder_t *dec) {
+    rs_data_t *rs_data = &dec->rs_data;
+    rs_frame_t *f;
+
+    (rs_data->rs_process)(rs_data, 0, 0);
+
+    if (dec->num_frames == dec->max_frames) {
+        f = realloc(dec->frames, 2*dec->max_frames*sizeof(rs_frame_t));
+        if (f == NULL) return ERROR_MALLOC;
+        dec->frames = f;
+        dec->max_frames *= 2;
+    }
+
+    f = &dec->frames[dec->num_frames++];
+    memset(f, 0, sizeof(rs_frame_t));
+
+    f->frame = rs_data->frnr;
+    strncpy(f->id, rs_data->SN, sizeof(f->id)-1);
+    f->year = rs_data->year; f->month = rs_data->month; f->day = rs_data->day;
+    f->hr = rs_data->hr; f->min = rs_data->min; f->sec = rs_data->sec;
+    f->lat = (rs_data->GPS).lat; f->lon = (rs_data->GPS).lon; f->alt = (rs_data->GPS).alt;
+    f->vel_h = (rs_data->GPS).vH; f->heading = (rs_data->GPS).vD; f->vel_v = (rs_data->GPS).vU;
+    f->freq = rs_data->freq;
+    f->crc = rs_data->crc;
+    f->ecc = rs_data->ecc;
+    f->valid = (rs_data->crc & dec->valid_mask) == 0;
+
+    return 0;
+}
+
+static void reset_frame(rs_decoder_t *dec) {
+    dec->bit_count = 0;
+    dec->rs_data.pos = dec->rs_data.frame_start;
+    dec->header_found = 0;
+}
+
+// handle a run of len bits, as in the main loop of rs_main41.c/rs_main92.c
+static int process_bits(rs_decoder_t *dec, int bit, int len) {
+    rs_data_t *rs_data = &dec->rs_data;
+    int i, err = 0;
+
+    if (len == 0) {
+        if (rs_data->pos > rs_data->pos_min) {
+            err = add_frame(dec);
+            reset_frame(dec);
+        }
+        else if (dec->type == RS_LIB_RS92) {
+            reset_frame(dec);
+        }
+        return err;
+    }
+
+    for (i = 0; i < len; i++) {
+
+        inc_bufpos(rs_data);
+        rs_data->buf[rs_data->bufpos] = 0x30 + bit;  // Ascii
+
+        if (!dec->header_found) {
+            if (compare(rs_data) >= rs_data->header_len) dec->header_found = 1;
+        }
+        else {
+            dec->bitbuf[dec->bit_count] = bit;
+            dec->bit_count++;
+
+            if (dec->bit_count == rs_data->bits) {
+                dec->bit_count = 0;
+                rs_data->frame_bytes[rs_data->pos] = rs_data->bits2byte(rs_data, dec->bitbuf);
+                rs_data->pos++;
+                if (rs_data->pos == rs_data->frame_len) {
+                    err = add_frame(dec);
+                    reset_frame(dec);
+                }
+            }
+        }
+    }
+
+    return err;
+}
+
+
+/*
+ * type: RS_LIB_RS41 or RS_LIB_RS92
+ * sample_rate: of the samples passed to rs_decoder_process()
+ * inv: 1 if the signal is inverted
+ * orbdata, eph_file: RS92 only, 1 for a SEM almanac, 2 for RINEX ephemeris
+ */
+rs_decoder_t *rs_decoder_new(int type, int sample_rate, int inv, int orbdata, char *eph_file) {
+    rs_decoder_t *dec;
+    int err;
+
+    dec = calloc(1, sizeof(rs_decoder_t));
+    if (dec == NULL) return NULL;
+
+    dec->type = type;
+    dec->inv = inv;
+    dec->rs_data.input = 8;
+
+    if (type == RS_LIB_RS41) {
+        err = init_rs41data(&dec->rs_data);
+        dec->valid_mask = RS41_VALID_MASK;
+    }
+    else if (type == RS_LIB_RS92) {
+        err = init_rs92data(&dec->rs_data, orbdata, eph_file);
+        dec->valid_mask = RS92_VALID_MASK;
+    }
+    else {
+        free(dec);
+        return NULL;
+    }
+
+    dec->samples_per_bit = sample_rate / (float)dec->rs_data.baud;
+    bit_slicer_init(&dec->slicer, 0);
+
+    dec->bitbuf = calloc(dec->rs_data.bits, 1);
+    dec->max_frames = 16;
+    dec->frames = calloc(dec->max_frames, sizeof(rs_frame_t));
+
+    if (err || dec->bitbuf == NULL || dec->frames == NULL) {
+        rs_decoder_free(dec);
+        return NULL;
+    }
+
+    reset_frame(dec);
+
+    return dec;
+}
+
+/*
+ * Decode a block of samples. Returns the number of frames waiting to be
+ * read with rs_decoder_read(), or ERROR_MALLOC.
+ */
+int rs_decoder_process(rs_decoder_t *dec, short *samples, int count) {
+    int pos = 0, bit;
+    float len;
+
+    while (bit_slicer_run(&dec->slicer, samples, count, &pos, &bit, &len)) {
+        if (process_bits(dec, dec->inv ? 1-bit : bit, (int)(len / dec->samples_per_bit + 0.5))) return ERROR_MALLOC;
+    }
+
+    return dec->num_frames;
+}
+
+/*
+ * Copy up to max_frames decoded frames into frames, oldest first, and
+ * remove them from the decoder. Returns the number of frames copied.
+ */
+int rs_decoder_read(rs_decoder_t *dec, rs_frame_t *frames, int max_frames) {
+    int count = (dec->num_frames < max_frames) ? dec->num_frames : max_frames;
+
+    memcpy(frames, dec->frames, count*sizeof(rs_frame_t));
+    memmove(dec->frames, dec->frames+count, (dec->num_frames-count)*sizeof(rs_frame_t));
+    dec->num_frames -= count;
+
+    return count;
+}
+
+void rs_decoder_free(rs_decoder_t *dec) {
+    if (dec == NULL) return;
+
+    if (dec->type == RS_LIB_RS41) free_rs41data(&dec->rs_data);
+    if (dec->type == RS_LIB_RS92) free_rs92data(&dec->rs_data);
+
+    free(dec->bitbuf);
+    free(dec->frames);
+    free(dec);
+}
+
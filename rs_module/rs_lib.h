@@ -0,0 +1,36 @@
+
+#ifndef RS_LIB_H
+#define RS_LIB_H
+
+
+/*
+ * Library interface to the rs41/rs92 modules, for decoding blocks of
+ * demodulated (FM audio) samples in-process, e.g. from Python via ctypes.
+ */
+
+#define RS_LIB_RS41  41
+#define RS_LIB_RS92  92
+
+typedef struct {
+    int    frame;
+    char   id[12];
+    int    year; int month; int day;
+    int    hr; int min; float sec;
+    double lat; double lon; double alt;
+    double vel_h; double heading; double vel_v;
+    int    freq;   // kHz (RS41 only, 0 if not known yet)
+    int    crc;    // block CRC error flags (as in rs_data_t)
+    int    ecc;    // bytes corrected by Reed-Solomon, or -1 if not correctable
+    int    valid;  // 1 if the ID, time and position blocks passed their CRC
+} rs_frame_t;
+
+typedef struct rs_decoder rs_decoder_t;
+
+rs_decoder_t *rs_decoder_new(int, int, int, int, char *);
+int rs_decoder_process(rs_decoder_t *, short *, int);
+int rs_decoder_read(rs_decoder_t *, rs_frame_t *, int);
+void rs_decoder_free(rs_decoder_t *);
+
+
+#endif  /* RS_LIB_H */
+
@@ -2,13 +2,23 @@
 /*
  *  detect/identify radiosondes
  *  DFM, RS92-SGP, RS41, M10, iMet-1-AB
+ *
+ *  gcc rs_detect.c ../demod/fsk_demod.c -I../demod -lm -o rs_detect
+ *
+ *  Each header match is printed as a JSON line (sonde type, '-' if inverted,
+ *  sample offset, header correlation score and timing confidence), then a
+ *  summary of the first match ("found: ...", "confidence: ..."), which is also
+ *  the return value. With -a, every match up to -t seconds is reported.
  */
 
 #include <stdio.h>
 #include <string.h>
 #include <stdlib.h>
+#include <math.h>
 #include <time.h>
 
+#include "fsk_demod.h"
+
 #ifdef CYGWIN
   #include <fcntl.h>  // cygwin: _setmode()
   #include <io.h>
@@ -17,6 +27,7 @@
 
 typedef unsigned char ui8_t;
 typedef unsigned int ui32_t;
+typedef unsigned long long ui64_t;
 
 time_t rawtime;
 struct tm *gmt;
@@ -24,7 +35,8 @@ struct tm *gmt;
 
 int wavloaded = 0,
     option_gmt = 0,
-    option_silent = 0;
+    option_silent = 0,
+    option_all = 0;
 
 
 #define  DFM   2
@@ -34,9 +46,6 @@ int wavloaded = 0,
 #define  iMet  6
 
 
-#define HEADLEN 32
-#define HEADOFS  0  // HEADLEN+HEADOFS=32
-
 //int  dfm_baudrate = 2500;
 char dfm_header[] = "01100101011001101010010110101010";
 
@@ -58,16 +67,6 @@ char imet_header[] = "11110000111100001111000011110000"
            "11110000""10101100110010101100101010101100";
 
 
-char buf25[HEADLEN+1] = "x";
-int bufpos25 = -1;
-
-char buf48[HEADLEN+1] = "x";
-int bufpos48 = -1;
-
-char buf96[HEADLEN+1] = "x";
-int bufpos96 = -1;
-
-
 /* -------------------------------------------------------------------------- */
 
 int sample_rate = 0, bits_sample = 0, channels = 0;
@@ -136,94 +135,247 @@ int read_wav_header(FILE *fp) {
 }
 
 
-#define EOF_INT  0x1000000
+/* -------------------------------------------------------------------------- */
+
+/*
+ * --s16 <sample_rate>: headerless signed 16 bit mono input (e.g. straight from rtl_fm) at any sample rate,
+ * instead of a WAV file. The highpass previously done by sox in the auto_rx pipeline is done here, and run
+ * lengths are measured between interpolated zero crossings (bit_slicer res), as there are fewer than
+ * 2 samples per bit at 9600 baud and rtl_fm sample rates.
+ */
+#define S16_HIGHPASS  20.0    // Hz, DC block
+
+int option_s16 = 0;
+float hp_r = 0, hp_x1 = 0, hp_y1 = 0;
 
-int read_signed_sample(FILE *fp) {  // int = i32_t
-    int byte, i, ret;         //  EOF -> 0x1000000
+int init_s16_input(int rate) {
+    if (rate <= 0) return -1;
 
-    for (i = 0; i < channels; i++) {
-                           // i = 0: links bzw. mono
-        byte = fgetc(fp);
-        if (byte == EOF) return EOF_INT;
-        if (i == 0) ret = byte;
-    
-        if (bits_sample == 16) {
-            byte = fgetc(fp);
-            if (byte == EOF) return EOF_INT;
-            if (i == 0) ret +=  byte << 8;
-        }
+    sample_rate = rate;
+    bits_sample = 16;
+    channels = 1;
 
-    }
+    hp_r = 1.0 - 2.0*M_PI*S16_HIGHPASS/sample_rate;
 
-    if (bits_sample ==  8) return ret-128;
-    if (bits_sample == 16) return (short)ret;
+    if (!option_silent) fprintf(stderr, "sample_rate: %d (s16)\n", sample_rate);
 
-    return ret;
+    return 0;
+}
+
+void filter_s16(short *samples, int count) {  // as reader.filter
+    int i;
+    float x, y;
+
+    for (i = 0; i < count; i++) {
+        x = samples[i];
+        y = x - hp_x1 + hp_r*hp_y1;
+        hp_x1 = x;
+        hp_y1 = y;
+        if (y >  32767) y =  32767;
+        if (y < -32768) y = -32768;
+        samples[i] = (int)(y < 0 ? y-0.5 : y+0.5);
+    }
 }
 
-int par=1, par_alt=1;
-unsigned long sample_count = 0;
 
-int read_bits_fsk(FILE *fp, int *bit, int *len) {
-    int n, sample;
+sample_reader_t reader;
+bit_slicer_t slicer;
+
+/* -------------------------------------------------------------------------- */
 
-    n = 0;
-    do{
-        sample = read_signed_sample(fp);
-        if (sample == EOF_INT) return EOF;
-        sample_count++;
-        par_alt = par;
-        par =  (sample >= 0) ? 1 : -1;  // 8bit: 0..127,128..255 (-128..-1,0..127)
-        n++;
-    } while (par*par_alt > 0);
+/*
+ * Timing confidence: for a FSK signal at a given baud rate, the time between zero crossings is a whole
+ * number of bits. The mean distance of each run of samples from a whole number of bits is ~0 for a clean
+ * signal, and 0.25 for noise, so 1-4*mean gives a score from 0 (noise) to 1.
+ */
+#define JITTER_AVG  0.02  // averages over the last ~50 runs
 
-    *len = n;
+void update_jitter(float *jitter, unsigned long *count, float len, float samples_per_bit) {
+    float bits = len / samples_per_bit;
+    int n = (int)(bits + 0.5);
+    float d = bits - n;
+    float avg;
 
-    *bit = (1+par_alt)/2;  // oben 1, unten -1
-    //*bit = (1-par_alt)/2;// sdr#<rev1381?, invers: unten 1, oben -1
+    if (n == 0) return;  // ignore glitches shorter than half a bit
 
-    return 0;
+    (*count)++;
+    avg = 1.0 / *count;
+    if (avg < JITTER_AVG) avg = JITTER_AVG;
+    *jitter += avg * (((d < 0) ? -d : d) - *jitter);
+}
+
+float confidence(float jitter) {
+    float c = 1.0 - 4.0*jitter;
+    if (c < 0) c = 0;
+    return c;
 }
 
 /* -------------------------------------------------------------------------- */
 
-char inv(char c) {
-    if (c == '0') return '1';
-    if (c == '1') return '0';
-    return c;
+/*
+ * Header correlator: the bits at each baud rate are shifted into a 64 bit register, and compared with the
+ * last 64 bits of the headers (all of it, if shorter) of all sonde types at that baud rate, and their
+ * inverses. Up to MAXERR() bit errors are accepted, and the score of a match is the fraction of the header
+ * bits which agree with the register. The 32 bit DFM and M10 headers must match exactly (score 1), as
+ * they are too short to tell apart from other signals with bit errors (e.g. the doubled bits of a 4800
+ * baud signal sliced at 9600 baud look much like the M10 header).
+ * Any match with a few bit errors has all KEYLEN bits of one of the header's KEYLEN bit chunks correct, so
+ * each chunk of the register is looked up in a hash table of the header chunks, and only the patterns found
+ * are compared in full. That is a few lookups per bit and baud rate, however many sonde types there are.
+ */
+#define KEYLEN     16
+#define KEYMASK    ((1<<KEYLEN)-1)
+#define MAXERR(nbits)  (((nbits)-32)/5)  // 64 bits: 6, 32 bits: 0
+#define HASH_BITS   6  // 64 entries per baud rate
+#define HASH_SIZE  (1<<HASH_BITS)
+
+typedef struct {
+    char *name;
+    int type;
+    int baud;
+    char *header;
+} sonde_t;
+
+sonde_t sondes[] = {
+    { "DFM",  DFM,  2500, dfm_header },
+    { "RS41", RS41, 4800, rs41_header },
+    { "RS92", RS92, 4800, rs92_header },
+    { "M10",  M10,  9600, m10_header },
+    { "iMet", iMet, 9600, imet_header }
+};
+#define NUM_SONDES  (sizeof(sondes)/sizeof(sondes[0]))
+
+typedef struct {
+    ui64_t bits;   // last nbits header bits, last bit in bit 0
+    int nbits;     // <= 64, multiple of KEYLEN
+    int maxerr;
+    int sonde;     // sondes[]
+    int inv;
+} pattern_t;
+
+typedef struct {
+    ui32_t key;    // header chunk, bits[chunk*KEYLEN..(chunk+1)*KEYLEN-1]
+    int chunk;
+    pattern_t *pattern;
+} entry_t;
+
+typedef struct {
+    int baud;
+    ui64_t reg;           // last bits, last bit in bit 0
+    unsigned long count;  // bits
+    float jitter;         // timing, see update_jitter()
+    unsigned long runs;
+    int chunks;           // longest pattern, in chunks
+    int entries;
+    int used[HASH_SIZE];
+    entry_t table[HASH_SIZE];
+} rate_t;
+
+rate_t rates[] = { { 2500 }, { 4800 }, { 9600 } };
+#define NUM_RATES  (sizeof(rates)/sizeof(rates[0]))
+
+pattern_t patterns[2*NUM_SONDES];
+
+int hash(ui32_t key, int chunk) {
+    return (ui32_t)((key | (chunk << KEYLEN)) * 2654435761u) >> (32-HASH_BITS);
+}
+
+int popcount64(ui64_t x) {
+    x = x - ((x >> 1) & 0x5555555555555555ULL);
+    x = (x & 0x3333333333333333ULL) + ((x >> 2) & 0x3333333333333333ULL);
+    x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0FULL;
+    return (x * 0x0101010101010101ULL) >> 56;
 }
 
+int add_pattern(rate_t *rate, pattern_t *p) {
+    int c, h;
 
-void inc_buf(int *bufpos) {
-  *bufpos = (*bufpos+1) % HEADLEN;
+    for (c = 0; c < p->nbits/KEYLEN; c++) {
+        if (rate->entries >= HASH_SIZE/2) return -1;  // keep lookups short
+
+        h = hash((p->bits >> (c*KEYLEN)) & KEYMASK, c);
+        while (rate->used[h]) h = (h+1) % HASH_SIZE;
+
+        rate->table[h].key = (p->bits >> (c*KEYLEN)) & KEYMASK;
+        rate->table[h].chunk = c;
+        rate->table[h].pattern = p;
+        rate->used[h] = 1;
+        rate->entries++;
+    }
+    if (c > rate->chunks) rate->chunks = c;
+
+    return 0;
+}
+
+int bit_errors(rate_t *rate, pattern_t *p) {
+    ui64_t mask = (p->nbits < 64) ? ((1ULL << p->nbits) - 1) : ~0ULL;
+    return popcount64((rate->reg ^ p->bits) & mask);
 }
 
-int compare(char buf[], char header[], int bufpos) {
-    int i, j;
-    
-    i = 0;
-    j = bufpos;
-    while (i < HEADLEN) {
-        if (j < 0) j = HEADLEN-1;
-        if (buf[j] != header[HEADOFS+HEADLEN-1-i]) break;
-        j--;
-        i++;
+// a pattern ending at the last bit of the register, with at most maxerr bit errors
+pattern_t *find_pattern(rate_t *rate) {
+    int c, h;
+    ui32_t key;
+    pattern_t *p;
+
+    for (c = 0; c < rate->chunks && (c+1)*KEYLEN <= rate->count; c++) {
+        key = (rate->reg >> (c*KEYLEN)) & KEYMASK;
+        h = hash(key, c);
+        while (rate->used[h]) {
+            if (rate->table[h].key == key && rate->table[h].chunk == c) {
+                p = rate->table[h].pattern;
+                if (rate->count >= p->nbits && bit_errors(rate, p) <= p->maxerr) return p;
+            }
+            h = (h+1) % HASH_SIZE;
+        }
     }
-    if (i == HEADLEN) return 1;
-
-    i = 0;
-    j = bufpos;
-    while (i < HEADLEN) {
-        if (j < 0) j = HEADLEN-1;
-        if (buf[j] != inv(header[HEADOFS+HEADLEN-1-i])) break;
-        j--;
-        i++;
+    return NULL;
+}
+
+int init_patterns() {
+    int s, r, i, inv, len;
+    sonde_t *sonde;
+    pattern_t *p;
+
+    for (r = 0; r < NUM_RATES; r++) rates[r].jitter = 0.25;
+
+    for (s = 0; s < NUM_SONDES; s++) {
+        sonde = &sondes[s];
+        for (r = 0; r < NUM_RATES; r++) {
+            if (rates[r].baud == sonde->baud) break;
+        }
+        if (r == NUM_RATES) return -1;
+
+        len = strlen(sonde->header);
+        if (len < 2*KEYLEN) return -1;
+
+        for (inv = 0; inv < 2; inv++) {
+            p = &patterns[2*s+inv];
+            p->sonde = s;
+            p->inv = inv;
+            p->nbits = ((len < 64) ? len : 64) / KEYLEN * KEYLEN;
+            p->maxerr = MAXERR(p->nbits);
+            p->bits = 0;
+            for (i = len-p->nbits; i < len; i++) {
+                p->bits = (p->bits << 1) | ((sonde->header[i] & 1) ^ inv);
+            }
+            if (add_pattern(&rates[r], p)) return -1;
+        }
     }
-    if (i == HEADLEN) return -1;
 
     return 0;
 }
 
+pattern_t *shift_bit(rate_t *rate, int bit) {
+    rate->reg = (rate->reg << 1) | bit;
+    rate->count++;
+    return find_pattern(rate);
+}
+
+float score(rate_t *rate, pattern_t *p) {
+    return 1.0 - bit_errors(rate, p) / (float)p->nbits;
+}
+
 
 /* -------------------------------------------------------------------------- */
 
@@ -232,8 +384,11 @@ int main(int argc, char **argv) {
 
     FILE *fp;
     char *fpname;
-    int header_found, bit, len, i;
-    int len25, len48, len96;
+    int header_found, found, bit, i, n, r;
+    rate_t *rate;
+    pattern_t *p;
+    float len, found_confidence = 0;
+    double pos;
     int zeit = 0;
 
 #ifdef CYGWIN
@@ -245,7 +400,9 @@ int main(int argc, char **argv) {
     ++argv;
     while ((*argv) && (!wavloaded)) {
         if      ( (strcmp(*argv, "-h") == 0) || (strcmp(*argv, "--help") == 0) ) {
-            fprintf(stderr, "%s [-t nn] audio.wav\n", fpname);
+            fprintf(stderr, "%s [-t nn] [-a] audio.wav\n", fpname);
+            fprintf(stderr, "%s [-t nn] [-a] --s16 <sample_rate> < audio.raw\n", fpname);
+            fprintf(stderr, "  -a, --all   report every header match, not only the first\n");
             return 0;
         }
         else if ( (strcmp(*argv, "-s") == 0) || (strcmp(*argv, "--silent") == 0) ) {
@@ -254,11 +411,19 @@ int main(int argc, char **argv) {
         else if ( (strcmp(*argv, "-z") == 0) || (strcmp(*argv, "--zulu") == 0) ) {
             option_gmt = 1;
         }
+        else if ( (strcmp(*argv, "-a") == 0) || (strcmp(*argv, "--all") == 0) ) {
+            option_all = 1;
+        }
         else if ( (strcmp(*argv, "-t") == 0) || (strcmp(*argv, "--time") == 0) ) {
             ++argv;
             if (*argv) zeit = atoi(*argv);
             else return -1;
         }
+        else if   (strcmp(*argv, "--s16") == 0) {
+            ++argv;
+            if (*argv) option_s16 = atoi(*argv);
+            else return -1;
+        }
         else {
             fp = fopen(*argv, "rb");
             if (fp == NULL) {
@@ -272,54 +437,57 @@ int main(int argc, char **argv) {
     if (!wavloaded) fp = stdin;
 
 
-    i = read_wav_header(fp);
+    if (option_s16) i = init_s16_input(option_s16);
+    else            i = read_wav_header(fp);
+    if (i == 0) i = init_patterns();
+    if (i == 0) i = sample_reader_init(&reader, fp, bits_sample, channels);
     if (i) {
         fclose(fp);
         return -1;
     }
+    if (option_s16) reader.filter = filter_s16;
+    bit_slicer_init(&slicer, option_s16 != 0);
 
     header_found = 0;
 
-    while (!read_bits_fsk(fp, &bit, &len) && !header_found) {
-
-        len25 = (int) (len * 2500.0 / sample_rate + 0.5);
-        len48 = (int) (len * 4800.0 / sample_rate + 0.5);
-        len96 = (int) (len * 9600.0 / sample_rate + 0.5);
-
-        for (i = 0; i < len25; i++) {
-            inc_buf(&bufpos25);
-            buf25[bufpos25] = 0x30 + bit;  // Ascii
-            header_found = compare(buf25, dfm_header, bufpos25) * DFM;
-            if (header_found) goto ende;
-        }
-
-        for (i = 0; i < len48; i++) {
-            inc_buf(&bufpos48);
-            buf48[bufpos48] = 0x30 + bit;  // Ascii
-            header_found = compare(buf48, rs41_header+16, bufpos48) * RS41;
-            if (header_found) goto ende;
-            header_found = compare(buf48, rs92_header, bufpos48) * RS92;
-            if (header_found) goto ende;
-        }
-
-        for (i = 0; i < len96; i++) {
-            inc_buf(&bufpos96);
-            buf96[bufpos96] = 0x30 + bit;  // Ascii
-            header_found = compare(buf96, m10_header, bufpos96) * M10;
-            if (header_found) goto ende;
-            header_found = compare(buf96, imet_header+32, bufpos96) * iMet;
-            if (header_found) goto ende;
+    while (!bit_slicer_read(&slicer, &reader, &bit, &len)) {
+
+        for (r = 0; r < NUM_RATES; r++) {
+            rate = &rates[r];
+            n = (int) (len * (double)rate->baud / sample_rate + 0.5);
+            update_jitter(&rate->jitter, &rate->runs, len, sample_rate / (double)rate->baud);
+
+            for (i = 0; i < n; i++) {
+                p = shift_bit(rate, bit);
+                if (p == NULL) continue;
+
+                found = p->inv ? -sondes[p->sonde].type : sondes[p->sonde].type;
+                if (!header_found) {
+                    header_found = found;
+                    found_confidence = confidence(rate->jitter);
+                }
+                if (!option_silent) {
+                    // end of the header, in the current run of len samples
+                    pos = sample_reader_count(&reader) - len + (i+1)*len/n;
+                    printf("{ \"type\": \"%s%s\", \"baud\": %d, \"sample\": %.0f, \"time\": %.3f, \"score\": %.2f, \"confidence\": %.2f }\n",
+                           p->inv ? "-" : "", sondes[p->sonde].name, rate->baud, pos, pos/sample_rate,
+                           score(rate, p), confidence(rate->jitter));
+                    fflush(stdout);
+                }
+                if (!option_all) goto ende;
+            }
         }
 
-        if (zeit > 0  &&  sample_count > zeit*sample_rate) goto ende;
+        if (zeit > 0  &&  sample_reader_count(&reader) > zeit*sample_rate) goto ende;
 
     }
 
 ende:
+    sample_reader_free(&reader);
     fclose(fp);
 
     if (!option_silent) {
-        printf("sample: %lu\n", sample_count);
+        printf("sample: %lu\n", sample_reader_count(&reader));
         if (zeit) printf("%ds = %d samples\n", zeit, zeit*sample_rate);
         printf("found: ");
         if (!header_found) printf("NO");
@@ -338,6 +506,8 @@ ende:
             }
         }
         printf("\n");
+        if (header_found) printf("confidence: %.2f\n", found_confidence);
+        fflush(stdout);
     }
 
     return header_found;